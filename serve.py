@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Yak Similarity Analyzer - 生产环境多进程服务
+主进程先fork出处理请求的web进程（不加载模型，启动即可响应 /livez），再加载并预热一次YOLO模型，
+之后fork出执行任务的worker进程，模型权重在worker之间写时复制共享，不会每个进程各占一份内存
+（YOLO_BACKEND=onnxruntime/openvino时主进程只导出ONNX，推理会话在各worker里创建）
+worker就绪前 /readyz 返回503，代理据此等预热完成再转发
+
+信号（发给主进程）:
+  HUP       重新加载授权和模型，启动新一批子进程后平滑停掉旧的
+  TERM/INT  平滑退出：web进程处理完当前请求、worker执行完当前任务（最多等 SERVE_GRACEFUL_TIMEOUT 秒）
+
+只支持Linux/macOS（需要fork）；Windows上用 run.py
+"""
+
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加src目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.insert(0, src_dir)
+
+# 多进程之间的任务状态要共享，必须用持久化队列
+os.environ.setdefault('JOB_BACKEND', 'queue')
+
+HOST = os.environ.get('SERVE_HOST', '0.0.0.0')
+PORT = int(os.environ.get('SERVE_PORT', 5000))
+WEB_WORKERS = int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 2))  # 处理HTTP请求的进程数
+WEB_THREADS = int(os.environ.get('SERVE_THREADS', 16))  # 每个web进程的线程数（每个SSE连接占一个）
+JOB_WORKERS = int(os.environ.get('SERVE_JOB_WORKERS', os.environ.get('MAX_CONCURRENT_JOBS', 2)))  # 执行任务的进程数
+GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))  # 平滑退出最多等多久（秒）
+
+# 每个任务进程各自推理，ONNX后端的推理线程数按任务进程数平分CPU，避免互相抢核
+os.environ.setdefault('YOLO_INTRA_OP_THREADS', str(max(1, (os.cpu_count() or 1) // max(1, JOB_WORKERS))))
+
+logger = logging.getLogger('serve')
+
+
+def _make_server(app, listen_fd, threads):
+    """线程数有上限的WSGI服务器，监听主进程创建的socket"""
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        def __init__(self):
+            super().__init__(HOST, PORT, app, fd=listen_fd)
+            self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+            self.active = 0
+            self.idle = threading.Condition()
+
+        def process_request(self, request, client_address):
+            with self.idle:
+                self.active += 1
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self.idle:
+                    self.active -= 1
+                    self.idle.notify_all()
+
+        def drain(self, timeout):
+            """等正在处理的请求结束；SSE长连接等不完就到时间直接退出"""
+            with self.idle:
+                return self.idle.wait_for(lambda: self.active == 0, timeout)
+
+    return PooledWSGIServer()
+
+
+def run_web(app_module, listen_fd):
+    server = _make_server(app_module.app, listen_fd, WEB_THREADS)
+
+    def stop(signum, frame):
+        # shutdown会等serve_forever返回，不能在运行serve_forever的主线程里直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(f"web进程 {os.getpid()} 开始处理请求（{WEB_THREADS} 个线程）")
+    server.serve_forever()
+    if not server.drain(GRACEFUL_TIMEOUT):
+        logger.warning(f"web进程 {os.getpid()} 还有 {server.active} 个连接未结束，强制退出")
+
+
+def run_job_worker(app_module):
+    import worker
+
+    if not app_module.model_ready():
+        # ONNX Runtime/OpenVINO的线程池在fork后不可用，推理会话在worker里创建
+        app_module.init_system(load_model=True, wait=True)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    worker.work(app_module, f"{socket.gethostname()}:{os.getpid()}", stop)
+
+
+class Master:
+    """管理子进程：异常退出的补上，HUP时整批替换"""
+
+    def __init__(self, app_module, listen_sock):
+        self.app = app_module
+        self.sock = listen_sock
+        self.children = {}  # pid -> (种类, 代数)
+        self.generation = 0
+        self.reload_requested = False
+        self.stopping = False
+        self.model_loaded = False  # 模型加载前只启动web进程
+
+    def spawn(self, kind):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (kind, self.generation)
+            return
+        # 子进程
+        code = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            if kind == 'web':
+                run_web(self.app, self.sock.fileno())
+            else:
+                self.sock.close()
+                run_job_worker(self.app)
+        except Exception:
+            logger.exception(f"{kind} 子进程异常退出")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def spawn_missing(self):
+        current = [kind for kind, generation in self.children.values() if generation == self.generation]
+        for kind, wanted in (('web', WEB_WORKERS), ('job', JOB_WORKERS if self.model_loaded else 0)):
+            for _ in range(wanted - current.count(kind)):
+                self.spawn(kind)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            kind, generation = self.children.pop(pid, ('?', None))
+            if not self.stopping and generation == self.generation:
+                logger.warning(f"{kind} 子进程 {pid} 退出（状态 {status}），重新启动")
+
+    def signal_children(self, sig, generation=None):
+        for pid, (_, child_generation) in list(self.children.items()):
+            if generation is None or child_generation == generation:
+                try:
+                    os.kill(pid, sig)
+                except OSError as e:
+                    if e.errno != errno.ESRCH:
+                        raise
+
+    def load_model(self):
+        """torch模型在主进程加载，worker写时复制共享；ONNX后端主进程只负责导出，
+        推理会话由各worker fork后自己创建（模型很小，不必共享）"""
+        if self.app.group3.YOLO_BACKEND == 'torch':
+            self.app.init_system(load_model=True, wait=True)
+        else:
+            self.app.init_system(load_model=False)
+            self.app.group3.prepare_model()
+        self.model_loaded = True
+
+    def reload(self):
+        """重新加载授权和模型，新一批子进程起来后再让旧的平滑退出"""
+        self.reload_requested = False
+        logger.info("收到HUP，重新加载授权和模型")
+        self.app.license_manager = self.app.LicenseManager()
+        self.load_model()
+        old_generation = self.generation
+        self.generation += 1
+        self.spawn_missing()
+        self.signal_children(signal.SIGTERM, old_generation)
+
+    def stop(self):
+        self.stopping = True
+        self.signal_children(signal.SIGTERM)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.children:
+            logger.warning(f"{len(self.children)} 个子进程未按时退出，强制结束（执行中的任务稍后由worker重新执行）")
+            self.signal_children(signal.SIGKILL)
+            while self.children:
+                self.reap()
+                time.sleep(0.1)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, 'reload_requested', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, 'stopping', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, 'stopping', True))
+
+        self.spawn_missing()
+        logger.info(f"服务已启动 http://{HOST}:{PORT}，{WEB_WORKERS} 个web进程，加载模型后启动 {JOB_WORKERS} 个任务进程")
+        # web进程已经在接收请求，这里再加载预热模型；worker从加载好模型的主进程fork，共享权重
+        self.load_model()
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload()
+            self.reap()
+            self.spawn_missing()
+            time.sleep(1)
+        logger.info("正在停止服务")
+        self.stop()
+
+
+def main():
+    if not hasattr(os, 'fork'):
+        print("serve.py 需要fork，Windows上请使用 run.py")
+        sys.exit(1)
+
+    import app
+
+    if app.job_queue is None:
+        print("serve.py 需要 JOB_BACKEND=queue（多进程之间通过持久化队列共享任务）")
+        sys.exit(1)
+
+    # 先只检查授权，web进程不需要模型；模型在web进程启动后由主进程加载（Master.run）
+    app.init_system(load_model=False)
+
+    listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_sock.bind((HOST, PORT))
+    listen_sock.listen(128)
+    listen_sock.set_inheritable(True)
+
+    Master(app, listen_sock).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,15 @@ import json
 import tempfile
 import shutil
 import threading
-import uuid
+import queue
 import time
+from contextlib import nullcontext
 from datetime import datetime
-from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_file
+from urllib.parse import quote
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory, stream_with_context
 from werkzeug.utils import secure_filename
 import zipfile
+import mimetypes
 import logging
 
 # 设置日志
@@ -31,11 +33,27 @@ group3.YOLO_MODEL_PATH = r"..\models\best.pt"
 from group3 import (
     load_yolo_model, 
     classify_images_with_yolo,
-    extract_zip_files,
-    calculate_image_hash,
+    extract_archives,
+    list_zip_files,
+    ExactDuplicateIndex,
+    group_exact_duplicates,
+    expand_exact_duplicates,
+    calculate_image_hashes,
     extract_business_id
 )
 
+from hash_index import find_cross_case_pairs, hash_to_int
+from hash_corpus import HashCorpus
+from clustering import cluster_pairs
+from pipeline import ImagePipeline
+from chunked_upload import ChunkedUploadStore, ChunkError, UploadTooLarge
+from jobs import JobManager, STATUS_FILE
+from progress import StageProgress, status_events
+from zip_stream import ZipStream
+from zip_source import close_archives
+from result_store import ResultWriter, load_manifest, find_ref, read_ref, download_entries
+from job_queue import JobQueue, DurableArchiveQueue, UPLOAD_ABORTED
+
 # 导入授权管理器
 from license_manager_simple import LicenseManager
 
@@ -44,10 +62,23 @@ app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['RESULTS_FOLDER'] = 'results'
 
+GROUPS_MANIFEST = 'groups.json'  # 结果目录中的组清单
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # 分块上传的块大小
+UPLOAD_IDLE_TIMEOUT = int(os.environ.get('UPLOAD_IDLE_TIMEOUT', 1800))  # 分块上传时等待下一个ZIP的最长秒数
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', 2))  # 同时处理的任务数，多出的排队（共用同一个模型）
+KEEP_JOBS = int(os.environ.get('KEEP_JOBS', 20))  # 保留最近多少个已结束任务的上传和结果目录
+JOB_BACKEND = os.environ.get('JOB_BACKEND', 'thread')  # thread: web进程内线程执行 / queue: 持久化队列 + 独立worker进程（worker.py）
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', './data/job_queue.db')  # 持久化任务队列路径
+JOB_HEARTBEAT_INTERVAL = 10  # worker更新任务心跳的间隔（秒）
+JOB_HEARTBEAT_TIMEOUT = int(os.environ.get('JOB_HEARTBEAT_TIMEOUT', 120))  # 心跳超时多久视为worker已死、任务重新排队
+SSE_MIN_INTERVAL = float(os.environ.get('SSE_MIN_INTERVAL', 0.5))  # 进度推送的最小间隔（秒）
+RESULT_MATERIALIZE = os.environ.get('RESULT_MATERIALIZE', 'link')  # 结果图片落地方式: copy / link / blobs / manifest（见result_store）
+SSE_KEEPALIVE = 15  # 没有进度变化时多久发一次保活注释，防止代理断开空闲连接
+
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
 
-# Linus风格：简洁的全局状态管理
+# Linus风格：简洁的全局状态管理（系统级状态；每个任务的进度在job.status里）
 processing_status = {
     'is_processing': False,
     'current_step': '',
@@ -58,33 +89,82 @@ processing_status = {
     'error': None,
     'session_id': '',
     'start_time': '',
-    'authorization_status': 'checking'
+    'authorization_status': 'checking',
+    'model_status': 'not_loaded'  # not_loaded / loading / ready / failed / external（queue模式下由worker进程加载）
 }
 
 # 全局实例
 yolo_model = None
+model_loaded = threading.Event()  # 模型加载结束（无论成败）
 license_manager = LicenseManager()
+job_manager = JobManager(app.config['UPLOAD_FOLDER'], app.config['RESULTS_FOLDER'],
+                         max_concurrent=MAX_CONCURRENT_JOBS, keep_jobs=KEEP_JOBS,
+                         external_workers=JOB_BACKEND == 'queue')
+job_queue = JobQueue(JOB_QUEUE_PATH) if JOB_BACKEND == 'queue' else None
+upload_lock = threading.Lock()
 
-def init_system():
-    """系统初始化 - 模型加载 + 授权检查"""
-    global yolo_model
+def init_system(load_model=None, wait=False):
+    """系统初始化 - 授权检查 + 模型加载预热
     
+    load_model: 是否加载模型；默认queue模式下web进程不加载（由worker.py加载）
+    wait: 是否等模型加载预热完成再返回；默认在后台线程加载，服务先启动，/readyz 在预热完成后才返回200
+    """
     # 检查授权状态
     auth_ok, auth_msg = license_manager.check_authorization()
     processing_status['authorization_status'] = 'authorized' if auth_ok else 'unauthorized'
     
     if not auth_ok:
         processing_status['error'] = f"授权检查失败: {auth_msg}"
+        model_loaded.set()  # 不再加载，别让等待模型的任务一直等
         logger.error(f"授权检查失败: {auth_msg}")
         return
     
-    # 加载YOLO模型
-    yolo_model = load_yolo_model()
-    if yolo_model is None:
-        processing_status['error'] = "YOLO模型加载失败"
-        logger.error("YOLO模型加载失败")
+    if load_model is None:
+        load_model = JOB_BACKEND != 'queue'
+    if not load_model:
+        processing_status['model_status'] = 'external'
+        logger.info("系统初始化完成：授权正常，任务由worker进程处理")
+        return
+    
+    if wait:
+        _load_model()
     else:
-        logger.info("系统初始化完成：授权正常，模型已加载")
+        threading.Thread(target=_load_model, name='model-loader', daemon=True).start()
+
+def _load_model():
+    """加载YOLO模型并用空白图片推理一次（第一次推理要初始化推理引擎，不让第一个任务等）"""
+    global yolo_model
+    model_loaded.clear()
+    processing_status['model_status'] = 'loading'
+    started = time.monotonic()
+    try:
+        model = load_yolo_model()
+        if model is None:
+            raise Exception("YOLO模型加载失败")
+        group3.warm_up_model(model)
+    except Exception as e:
+        processing_status['model_status'] = 'failed'
+        processing_status['error'] = f"模型加载失败: {str(e)}"
+        logger.error(f"模型加载失败: {str(e)}")
+    else:
+        yolo_model = model
+        processing_status['model_status'] = 'ready'
+        processing_status['model_warmup_seconds'] = round(time.monotonic() - started, 2)
+        logger.info(f"系统初始化完成：授权正常，模型已加载预热（{processing_status['model_warmup_seconds']} 秒）")
+    finally:
+        model_loaded.set()
+
+def model_ready():
+    return processing_status['model_status'] == 'ready'
+
+def wait_for_model(job):
+    """任务在模型预热完成前到达时先等着；加载失败则任务失败"""
+    if not model_loaded.is_set():
+        job.status['current_step'] = '等待模型加载'
+        job.save(force=True)
+        model_loaded.wait()
+    if not model_ready():
+        raise Exception(processing_status['error'] or "模型未加载")
 
 @app.route('/')
 def index():
@@ -92,9 +172,6 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_files():
-    if processing_status['is_processing']:
-        return jsonify({'error': '正在处理中，请稍后再试'}), 400
-    
     if 'files' not in request.files:
         return jsonify({'error': '没有上传文件'}), 400
     
@@ -102,103 +179,326 @@ def upload_files():
     if not files or files[0].filename == '':
         return jsonify({'error': '没有选择文件'}), 400
     
-    # 清理旧文件
-    for f in os.listdir(app.config['UPLOAD_FOLDER']):
-        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], f))
-    
+    # 每次上传一个任务，文件放在任务自己的目录里，不影响其他用户
+    job = job_manager.create()
     uploaded_files = []
     for file in files:
         if file and file.filename.endswith('.zip'):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = os.path.join(job.upload_dir, filename)
             file.save(filepath)
             uploaded_files.append(filename)
     
     if not uploaded_files:
+        job.status.update({'state': 'failed', 'is_processing': False, 'error': '请上传ZIP文件'})
+        job.save(force=True)
         return jsonify({'error': '请上传ZIP文件'}), 400
     
     # 启动后台处理
-    thread = threading.Thread(target=process_images)
-    thread.start()
+    submit_job(job)
     
     return jsonify({
         'message': '文件上传成功，开始处理',
+        'job_id': job.job_id,
         'files': uploaded_files
     })
 
-def process_images():
-    global processing_status
-    
-    # 生成会话ID和记录开始时间
-    session_id = str(uuid.uuid4())
-    start_time = datetime.now().isoformat()
-    
-    processing_status = {
-        'is_processing': True,
-        'current_step': '提取图片',
-        'progress': 10,
-        'total_images': 0,
-        'class2_images': 0,
-        'groups_found': 0,
-        'error': None,
-        'session_id': session_id,
-        'start_time': start_time
-    }
+def submit_job(job, archive_queue=None):
+    """提交任务：thread模式在本进程后台线程执行，queue模式写入持久化队列由worker领取"""
+    if job_queue is not None:
+        job_queue.enqueue(job.job_id, chunked=archive_queue is not None)
+    else:
+        job_manager.start(job, process_images, archive_queue)
+
+def refresh_status(job):
+    """任务状态；queue模式下以队列中的状态为准（worker异常退出时状态文件可能没来得及更新）
+    
+    is_processing由state决定：处理函数退出后、最终状态记录之前，不会出现“已结束但state仍为running”
+    """
+    status = dict(job.status)
+    if job_queue is not None:
+        queued = job_queue.get(job.job_id)
+        if queued is not None:
+            status['state'] = queued['state']
+            if queued['state'] == 'failed' and not status.get('error'):
+                status['error'] = queued['error']
+    status['is_processing'] = status.get('state') in ('queued', 'running')
+    return status
+
+def _attach_upload(job):
+    """queue模式下从磁盘和队列接上分块上传任务：web进程重启过，或者任务是serve.py的另一个进程创建的
+    
+    上传是否已结束、登记了哪些文件都以队列和磁盘为准，每次请求重新读取
+    """
+    queued = job_queue.get(job.job_id)
+    if queued is None or not queued['chunked'] or queued['input_closed'] or queued['state'] not in ('queued', 'running'):
+        job.upload_finished = True
+        return
+    if job.archive_queue is None:
+        job.upload_store = _upload_store(job)
+        job.archive_queue = DurableArchiveQueue(job_queue, job.job_id)
+    job.upload_files = {meta['file_id'] for meta in job.upload_store.uploads()}
+
+def _upload_job(job_id):
+    """仍在接收文件的分块上传任务；处理线程已出错退出的任务不再接收"""
+    job = job_manager.get(job_id)
+    if job is not None and job_queue is not None and not job.upload_finished:
+        _attach_upload(job)
+    if job is None or job.archive_queue is None or job.upload_finished or not refresh_status(job)['is_processing']:
+        return None
+    return job
+
+def _upload_store(job):
+    """分块上传的整批大小上限与普通上传的请求大小上限相同"""
+    return ChunkedUploadStore(os.path.join(job.upload_dir, '.chunks'), UPLOAD_CHUNK_SIZE,
+                              max_size=app.config['MAX_CONTENT_LENGTH'])
+
+def _upload_state(meta):
+    """返回给客户端的上传状态（不暴露服务器路径）"""
+    return {k: v for k, v in meta.items() if k != 'dest_path'}
+
+@app.route('/uploads', methods=['POST'])
+def create_upload_batch():
+    """开始分块上传批次（即新任务），处理线程随即启动并等待ZIP"""
+    job = job_manager.create()
+    job.upload_store = _upload_store(job)
+    job.archive_queue = DurableArchiveQueue(job_queue, job.job_id) if job_queue is not None else queue.Queue()
+    submit_job(job, job.archive_queue)
+    return jsonify({'batch_id': job.job_id, 'job_id': job.job_id, 'chunk_size': UPLOAD_CHUNK_SIZE})
+
+@app.route('/uploads/<batch_id>/files', methods=['POST'])
+def register_upload_file(batch_id):
+    """登记一个ZIP（filename, size, 可选sha256）；重复登记返回已收到的块，用于断点续传"""
+    job = _upload_job(batch_id)
+    if job is None:
+        return jsonify({'error': '上传批次不存在或已结束'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename', ''))
+    size = data.get('size')
+    if not filename.lower().endswith('.zip') or not isinstance(size, int) or size <= 0:
+        return jsonify({'error': '请上传ZIP文件'}), 400
     
+    # 每个文件单独一个目录：同名的不同ZIP不会互相覆盖，ZIP文件名（含案件号）保持不变
+    file_id = ChunkedUploadStore.file_id(batch_id, filename, size)
+    dest_path = os.path.join(job.upload_dir, file_id, filename)
     try:
-        # 清理结果目录
-        results_dir = app.config['RESULTS_FOLDER']
-        if os.path.exists(results_dir):
-            shutil.rmtree(results_dir)
-        os.makedirs(results_dir)
+        meta = job.upload_store.register(batch_id, filename, size, dest_path, data.get('sha256'))
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    with upload_lock:
+        if meta['file_id'] not in job.upload_files:
+            job.upload_files.add(meta['file_id'])
+            job.status['archives_expected'] = len(job.upload_files)
+            if job_queue is not None:
+                job_queue.set_expected(job.job_id, len(job.upload_files))
+    return jsonify(_upload_state(meta))
+
+@app.route('/uploads/<batch_id>/files/<file_id>', methods=['GET'])
+def get_upload_file(batch_id, file_id):
+    """上传进度：客户端断线重连后据此只补传缺失的块"""
+    job = _upload_job(batch_id)
+    meta = job.upload_store.load(file_id) if job else None
+    if meta is None:
+        return jsonify({'error': '上传文件不存在'}), 404
+    return jsonify(_upload_state(meta))
+
+@app.route('/uploads/<batch_id>/files/<file_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(batch_id, file_id, index):
+    """上传一块，请求体为原始字节，X-Chunk-SHA256 头为该块的SHA-256（可选）"""
+    job = _upload_job(batch_id)
+    if job is None:
+        return jsonify({'error': '上传批次不存在或已结束'}), 404
+    
+    try:
+        meta, completed_path = job.upload_store.write_chunk(file_id, index, request.get_data(),
+                                                            request.headers.get('X-Chunk-SHA256'))
+    except KeyError:
+        return jsonify({'error': '上传文件不存在'}), 404
+    except ChunkError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if completed_path:
+        # ZIP收齐，立即排入处理队列
+        job.archive_queue.put([(completed_path, os.path.basename(completed_path))])
+    return jsonify({'received': len(meta['received']), 'total_chunks': meta['total_chunks'],
+                    'complete': meta['complete']})
+
+@app.route('/uploads/<batch_id>/finish', methods=['POST'])
+def finish_upload_batch(batch_id):
+    """批次内所有ZIP上传完毕：处理完已排队的ZIP后开始相似度分组"""
+    with upload_lock:
+        job = _upload_job(batch_id)
+        if job is None:
+            return jsonify({'error': '上传批次不存在或已结束'}), 404
+        incomplete = [meta['filename'] for meta in map(job.upload_store.load, job.upload_files) if not meta['complete']]
+        if incomplete:
+            return jsonify({'error': '还有文件未上传完成', 'files': incomplete}), 400
+        job.upload_finished = True
+        job.archive_queue.put(None)
+    return jsonify({'message': '上传完成，继续处理', 'job_id': job.job_id, 'session_id': job.status['session_id']})
+
+@app.route('/uploads/<batch_id>/abort', methods=['POST'])
+def abort_upload_batch(batch_id):
+    """放弃上传批次：处理线程（或worker）不再等待后续ZIP，任务标记为失败"""
+    with upload_lock:
+        job = _upload_job(batch_id)
+        if job is None:
+            return jsonify({'error': '上传批次不存在或已结束'}), 404
+        job.upload_finished = True
+        job.archive_queue.put(UPLOAD_ABORTED)
+    if job_queue is not None and job_queue.get(job.job_id)['state'] == 'failed':
+        # 还没有worker领取就直接失败了，不会再有人更新状态文件
+        job.status.update({'state': 'failed', 'is_processing': False, 'error': '上传已取消'})
+        job.save(force=True)
+    return jsonify({'message': '上传已取消', 'job_id': job.job_id})
+
+def _classify_batch(job, image_infos, progress_start, progress_end, exact_index):
+    """一批ZIP的图片：完全相同的只处理一份 -> YOLO分类（流水线模式下同时算哈希）-> 结果扇出到副本
+    
+    exact_index: 任务级的完全相同图片索引，与之前批次的图片相同时直接沿用之前的结果
+    分类进度映射到总进度的 [progress_start, progress_end]；返回 (class2图片, 对应哈希值或None)
+    """
+    status = job.status
+    wait_for_model(job)
+    representatives, duplicate_copies, exact_sets = group_exact_duplicates(image_infos, exact_index)
+    status['exact_duplicates'] = status.get('exact_duplicates', 0) + len(image_infos) - len(representatives)
+    status['exact_cross_case_sets'] = status.get('exact_cross_case_sets', 0) + len(exact_sets)
+    
+    hash_values = None
+    class2_before = status['class2_images']
+    if group3.PIPELINE_ENABLED:
+        meter = StageProgress(job, 'classify', len(representatives), progress_start, progress_end,
+                              'YOLO模型分类并计算哈希值')
         
-        # 提取ZIP文件（确保保留source_zip信息）
-        processing_status['current_step'] = '提取ZIP文件中的图片'
-        image_infos, temp_dirs = extract_zip_files(app.config['UPLOAD_FOLDER'])
+        def on_pipeline_progress(metrics):
+            status['pipeline'] = metrics
+            status['class2_images'] = class2_before + metrics['class2']
+            meter.update(metrics['classified'])
         
-        # 确保每个image_info包含source_zip信息
-        for info in image_infos:
-            if 'source_zip' not in info:
-                # 从路径推断source_zip
-                info['source_zip'] = 'unknown.zip'
+        pipeline = ImagePipeline(yolo_model, on_progress=on_pipeline_progress)
+        class2_images, hash_values = pipeline.run(representatives)
+        metrics = pipeline.metrics()
+        _count_cache(status, 'class', metrics['cached'], len(representatives))
+        _count_cache(status, 'hash', metrics['hash_sources'].get('cache', 0), metrics['hashed'])
+    else:
+        meter = StageProgress(job, 'classify', len(representatives), progress_start, progress_end, 'YOLO模型分类中')
+        classify_stats = {}
+        class2_images = classify_images_with_yolo(yolo_model, representatives, on_progress=meter.update,
+                                                  stats=classify_stats)
+        _count_cache(status, 'class', classify_stats.get('cached', 0), len(representatives))
+    return expand_exact_duplicates(class2_images, duplicate_copies, hash_values, exact_index)
+
+def _count_cache(status, kind, hits, lookups):
+    """累计本任务的结果缓存命中/未命中（kind: class / hash）
+    
+    按本任务各图片的结果来源统计：哈希进程池子进程里的命中也算在内，同一进程里的其他任务不算进来
+    """
+    if group3.get_result_cache() is None or (kind == 'class' and getattr(yolo_model, 'cache_key', None) is None):
+        return
+    counts = status.setdefault('result_cache', {'class_hits': 0, 'class_misses': 0, 'hash_hits': 0, 'hash_misses': 0})
+    counts[f'{kind}_hits'] += hits
+    counts[f'{kind}_misses'] += lookups - hits
+
+def process_images(job, archive_queue=None):
+    """处理一个任务（由job_manager在后台线程中调用，多个任务共用已加载的模型）
+    
+    archive_queue: 每次给出一组已上传完成的ZIP [(路径, 文件名)]，None表示上传结束；
+                   分块上传时每个ZIP收齐就放进来，边上传边分类。不传时处理任务上传目录里的全部ZIP
+    """
+    status = job.status
+    session_id = status['session_id']
+    start_time = status['start_time']
+    
+    if archive_queue is None:
+        zip_files = list_zip_files(job.upload_dir)
+        status['archives_expected'] = len(zip_files)
+        archive_queue = queue.Queue()
+        archive_queue.put(zip_files)
+        archive_queue.put(None)
+    
+    temp_dirs = []
+    try:
+        results_dir = job.results_dir
+        os.makedirs(results_dir, exist_ok=True)
         
-        processing_status['total_images'] = len(image_infos)
-        processing_status['progress'] = 30
+        class2_images = []
+        hash_values = [] if group3.PIPELINE_ENABLED else None
+        exact_index = ExactDuplicateIndex()
+        while True:
+            idle = archive_queue.empty()
+            if idle:
+                status['current_step'] = '等待上传'
+                job.save(force=True)
+            try:
+                # 等下一个ZIP时不占处理名额，其他任务先处理
+                with job_manager.waiting(job) if idle else nullcontext():
+                    zip_files = archive_queue.get(timeout=UPLOAD_IDLE_TIMEOUT)
+            except queue.Empty:
+                raise Exception(f"上传超时：{UPLOAD_IDLE_TIMEOUT} 秒内没有新的ZIP文件")
+            if zip_files is None:
+                break
+            if zip_files == UPLOAD_ABORTED:
+                raise Exception("上传已取消")
+            
+            # 这批ZIP占总进度10~60中的一段：前十分之一是提取，其余是分类
+            expected = max(status['archives_expected'], status['archives_processed'] + len(zip_files))
+            band_start = 10 + 50 * status['archives_processed'] / expected
+            band_end = 10 + 50 * (status['archives_processed'] + len(zip_files)) / expected
+            band_split = band_start + (band_end - band_start) / 10
+            
+            # 提取ZIP文件（确保保留source_zip信息）
+            meter = StageProgress(job, 'extract', len(zip_files), band_start, band_split, '提取ZIP文件中的图片')
+            
+            def on_archive(archive_images):
+                status['total_images'] += len(archive_images)
+                meter.advance()
+            
+            image_infos, batch_temp_dirs = extract_archives(zip_files, on_progress=on_archive)
+            temp_dirs.extend(batch_temp_dirs)
+            
+            if image_infos:
+                batch_class2, batch_hashes = _classify_batch(job, image_infos, band_split, band_end, exact_index)
+                class2_images.extend(batch_class2)
+                if hash_values is not None:
+                    hash_values.extend(batch_hashes)
+                status['class2_images'] = len(class2_images)
+            
+            status['archives_processed'] += len(zip_files)
+            status['progress'] = int(band_end)
         
-        if not image_infos:
+        if not status['total_images']:
             raise Exception("未找到图片文件")
         
-        # YOLO分类
-        processing_status['current_step'] = 'YOLO模型分类中'
-        class2_images = classify_images_with_yolo(yolo_model, image_infos)
-        processing_status['class2_images'] = len(class2_images)
-        processing_status['progress'] = 60
+        status['progress'] = 60
         
         if not class2_images:
             raise Exception("未找到class2图片")
         
-        # 计算哈希值和分组
-        processing_status['current_step'] = '计算相似度并分组'
-        groups = process_similarity(class2_images)
-        processing_status['groups_found'] = len(groups)
-        processing_status['progress'] = 90
+        # 计算哈希值和分组（流水线模式下哈希已经算好）
+        meter = StageProgress(job, 'hash', 0 if hash_values is not None else len(class2_images), 60, 90,
+                              '计算相似度并分组')
+        groups = process_similarity(class2_images, session_id, hash_values=hash_values, status=status,
+                                    on_progress=meter.update)
+        status['groups_found'] = len(groups)
+        status['progress'] = 90
         
-        # 保存结果
-        save_results(groups)
+        # 结果缓存命中情况（重复上传的图片只需读文件）；流水线模式下已在分类时计入
+        if 'hash_sources' in status:
+            hash_sources = status['hash_sources']
+            _count_cache(status, 'hash', hash_sources.get('cache', 0), sum(hash_sources.values()))
         
-        # 清理临时文件
-        for temp_dir in temp_dirs:
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
+        # 保存结果（stream模式下只有匹配上的图片会写到磁盘）
+        meter = StageProgress(job, 'save', sum(len(group['images']) for group in groups.values()), 90, 100,
+                              '保存分组结果')
+        status['materialize'] = save_results(groups, results_dir, on_progress=meter.advance)
         
-        processing_status['progress'] = 100
-        processing_status['current_step'] = '处理完成'
+        status['progress'] = 100
+        status['current_step'] = '处理完成'
         
         # 记录使用量 - Linus风格：直接有效
         end_time = datetime.now().isoformat()
-        images_processed = processing_status['total_images']
+        images_processed = status['total_images']
         
         if images_processed > 0:
             license_manager.record_usage(
@@ -210,84 +510,129 @@ def process_images():
             logger.info(f"已记录使用量: {images_processed} 张图片, 会话ID: {session_id}")
         
     except Exception as e:
-        processing_status['error'] = str(e)
+        status['error'] = str(e)
         # 即使出错也记录使用量（如果有处理图片的话）
-        if processing_status.get('total_images', 0) > 0:
+        if status.get('total_images', 0) > 0:
             end_time = datetime.now().isoformat()
             license_manager.record_usage(
-                images_processed=processing_status['total_images'],
+                images_processed=status['total_images'],
                 session_id=session_id,
                 start_time=start_time,
                 end_time=end_time
             )
     finally:
-        processing_status['is_processing'] = False
+        # 清理临时文件（出错时也要清理，否则disk模式的解压目录会一直留着）
+        for temp_dir in temp_dirs:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        # worker进程的主线程会执行很多任务，本任务打开的上传ZIP要关掉（清理后不再占着文件描述符）
+        close_archives()
+        status['is_processing'] = False
 
-def process_similarity(image_infos):
-    """使用group3的跨案件号相似度检测逻辑"""
-    from collections import defaultdict
-    import imagehash
+def process_similarity(image_infos, session_id='', hash_values=None, status=None, on_progress=None):
+    """使用group3的跨案件号相似度检测逻辑，同时与持久化哈希库中的历史上传比对
     
-    HASH_SIZE = 8
-    HASH_THRESHOLD = 5
+    hash_values: 与image_infos一一对应的已算好的哈希值（流水线模式），为None时在此计算
+    status: 任务状态dict，记录哈希来源统计
+    on_progress: 计算哈希时每算完一张以已完成张数调用
+    """
+    from collections import defaultdict
     
     # 按案件号分组并计算哈希值
     case_groups = defaultdict(list)
     
-    for image_info in image_infos:
-        # 从ZIP文件名中提取案件号（这是关键！）
-        zip_filename = image_info.get('source_zip', '')
-        case_id = extract_business_id(zip_filename)
-        
-        if case_id:  # 只处理能识别案件号的图片
-            hash_value = calculate_image_hash(image_info)
-            if hash_value is not None:
-                case_groups[case_id].append({
-                    'hash': hash_value,
-                    'info': image_info,
-                    'case_id': case_id
-                })
-    
-    # 找出跨案件号的相似图片
-    cross_case_duplicates = []
-    case_ids = list(case_groups.keys())
-    
-    for i, case1 in enumerate(case_ids):
-        for j, case2 in enumerate(case_ids):
-            if i < j:  # 避免重复比较 (A vs B 和 B vs A)
-                # 在case1和case2之间找相似图片
-                for img1_data in case_groups[case1]:
-                    for img2_data in case_groups[case2]:
-                        distance = img1_data['hash'] - img2_data['hash']
-                        if distance <= HASH_THRESHOLD:
-                            cross_case_duplicates.append([img1_data, img2_data])
-    
-    # 将跨案件号重复转换为组格式
-    groups = defaultdict(list)
-    for group_id, (img1_data, img2_data) in enumerate(cross_case_duplicates, 1):
-        groups[group_id].extend([img1_data['info'], img2_data['info']])
-    
-    return dict(groups)
-
-def save_results(groups):
+    # 从ZIP文件名中提取案件号（这是关键！）只处理能识别案件号的图片
+    hash_targets = []
+    known_hashes = []
+    for i, image_info in enumerate(image_infos):
+        case_id = extract_business_id(image_info.get('source_zip', ''))
+        if case_id:
+            hash_targets.append((case_id, image_info))
+            if hash_values is not None:
+                known_hashes.append(hash_values[i])
+    
+    if hash_values is None:
+        # 进程池并行计算哈希值，顺序与输入一致
+        hash_sources = {}
+        known_hashes = calculate_image_hashes([image_info for _, image_info in hash_targets], stats=hash_sources,
+                                              on_progress=on_progress)
+        if status is not None:
+            status['hash_sources'] = hash_sources
+    for (case_id, image_info), hash_value in zip(hash_targets, known_hashes):
+        if hash_value is not None:
+            case_groups[case_id].append({
+                'hash': hash_value,
+                'info': image_info,
+                'case_id': case_id
+            })
+    
+    # 历史上传的哈希（不必重新上传旧ZIP）
+    hash_bits = group3.HASH_SIZE ** 2
+    corpus = None
+    history = []
+    if group3.HASH_CORPUS_ENABLED:
+        corpus = HashCorpus(group3.HASH_CORPUS_PATH)
+        # 本次上传的图片（重复上传、任务重试）不能和自己早先写入的记录配对
+        history = corpus.load(hash_bits, session_id=session_id,
+                              exclude={(img_data['info'].get('source_zip', ''), img_data['info'].get('relative_path', ''))
+                                       for images in case_groups.values() for img_data in images})
+    
+    # 找出跨案件号的相似图片（汉明距离索引，不再逐对比较）
+    cross_case_duplicates = find_cross_case_pairs(case_groups, group3.HASH_THRESHOLD,
+                                                  engine=group3.MATCHER_ENGINE, history=history)
+    
+    # 本次上传的哈希写入哈希库，供以后的上传比对
+    if corpus is not None:
+        corpus.add([dict(img_data, hash=hash_to_int(img_data['hash']))
+                    for images in case_groups.values() for img_data in images],
+                   hash_bits, session_id)
+    
+    # 传递性合并：相似对 -> 连通分量，每个分量一组
+    groups = {}
+    for group_id, component in enumerate(cluster_pairs(cross_case_duplicates), 1):
+        groups[group_id] = {
+            'images': [img_data['info'] for img_data in component['members']],
+            'case_ids': component['case_ids'],
+            'edges': component['edges']
+        }
+    
+    return groups
+
+def save_results(groups, results_dir, on_progress=None, strategy=None):
+    """写出分组图片、CSV和组清单，返回图片落地统计
+    
+    strategy: 图片落地方式 copy / link / blobs / manifest，默认RESULT_MATERIALIZE（见result_store）
+    on_progress: 每处理完一张图片调用一次
+    """
     import csv
     import re
     
-    results_dir = app.config['RESULTS_FOLDER']
+    result_writer = ResultWriter(results_dir, strategy or RESULT_MATERIALIZE)
     csv_data = []
-    csv_headers = ['组别', '序号', '案件号', '原始文件名', '新文件名', '来源ZIP', 'ZIP内路径', '相似度组大小']
+    csv_headers = ['组别', '序号', '案件号', '原始文件名', '新文件名', '来源ZIP', 'ZIP内路径', '相似度组大小',
+                   '组内案件数', '最小汉明距离', '相似图片(序号:距离)', '历史记录']
+    manifest = {}
     
-    for group_id, images in groups.items():
-        group_dir = os.path.join(results_dir, f'group_{group_id}')
-        os.makedirs(group_dir, exist_ok=True)
+    for group_id, group in groups.items():
+        images = group['images']
+        group_name = f'group_{group_id}'
+        
+        # 每张图的相似邻居（组内序号从1开始）
+        neighbors = [[] for _ in images]
+        for a, b, distance in group['edges']:
+            neighbors[a].append((b + 1, distance))
+            neighbors[b].append((a + 1, distance))
         
+        new_filenames = []
+        materialized = []
+        files = {}
+        historical = []
         for i, image_info in enumerate(images):
             # 提取案件号（使用group3的方法从ZIP文件名中提取）
             source_zip = image_info.get('source_zip', '')
             case_number = extract_business_id(source_zip)
             
             # 生成新文件名：案件号_组号_序号_原文件名
-            original_filename = os.path.basename(image_info['path'])
+            original_filename = os.path.basename(image_info['path'] or image_info['relative_path'].replace('\\', '/'))
             name, ext = os.path.splitext(original_filename)
             
             if case_number:
@@ -298,20 +643,44 @@ def save_results(groups):
             # 清理文件名中的非法字符
             new_filename = re.sub(r'[<>:"/\\|?*]', '_', new_filename)
             
-            dest_path = os.path.join(group_dir, new_filename)
-            shutil.copy2(image_info['path'], dest_path)
+            new_filenames.append(new_filename)
+            if image_info.get('historical'):
+                # 历史上传的图片已不在磁盘上，只记录在CSV和组清单中
+                historical.append(new_filename)
+            else:
+                files[new_filename] = result_writer.add(image_info, group_name, new_filename)
+                materialized.append(new_filename)
+            if on_progress:
+                on_progress()
             
             # 添加到CSV数据
             csv_data.append([
-                f'group_{group_id}',
+                group_name,
                 i + 1,
                 case_number or 'unknown',
                 original_filename,
                 new_filename,
                 source_zip,
                 image_info.get('relative_path', ''),
-                len(images)
+                len(images),
+                len(group['case_ids']),
+                min(distance for _, distance in neighbors[i]),
+                ';'.join(f'{seq}:{distance}' for seq, distance in neighbors[i]),
+                '是' if image_info.get('historical') else '否'
             ])
+        
+        manifest[group_name] = {
+            'case_ids': group['case_ids'],
+            'images': materialized,
+            'files': files,
+            'historical': historical,
+            'edges': [{'a': new_filenames[a], 'b': new_filenames[b], 'distance': distance}
+                      for a, b, distance in group['edges']]
+        }
+    
+    # 组清单：/results 据此报告每个连通分量的案件号和组内距离
+    with open(os.path.join(results_dir, GROUPS_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
     
     # 生成CSV文件
     csv_path = os.path.join(results_dir, '跨案件号相似图片记录.csv')
@@ -323,61 +692,138 @@ def save_results(groups):
         print(f'CSV记录已生成: {csv_path}')
     except Exception as e:
         print(f'生成CSV文件时出错: {e}')
+    
+    logger.info(f"结果图片落地({result_writer.strategy}): {result_writer.stats}")
+    return result_writer.stats
+
 
+def _job_or_latest(job_id=None):
+    """带任务ID时取该任务，不带时取最近的任务（兼容旧接口）"""
+    return job_manager.get(job_id) if job_id else job_manager.latest()
 
 @app.route('/status')
-def get_status():
-    return jsonify(processing_status)
+@app.route('/status/<job_id>')
+def get_status(job_id=None):
+    job = _job_or_latest(job_id)
+    if job is None:
+        if job_id:
+            return jsonify({'error': '任务不存在'}), 404
+        return jsonify(processing_status)
+    return jsonify(refresh_status(job))
+
+@app.route('/events')
+@app.route('/events/<job_id>')
+def job_events(job_id=None):
+    """任务进度的SSE推送（text/event-stream），替代轮询 /status
+    
+    progress事件只带变化的字段（第一条为完整状态），任务结束时发done事件（完整状态）后关闭
+    """
+    job = _job_or_latest(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    version = job.wait_change(0)
+    
+    def wait_change(timeout):
+        nonlocal version
+        if job_manager.external_workers:
+            # 状态由worker进程写到磁盘，只能按最小间隔重新读取
+            time.sleep(SSE_MIN_INTERVAL)
+            job.reload()
+        else:
+            version = job.wait_change(timeout, version)
+    
+    events = status_events(lambda: refresh_status(job), wait_change,
+                           min_interval=SSE_MIN_INTERVAL, keepalive=SSE_KEEPALIVE)
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs')
+def list_jobs():
+    """所有任务的状态，最新的在前"""
+    return jsonify({'jobs': [refresh_status(job) for job in reversed(job_manager.jobs())]})
 
 @app.route('/results')
-def get_results():
-    results_dir = app.config['RESULTS_FOLDER']
+@app.route('/results/<job_id>')
+def get_results(job_id=None):
+    job = _job_or_latest(job_id)
+    if job is None:
+        if job_id:
+            return jsonify({'error': '任务不存在'}), 404
+        return jsonify({'groups': []})
+    results_dir = job.results_dir
     if not os.path.exists(results_dir):
         return jsonify({'groups': []})
     
+    manifest = {}
+    manifest_path = os.path.join(results_dir, GROUPS_MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    
     groups = []
-    for group_name in sorted(os.listdir(results_dir)):
-        group_path = os.path.join(results_dir, group_name)
-        if os.path.isdir(group_path):
-            images = []
-            for img_name in sorted(os.listdir(group_path)):
-                if img_name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-                    # 返回相对路径用于访问
-                    images.append(f'{group_name}/{img_name}')
-            groups.append({
-                'name': group_name,
-                'count': len(images),
-                'images': images[:5]  # 只返回前5张预览
-            })
+    for group_name, group in manifest.items():
+        # 图片路径带任务ID，/image 据此找到对应任务的结果目录
+        images = [f'{job.job_id}/{group_name}/{img_name}' for img_name in group['images']]
+        distances = [edge['distance'] for edge in group['edges']]
+        groups.append({
+            'name': group_name,
+            'count': len(images) + len(group.get('historical', [])),
+            'historical_count': len(group.get('historical', [])),
+            'images': images[:5],  # 只返回前5张预览
+            'cases': group['case_ids'],
+            'edge_count': len(distances),
+            'max_distance': max(distances) if distances else 0
+        })
     
-    return jsonify({'groups': groups})
+    return jsonify({'job_id': job.job_id, 'groups': groups})
 
 @app.route('/image/<path:filename>')
 def serve_image(filename):
-    """提供图片文件访问"""
-    return send_file(os.path.join(app.config['RESULTS_FOLDER'], filename))
+    """提供图片文件访问：<任务ID>/<组>/<文件>，不带任务ID时取最近的任务"""
+    job_id, _, rest = filename.partition('/')
+    job = job_manager.get(job_id)
+    if job is None:
+        job, rest = job_manager.latest(), filename
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    # 按组清单里的引用取图：可能在组目录、blobs/ 或者还在上传的ZIP里
+    group_name, _, image_name = rest.partition('/')
+    ref = find_ref(load_manifest(os.path.join(job.results_dir, GROUPS_MANIFEST)), group_name, image_name)
+    if ref is None:
+        return jsonify({'error': '图片不存在'}), 404
+    if 'zip' in ref:
+        try:
+            data = read_ref(job.results_dir, ref)
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return jsonify({'error': '图片不存在'}), 404
+        return Response(data, mimetype=mimetypes.guess_type(image_name)[0] or 'application/octet-stream')
+    return send_from_directory(job.results_dir, ref['path'])
 
 @app.route('/download_results')
-def download_results():
-    results_dir = app.config['RESULTS_FOLDER']
-    if not os.path.exists(results_dir) or not os.listdir(results_dir):
+@app.route('/download_results/<job_id>')
+def download_results(job_id=None):
+    job = _job_or_latest(job_id)
+    results_dir = job.results_dir if job else None
+    if not results_dir or not os.path.exists(os.path.join(results_dir, GROUPS_MANIFEST)):
         return jsonify({'error': '没有结果可下载'}), 404
     
-    # 创建ZIP文件
-    zip_path = os.path.join(tempfile.gettempdir(), 'results.zip')
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(results_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, results_dir)
-                zipf.write(file_path, arcname)
-    
-    return send_file(zip_path, as_attachment=True, download_name='相似图片分组结果.zip')
+    # 边读边发送，不生成临时ZIP；图片原样存储，总长度事先算好，浏览器能显示下载进度
+    manifest = load_manifest(os.path.join(results_dir, GROUPS_MANIFEST))
+    stream = ZipStream(download_entries(results_dir, manifest, exclude={STATUS_FILE}))
+    return Response(stream_with_context(iter(stream)), mimetype='application/zip', headers={
+        'Content-Length': str(len(stream)),
+        'Content-Disposition': f"attachment; filename=results.zip; filename*=UTF-8''{quote('相似图片分组结果.zip')}",
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/download_csv')
-def download_csv():
+@app.route('/download_csv/<job_id>')
+def download_csv(job_id=None):
     """单独下载CSV文件"""
-    csv_path = os.path.join(app.config['RESULTS_FOLDER'], '跨案件号相似图片记录.csv')
+    job = _job_or_latest(job_id)
+    csv_path = os.path.join(job.results_dir, '跨案件号相似图片记录.csv') if job else ''
     if os.path.exists(csv_path):
         return send_file(csv_path, as_attachment=True, download_name='跨案件号相似图片记录.csv', mimetype='text/csv')
     else:
@@ -467,7 +913,6 @@ def generate_client_key():
         
         if client_key:
             # 保存到临时文件
-            import tempfile
             temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8')
             temp_file.write(client_key)
             temp_file.close()
@@ -506,6 +951,36 @@ def get_dual_key_info():
         logger.error(f"获取双钥匙信息失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/livez')
+def liveness_check():
+    """存活检查：进程能响应请求即可，模型加载期间也返回200（Docker HEALTHCHECK用这个）"""
+    return jsonify({'status': 'alive', 'timestamp': datetime.now().isoformat()}), 200
+
+@app.route('/readyz')
+def readiness_check():
+    """就绪检查：授权正常且模型已预热才返回200，否则503（代理/负载均衡据此决定是否转发）
+    
+    queue模式下任务不在web进程里执行，看有没有已就绪的worker
+    """
+    checks = {
+        'authorization': processing_status['authorization_status'],
+        'model': processing_status['model_status']
+    }
+    ready = checks['authorization'] == 'authorized'
+    if job_queue is not None:
+        try:
+            checks['ready_workers'] = job_queue.ready_workers(JOB_HEARTBEAT_TIMEOUT)
+        except Exception as e:
+            checks['ready_workers'] = 0
+            checks['error'] = str(e)
+        ready = ready and checks['ready_workers'] > 0
+    else:
+        ready = ready and model_ready()
+        if processing_status.get('model_warmup_seconds') is not None:
+            checks['model_warmup_seconds'] = processing_status['model_warmup_seconds']
+    checks['status'] = 'ready' if ready else 'not_ready'
+    return jsonify(checks), 200 if ready else 503
+
 @app.route('/health')
 def health_check():
     """Docker健康检查端点"""
@@ -514,7 +989,8 @@ def health_check():
         status = {
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'license_system': 'ok'
+            'license_system': 'ok',
+            'model_status': processing_status['model_status']
         }
         
         # 检查授权管理器是否工作
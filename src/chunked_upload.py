@@ -0,0 +1,173 @@
+"""
+分块上传 - 每块单独校验，断网后按已收到的块续传
+一个ZIP的所有块收齐后立即交给处理线程，不用等整批文件上传完
+"""
+
+import os
+import json
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有单进程服务，线程锁就够了
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class ChunkError(ValueError):
+    """块序号、长度或校验和不对，客户端应重传该块"""
+
+
+class UploadTooLarge(ValueError):
+    """登记的文件会使整批超过大小上限"""
+
+
+class ChunkedUploadStore:
+    """上传中的文件保存在 root_dir 下：<file_id>.part 为数据，<file_id>.json 为已收到的块
+
+    块按 序号 * chunk_size 的偏移直接写入 .part，收齐后改名为目标文件
+    多进程服务（serve.py）时同一个文件的块可能落到不同进程，状态更新另外用文件锁串行化
+    max_size: 整批文件的总字节数上限（None为不限），与普通上传的请求大小上限对应
+    """
+
+    def __init__(self, root_dir, chunk_size=DEFAULT_CHUNK_SIZE, max_size=None):
+        self.root_dir = root_dir
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    @staticmethod
+    def file_id(batch_id, filename, size):
+        """同一批次同名同大小的文件ID固定，客户端丢了ID重新登记也能续传"""
+        return hashlib.sha1(f"{batch_id}\0{filename}\0{size}".encode('utf-8')).hexdigest()[:20]
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root_dir, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _meta_path(self, file_id):
+        return os.path.join(self.root_dir, f'{file_id}.json')
+
+    def _part_path(self, file_id):
+        return os.path.join(self.root_dir, f'{file_id}.part')
+
+    def _save_meta(self, meta):
+        tmp_path = self._meta_path(meta['file_id']) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(meta['file_id']))
+
+    def load(self, file_id):
+        """上传状态；不存在时返回None"""
+        try:
+            with open(self._meta_path(file_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def uploads(self):
+        """已登记的所有文件的状态"""
+        file_ids = [name[:-len('.json')] for name in os.listdir(self.root_dir) if name.endswith('.json')]
+        return [meta for meta in map(self.load, file_ids) if meta is not None]
+
+    def register(self, batch_id, filename, size, dest_path, sha256=None):
+        """登记待上传文件；已登记过的返回原状态（含已收到的块）
+
+        dest_path由调用方给出，应按file_id区分（同名的不同文件不能互相覆盖）；超过max_size时抛出UploadTooLarge
+        """
+        file_id = self.file_id(batch_id, filename, size)
+        with self._locked():
+            meta = self.load(file_id)
+            if meta is not None:
+                return meta
+            if self.max_size is not None:
+                registered = sum(other['size'] for other in self.uploads())
+                if registered + size > self.max_size:
+                    raise UploadTooLarge(f"上传总大小超过限制: {registered + size} > {self.max_size} 字节")
+            meta = {
+                'file_id': file_id,
+                'batch_id': batch_id,
+                'filename': filename,
+                'size': size,
+                'sha256': sha256,
+                'dest_path': dest_path,
+                'chunk_size': self.chunk_size,
+                'total_chunks': max(1, -(-size // self.chunk_size)),
+                'received': [],
+                'complete': False
+            }
+            with open(self._part_path(file_id), 'wb') as f:
+                f.truncate(size)
+            self._save_meta(meta)
+        logger.info(f"登记分块上传: {filename} ({size} 字节, {meta['total_chunks']} 块)")
+        return meta
+
+    def write_chunk(self, file_id, index, data, checksum=None):
+        """写入一块；返回 (状态, 收齐后的文件路径或None)
+
+        收齐的那一次调用返回目标路径，调用方据此把文件排入处理队列
+        """
+        meta = self.load(file_id)
+        if meta is None:
+            raise KeyError(file_id)
+        if meta['complete']:
+            return meta, None
+        if not 0 <= index < meta['total_chunks']:
+            raise ChunkError(f"块序号超出范围: {index}")
+        expected = min(meta['chunk_size'], meta['size'] - index * meta['chunk_size'])
+        if len(data) != expected:
+            raise ChunkError(f"块 {index} 长度不对: {len(data)} != {expected}")
+        if checksum and hashlib.sha256(data).hexdigest() != checksum.lower():
+            raise ChunkError(f"块 {index} 校验和不匹配")
+
+        # 各块写入的区间互不重叠，写数据不必持锁
+        with open(self._part_path(file_id), 'r+b') as f:
+            f.seek(index * meta['chunk_size'])
+            f.write(data)
+
+        with self._locked():
+            meta = self.load(file_id)
+            if meta['complete']:
+                return meta, None
+            if index not in meta['received']:
+                meta['received'].append(index)
+            if len(meta['received']) < meta['total_chunks']:
+                self._save_meta(meta)
+                return meta, None
+            self._finish(meta)
+            return meta, meta['dest_path']
+
+    def _finish(self, meta):
+        """所有块到齐：校验整个文件（登记时给了sha256才校验）后移到目标位置"""
+        part_path = self._part_path(meta['file_id'])
+        if meta['sha256']:
+            with open(part_path, 'rb') as f:
+                sha = hashlib.sha256()
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            if sha.hexdigest() != meta['sha256'].lower():
+                # 整体校验失败只能全部重传
+                meta['received'] = []
+                self._save_meta(meta)
+                raise ChunkError(f"文件校验和不匹配，需要重新上传: {meta['filename']}")
+        os.makedirs(os.path.dirname(meta['dest_path']), exist_ok=True)
+        os.replace(part_path, meta['dest_path'])
+        meta['complete'] = True
+        self._save_meta(meta)
+        logger.info(f"分块上传完成: {meta['filename']}")
@@ -0,0 +1,84 @@
+"""
+相似图片聚类 - 把跨案件号相似对合并为连通分量
+一张图出现在30个案件里就是一个组，而不是几百个两两配对
+"""
+
+
+class DisjointSet:
+    """并查集（路径压缩 + 按大小合并）"""
+
+    def __init__(self):
+        self._parent = {}
+        self._size = {}
+
+    def add(self, key):
+        if key not in self._parent:
+            self._parent[key] = key
+            self._size[key] = 1
+
+    def find(self, key):
+        root = key
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # 路径压缩
+        while self._parent[key] != root:
+            self._parent[key], key = root, self._parent[key]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self._size[root_a] < self._size[root_b]:
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._size[root_a] += self._size[root_b]
+        return root_a
+
+
+def cluster_pairs(pairs):
+    """把相似对合并为连通分量
+
+    pairs: [(img1_data, img2_data, 汉明距离), ...]（find_cross_case_pairs的输出）
+    返回: [{'members': [img_data, ...],
+            'edges': [(成员序号a, 成员序号b, 汉明距离), ...],
+            'case_ids': [案件号, ...]}, ...]
+    组按首次出现的顺序排列，组内成员也按首次出现的顺序排列
+    """
+    dsu = DisjointSet()
+    order = {}  # id(img_data) -> 首次出现的序号
+    nodes = []
+    for img1_data, img2_data, _ in pairs:
+        for img_data in (img1_data, img2_data):
+            key = id(img_data)
+            if key not in order:
+                order[key] = len(nodes)
+                nodes.append(img_data)
+                dsu.add(key)
+        dsu.union(id(img1_data), id(img2_data))
+
+    components = {}  # 根 -> 组，dict保持插入顺序
+    member_index = {}  # id(img_data) -> 组内序号
+    for img_data in nodes:
+        root = dsu.find(id(img_data))
+        group = components.setdefault(root, {'members': [], 'edges': [], 'case_ids': []})
+        member_index[id(img_data)] = len(group['members'])
+        group['members'].append(img_data)
+        if img_data['case_id'] not in group['case_ids']:
+            group['case_ids'].append(img_data['case_id'])
+
+    for img1_data, img2_data, distance in pairs:
+        group = components[dsu.find(id(img1_data))]
+        group['edges'].append((member_index[id(img1_data)], member_index[id(img2_data)], distance))
+
+    return list(components.values())
+
+
+def member_min_distances(group):
+    """组内每个成员到其相似图片的最小汉明距离"""
+    best = [None] * len(group['members'])
+    for a, b, distance in group['edges']:
+        for index in (a, b):
+            if best[index] is None or distance < best[index]:
+                best[index] = distance
+    return best
@@ -1,5 +1,7 @@
+import io
 import os
 import shutil
+import struct
 import zipfile
 import tempfile
 import csv
@@ -7,206 +9,726 @@ from PIL import Image
 import imagehash
 from collections import defaultdict
 import logging
-import glob
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from hash_index import find_cross_case_pairs
+from result_cache import ResultCache, file_digest, stream_digest
+from zip_source import open_image_source, materialize, resolve_member_names
+from clustering import cluster_pairs, member_min_distances
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# 尝试导入YOLO，如果失败则创建虚拟类
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-except ImportError:
+# ultralytics（连带torch）导入要好几秒，这里只检查是否安装，加载模型时才真正导入
+YOLO_AVAILABLE = importlib.util.find_spec('ultralytics') is not None
+if not YOLO_AVAILABLE:
     logger.warning("YOLO not available, using mock implementation")
-    YOLO_AVAILABLE = False
-    
-    class MockYOLO:
-        def __init__(self, model_path):
-            self.model_path = model_path
-        
-        def predict(self, image_path, **kwargs):
-            # 返回虚拟分类结果
-            return [MockResult()]
-    
-    class MockResult:
-        def __init__(self):
-            self.names = {0: 'yak', 1: 'other'}
-            self.probs = MockProbs()
-    
-    class MockProbs:
-        def __init__(self):
-            self.top1 = 0  # 假设都是牦牛
-            self.top1conf = 0.85
+
+class MockYOLO:
+    def __init__(self, model_path):
+        self.model_path = model_path
     
-    YOLO = MockYOLO
+    def predict(self, image_path, **kwargs):
+        # 返回虚拟分类结果
+        return [MockResult()]
+
+class MockResult:
+    def __init__(self):
+        self.names = {0: 'yak', 1: 'other'}
+        self.probs = MockProbs()
+
+class MockProbs:
+    def __init__(self):
+        self.top1 = 0  # 假设都是牦牛
+        self.top1conf = 0.85
+
+def _yolo_class():
+    from ultralytics import YOLO
+    return YOLO
 
 # 配置参数 - Docker友好的路径
 INPUT_DIR = os.environ.get('INPUT_DIR', './uploads')  # Docker环境使用相对路径
 OUTPUT_DIR = os.environ.get('OUTPUT_DIR', './results')  # 输出目录
 HASH_SIZE = 8  # 哈希大小（8=64位哈希）
 HASH_THRESHOLD = 5  # 汉明距离阈值（≤5视为相似）
+MATCHER_ENGINE = os.environ.get('MATCHER_ENGINE', 'bktree')  # 跨案件号匹配引擎: bktree / mih / numpy / brute
 SUPPORTED_FORMATS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.webp')  # 支持的图片格式
+ZIP_EXTRACT_MODE = os.environ.get('ZIP_EXTRACT_MODE', 'stream')  # ZIP读取方式: stream（直接从压缩包读图）/ disk（先解压到临时目录）
+ZIP_EXTRACT_WORKERS = int(os.environ.get('ZIP_EXTRACT_WORKERS', os.cpu_count() or 1))  # 并行处理ZIP的线程数（不超过ZIP个数）
+MAX_IMAGE_FILE_SIZE = int(os.environ.get('MAX_IMAGE_FILE_SIZE', 50 * 1024 * 1024))  # 超过此大小的图片成员不解压
 YOLO_MODEL_PATH = os.environ.get('YOLO_MODEL_PATH', './data/best.pt')  # YOLO模型路径
+YOLO_BACKEND = os.environ.get('YOLO_BACKEND', 'torch')  # 推理后端: torch（ultralytics）/ onnxruntime / openvino（导出ONNX后在CPU上推理，见onnx_classifier）
+YOLO_INTRA_OP_THREADS = int(os.environ.get('YOLO_INTRA_OP_THREADS', os.cpu_count() or 1))  # ONNX后端单次推理内部的线程数
+YOLO_INTER_OP_THREADS = int(os.environ.get('YOLO_INTER_OP_THREADS', 1))  # ONNX后端同时执行的算子数（推理已串行，1即可）
+YOLO_QUANTIZATION = os.environ.get('YOLO_QUANTIZATION', '')  # ONNX后端INT8量化: 空（FP32）/ dynamic / static（需先用tools/quantize_model.py校准，见quantization）
 CLASS2_CONFIDENCE_THRESHOLD = 0.5  # class2置信度阈值
+YOLO_BATCH_SIZE = int(os.environ.get('YOLO_BATCH_SIZE', 16))  # 每批送入模型的图片数
+YOLO_DECODE_SIZE = 640  # 分类前JPEG缩放解码的最小边长（模型输入远小于原图）
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))  # 并行计算哈希的进程数（1=串行）
+HASH_CHUNK_SIZE = 16  # 每次提交给进程池的图片数
+# 哈希进程池的启动方式：forkserver/spawn的子进程不继承父进程的线程、锁和打开的ZipFile（fork在多线程的web进程里可能死锁）
+HASH_POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+HASH_DECODE_MODE = os.environ.get('HASH_DECODE_MODE', 'full')  # 哈希解码方式: full / draft（JPEG缩放灰度解码）/ validate（用full并报告draft差异）
+HASH_SOURCE = os.environ.get('HASH_SOURCE', 'image')  # 哈希来源: image / exif_thumbnail（优先用EXIF内嵌缩略图，不可用时回退原图）
+EXIF_THUMBNAIL_ASPECT_TOLERANCE = 0.02  # 缩略图与原图宽高比允许的差异
+PIPELINE_ENABLED = os.environ.get('PIPELINE_ENABLED', '1') == '1'  # 读图/分类/哈希流水线并行（0=逐阶段串行）
+PIPELINE_READERS = int(os.environ.get('PIPELINE_READERS', 4))  # 读图解码线程数
+PIPELINE_HASH_THREADS = int(os.environ.get('PIPELINE_HASH_THREADS', 2))  # HASH_WORKERS=1时流水线中的哈希线程数（否则用HASH_WORKERS个进程）
+PIPELINE_QUEUE_DEPTH = 64  # 各阶段之间队列的最大长度
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1') == '1'  # 是否缓存分类概率和哈希（按图片内容摘要）
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', './data/result_cache.db')  # 结果缓存路径
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 200000))  # 缓存条目上限（LRU淘汰）
+# 哈希子进程重新导入本模块，用到的配置在启动时从父进程传过去（运行时改过的值也一致）
+HASH_WORKER_SETTINGS = ('HASH_SIZE', 'HASH_DECODE_MODE', 'HASH_SOURCE', 'EXIF_THUMBNAIL_ASPECT_TOLERANCE',
+                        'RESULT_CACHE_ENABLED', 'RESULT_CACHE_PATH', 'RESULT_CACHE_MAX_ENTRIES')
+HASH_CORPUS_ENABLED = os.environ.get('HASH_CORPUS_ENABLED', '1') == '1'  # 是否与历史上传的哈希比对
+HASH_CORPUS_PATH = os.environ.get('HASH_CORPUS_PATH', './data/hash_corpus.db')  # 持久化哈希库路径
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+_model_lock = threading.Lock()
+
+def get_result_cache():
+    """结果缓存单例；未启用或无法打开时返回None"""
+    global _result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            try:
+                _result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES)
+            except Exception as e:
+                logger.error(f"打开结果缓存失败: {str(e)}")
+                return None
+        return _result_cache
+
+def image_digest(image_info):
+    """图片内容摘要（算一次后记在image_info里）"""
+    if 'digest' not in image_info:
+        with open_image_source(image_info) as f:
+            image_info['digest'] = stream_digest(f)
+    return image_info['digest']
+
+def check_model_config():
+    """YOLO_BACKEND与YOLO_QUANTIZATION的组合不对时抛出ValueError"""
+    if YOLO_QUANTIZATION:
+        from quantization import check_mode
+        check_mode(YOLO_BACKEND, YOLO_QUANTIZATION)
+
+def _onnx_model_path():
+    """ONNX后端要加载的模型文件和缓存标记；按YOLO_QUANTIZATION换成INT8模型
+    
+    dynamic量化不需要校准数据，第一次用时自动生成；static的量化模型不存在时退回FP32
+    """
+    from onnx_classifier import export_onnx
+    onnx_path = export_onnx(YOLO_MODEL_PATH)
+    if not YOLO_QUANTIZATION:
+        return onnx_path, YOLO_BACKEND
+    from quantization import quantize_model, quantized_path
+    int8_path = quantized_path(onnx_path, YOLO_QUANTIZATION)
+    if not os.path.exists(int8_path):
+        if YOLO_QUANTIZATION != 'dynamic':
+            logger.warning(f"量化模型不存在: {int8_path}，先用 tools/quantize_model.py 校准量化；暂用FP32模型")
+            return onnx_path, YOLO_BACKEND
+        int8_path = quantize_model(onnx_path, 'dynamic')
+    return int8_path, f"{YOLO_BACKEND}:int8-{YOLO_QUANTIZATION}"
+
+def _load_onnx_model():
+    """ONNX Runtime / OpenVINO后端；已按权重校验和导出过的ONNX直接用，不需要ultralytics和torch"""
+    from onnx_classifier import OnnxClassifier
+    onnx_path, variant = _onnx_model_path()
+    model = OnnxClassifier(onnx_path, YOLO_BACKEND, YOLO_INTRA_OP_THREADS, YOLO_INTER_OP_THREADS)
+    # 不同后端（和量化）的数值有细微差别，分类缓存分开
+    model.cache_key = f"{file_digest(YOLO_MODEL_PATH)}:{YOLO_DECODE_SIZE}:{variant}"
+    return model
+
+def prepare_model():
+    """ONNX后端：在fork出worker之前先导出（和量化）好，worker里只创建推理会话；torch后端什么都不做"""
+    try:
+        check_model_config()
+    except ValueError as e:
+        # 主进程不退出；worker加载模型时会以同样的错误失败，/readyz 报告
+        logger.error(f"模型配置错误: {str(e)}")
+        return
+    if YOLO_BACKEND == 'torch' or not os.path.exists(YOLO_MODEL_PATH):
+        return
+    try:
+        _onnx_model_path()
+    except Exception as e:
+        logger.error(f"导出ONNX模型失败: {str(e)}")
 
 def load_yolo_model():
-    """加载YOLO分类模型"""
+    """加载YOLO分类模型；后端与量化方式的组合不对时直接抛出ValueError，不退回ultralytics"""
+    check_model_config()
+    if YOLO_BACKEND != 'torch' and os.path.exists(YOLO_MODEL_PATH):
+        try:
+            model = _load_onnx_model()
+            logger.info(f"YOLO模型加载成功（{YOLO_BACKEND}）: {YOLO_MODEL_PATH}")
+            return model
+        except Exception as e:
+            logger.error(f"{YOLO_BACKEND} 后端加载失败，改用ultralytics: {str(e)}")
+    
     if not YOLO_AVAILABLE:
         logger.info("Using mock YOLO implementation for Docker demo")
-        return YOLO("mock_model.pt")
+        return MockYOLO("mock_model.pt")
     
     if not os.path.exists(YOLO_MODEL_PATH):
         logger.warning(f"YOLO模型文件不存在: {YOLO_MODEL_PATH}")
         logger.info("Using mock YOLO implementation")
-        return YOLO("mock_model.pt")
+        return MockYOLO("mock_model.pt")
     
     try:
-        model = YOLO(YOLO_MODEL_PATH)
+        model = _yolo_class()(YOLO_MODEL_PATH)
+        # 结果缓存按模型文件校验和区分，换模型后旧的分类结果自动失效
+        model.cache_key = f"{file_digest(YOLO_MODEL_PATH)}:{YOLO_DECODE_SIZE}"
         logger.info(f"YOLO模型加载成功: {YOLO_MODEL_PATH}")
         return model
     except Exception as e:
         logger.error(f"加载YOLO模型失败: {str(e)}")
         logger.info("Using mock YOLO implementation")
-        return YOLO("mock_model.pt")
+        return MockYOLO("mock_model.pt")
+
+def warm_up_model(model):
+    """用一张空白图片推理一次：第一次推理要初始化推理引擎、分配内存，不让第一个任务等这几秒"""
+    if isinstance(model, MockYOLO):
+        return
+    with _model_lock:
+        model(Image.new('RGB', (YOLO_DECODE_SIZE, YOLO_DECODE_SIZE)), verbose=False)
+
+def load_classify_image(image_info):
+    """读取待分类图片；JPEG按缩放解码，分类模型只需要imgsz大小的输入"""
+    with open_image_source(image_info) as f, Image.open(f) as img:
+        img.draft('RGB', (YOLO_DECODE_SIZE, YOLO_DECODE_SIZE))
+        return img.convert('RGB')
+
+def _predict_batch(model, images):
+    """批量推理；整批失败时逐张重试，坏图只影响自己
+    
+    多个任务共用同一个模型，推理器不是线程安全的，推理本身串行（读图、哈希仍并行）
+    """
+    with _model_lock:
+        try:
+            return model(images, verbose=False)
+        except Exception as e:
+            logger.warning(f"批量推理失败，改为逐张推理: {str(e)}")
+            results = []
+            for img in images:
+                try:
+                    results.append(model(img, verbose=False)[0])
+                except Exception as e:
+                    logger.error(f"预测图片时出错: {str(e)}")
+                    results.append(None)
+            return results
+
+def predict_class2_probabilities(model, images, image_infos=None):
+    """一批图片的class2概率，无法获取预测结果的为None
+    
+    传入对应的image_infos时，把完整的类别概率写入结果缓存
+    """
+    cache = get_result_cache() if image_infos is not None else None
+    model_key = getattr(model, 'cache_key', None)
+    probabilities = []
+    for k, result in enumerate(_predict_batch(model, images)):
+        if result is None or result.probs is None:
+            probabilities.append(None)
+            continue
+        class_probs = [float(p) for p in result.probs.data.tolist()]
+        probabilities.append(class_probs[1])
+        if cache is not None and model_key is not None:
+            try:
+                cache.put_class_probs(image_digest(image_infos[k]), model_key, class_probs)
+            except Exception as e:
+                logger.warning(f"写入结果缓存失败 {image_infos[k]['path']}: {str(e)}")
+    return probabilities
 
-def classify_images_with_yolo(model, image_paths):
-    """使用YOLO模型对图片进行分类，筛选出class2图片"""
+def cached_class2_probability(model, image_info):
+    """从结果缓存取class2概率，未命中返回None"""
+    cache = get_result_cache()
+    model_key = getattr(model, 'cache_key', None)
+    if cache is None or model_key is None:
+        return None
+    try:
+        class_probs = cache.get_class_probs(image_digest(image_info), model_key)
+    except Exception as e:
+        logger.warning(f"读取结果缓存失败 {image_info['path']}: {str(e)}")
+        return None
+    return class_probs[1] if class_probs else None
+
+def accept_class2(index, total_images, image_info, class2_prob):
+    """按阈值判断是否为class2图片并记录日志"""
+    name = os.path.basename(image_info['path'])
+    if class2_prob is None:
+        logger.warning(f"图片 {index+1}/{total_images}: {name} - 无法获取预测结果")
+        return False
+    # 如果class2概率大于阈值，则保留该图片
+    if class2_prob >= CLASS2_CONFIDENCE_THRESHOLD:
+        logger.info(f"图片 {index+1}/{total_images}: {name} - class2概率: {class2_prob:.3f} ✓")
+        return True
+    logger.info(f"图片 {index+1}/{total_images}: {name} - class2概率: {class2_prob:.3f} ✗ (低于阈值)")
+    return False
+
+def classify_images_with_yolo(model, image_paths, batch_size=None, on_progress=None, stats=None):
+    """使用YOLO模型对图片进行分类，筛选出class2图片（按batch_size张一批送入模型）
+    
+    on_progress: 可选回调，每批处理完后以已处理张数调用
+    stats: 可选dict，填入直接用了缓存分类结果的图片数（cached）
+    """
     if model is None:
         logger.error("YOLO模型未加载，跳过分类步骤")
         return image_paths
     
-    logger.info("开始使用YOLO模型进行图片分类...")
+    batch_size = max(1, batch_size or YOLO_BATCH_SIZE)
+    logger.info(f"开始使用YOLO模型进行图片分类（批大小 {batch_size}）...")
     class2_images = []
     total_images = len(image_paths)
+    cached = 0
     
-    for i, image_info in enumerate(image_paths):
-        try:
-            # 预测单张图片
-            results = model(image_info['path'])
-            result = results[0]  # 获取第一个结果
+    for batch_start in range(0, total_images, batch_size):
+        # 先读图，读不了的图片单独跳过，不影响同批其他图片
+        batch = []
+        accepted = []  # 本批判为class2的图片序号；缓存命中的和推理的混在一起，最后按输入顺序输出
+        for i in range(batch_start, min(batch_start + batch_size, total_images)):
+            image_info = image_paths[i]
+            # 见过的图片直接用缓存的分类结果，不解码不推理
+            cached_prob = cached_class2_probability(model, image_info)
+            if cached_prob is not None:
+                cached += 1
+                if accept_class2(i, total_images, image_info, cached_prob):
+                    accepted.append(i)
+                continue
+            try:
+                batch.append((i, image_info, load_classify_image(image_info)))
+            except Exception as e:
+                logger.error(f"预测图片时出错 {image_info['path']}: {str(e)}")
+        if batch:
+            probabilities = predict_class2_probabilities(model, [img for _, _, img in batch],
+                                                         [image_info for _, image_info, _ in batch])
             
-            if result.probs is not None:
-                # 获取class1和class2的概率
-                class1_prob = result.probs.data[0].item()
-                class2_prob = result.probs.data[1].item()
-                
-                # 如果class2概率大于阈值，则保留该图片
-                if class2_prob >= CLASS2_CONFIDENCE_THRESHOLD:
-                    class2_images.append(image_info)
-                    logger.info(f"图片 {i+1}/{total_images}: {os.path.basename(image_info['path'])} - class2概率: {class2_prob:.3f} ✓")
-                else:
-                    logger.info(f"图片 {i+1}/{total_images}: {os.path.basename(image_info['path'])} - class2概率: {class2_prob:.3f} ✗ (低于阈值)")
-            else:
-                logger.warning(f"图片 {i+1}/{total_images}: {os.path.basename(image_info['path'])} - 无法获取预测结果")
-                
-        except Exception as e:
-            logger.error(f"预测图片时出错 {image_info['path']}: {str(e)}")
-            continue
+            for (i, image_info, _), class2_prob in zip(batch, probabilities):
+                if accept_class2(i, total_images, image_info, class2_prob):
+                    accepted.append(i)
+        class2_images.extend(image_paths[i] for i in sorted(accepted))
+        if on_progress:
+            on_progress(min(batch_start + batch_size, total_images))
     
+    if stats is not None:
+        stats['cached'] = cached
     logger.info(f"YOLO分类完成！从 {total_images} 张图片中筛选出 {len(class2_images)} 张class2图片")
     return class2_images
 
-def extract_zip_files(zip_dir):
-    """从指定目录提取所有zip文件中的图片"""
-    image_paths = []
-    temp_dirs = []
+def _image_members(zip_ref, zip_path):
+    """只挑出需要的成员：按扩展名和大小过滤，一个字节都不解压就跳过PDF、视频等附件
+    
+    返回 [(ZipInfo, 解码后的文件名)]
+    """
+    members = []
+    skipped_type = skipped_size = 0
+    for zip_info, filename in resolve_member_names(zip_ref):
+        if zip_info.is_dir():
+            continue
+        if not filename.lower().endswith(SUPPORTED_FORMATS):
+            skipped_type += 1
+            continue
+        if zip_info.file_size == 0 or zip_info.file_size > MAX_IMAGE_FILE_SIZE:
+            skipped_size += 1
+            continue
+        members.append((zip_info, filename))
+    if skipped_type or skipped_size:
+        logger.info(f"{os.path.basename(zip_path)}: 跳过 {skipped_type} 个非图片文件, {skipped_size} 个大小异常的图片")
+    return members
+
+def _extract_archive(zip_path, zip_name, mode):
+    """处理单个ZIP，返回 (图片记录列表, 临时目录或None)
     
-    # 遍历目录中的所有zip文件
+    stream模式只读中央目录，图片记录指向压缩包内的成员；disk模式把图片成员解压到临时目录
+    """
+    logger.info(f"正在处理zip文件: {zip_path}")
+    image_paths = []
+    temp_dir = None
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = _image_members(zip_ref, zip_path)
+        if mode == 'stream':
+            for zip_info, filename in members:
+                image_paths.append({
+                    'path': os.path.join(zip_path, filename),  # 只用于日志和取原文件名，磁盘上并不存在
+                    'source_zip': zip_name,
+                    'original_zip_path': zip_path,
+                    'relative_path': os.path.normpath(filename),
+                    'zip_member': zip_info.filename,
+                    'crc32': zip_info.CRC,
+                    'file_size': zip_info.file_size
+                })
+            return image_paths, None
+        
+        # 创建临时目录
+        temp_dir = tempfile.mkdtemp(prefix=f"zip_extract_{os.path.splitext(zip_name)[0]}_")
+        for zip_info, filename in members:
+            try:
+                # 解压单个文件
+                extracted_path = zip_ref.extract(zip_info, temp_dir)
+                
+                # zipfile按cp437解码的中文名会被解压成乱码路径，改回检测出的编码（不允许跳出临时目录）
+                new_path = os.path.normpath(os.path.join(temp_dir, filename))
+                if filename != zip_info.filename and new_path.startswith(temp_dir + os.sep):
+                    # 确保目标目录存在
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    os.rename(extracted_path, new_path)
+                    extracted_path = new_path
+                
+                image_paths.append({
+                    'path': extracted_path,
+                    'source_zip': zip_name,
+                    'original_zip_path': zip_path,
+                    'relative_path': os.path.relpath(extracted_path, temp_dir),
+                    'crc32': zip_info.CRC,
+                    'file_size': zip_info.file_size
+                })
+            except Exception as e:
+                logger.warning(f"处理zip文件中的文件 {zip_info.filename} 时出错: {str(e)}")
+                continue
+    return image_paths, temp_dir
+
+def list_zip_files(zip_dir):
+    """目录中的所有zip文件: [(路径, 文件名)]"""
+    zip_files = []
     for root, _, files in os.walk(zip_dir):
         for file in files:
             if file.lower().endswith('.zip'):
-                zip_path = os.path.join(root, file)
-                logger.info(f"正在处理zip文件: {zip_path}")
-                
-                try:
-                    # 创建临时目录
-                    temp_dir = tempfile.mkdtemp(prefix=f"zip_extract_{os.path.splitext(file)[0]}_")
-                    temp_dirs.append(temp_dir)
-                    
-                    # 解压zip文件，处理中文编码
-                    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                        # 获取zip文件中的文件列表
-                        for zip_info in zip_ref.infolist():
-                            try:
-                                # 尝试不同的编码方式处理文件名
-                                filename = None
-                                for encoding in ['utf-8', 'gbk', 'gb2312', 'cp437']:
-                                    try:
-                                        filename = zip_info.filename.encode('cp437').decode(encoding)
-                                        break
-                                    except (UnicodeDecodeError, UnicodeEncodeError):
-                                        continue
-                                
-                                if filename is None:
-                                    # 如果所有编码都失败，使用原始文件名
-                                    filename = zip_info.filename
-                                
-                                # 解压单个文件
-                                zip_ref.extract(zip_info, temp_dir)
-                                
-                                # 如果文件名包含中文且需要重命名
-                                if filename != zip_info.filename:
-                                    old_path = os.path.join(temp_dir, zip_info.filename)
-                                    new_path = os.path.join(temp_dir, filename)
-                                    if os.path.exists(old_path):
-                                        # 确保目标目录存在
-                                        os.makedirs(os.path.dirname(new_path), exist_ok=True)
-                                        os.rename(old_path, new_path)
-                                
-                            except Exception as e:
-                                logger.warning(f"处理zip文件中的文件 {zip_info.filename} 时出错: {str(e)}")
-                                continue
-                    
-                    # 收集解压后的图片文件
-                    for extract_root, _, extract_files in os.walk(temp_dir):
-                        for extract_file in extract_files:
-                            if extract_file.lower().endswith(SUPPORTED_FORMATS):
-                                full_path = os.path.join(extract_root, extract_file)
-                                # 记录原始zip文件的完整路径
-                                original_zip_path = os.path.join(root, file)
-                                # 图片在zip文件中的相对路径（处理中文编码）
-                                relative_path = os.path.relpath(full_path, temp_dir)
-                                # 尝试修复相对路径中的中文乱码
-                                try:
-                                    path_parts = relative_path.split('\\')
-                                    fixed_parts = []
-                                    for part in path_parts:
-                                        if '╨' in part or '╧' in part or '╥' in part:
-                                            # 修复GBK编码问题
-                                            fixed_part = part.encode('latin1').decode('gbk', errors='ignore')
-                                        else:
-                                            fixed_part = part
-                                        fixed_parts.append(fixed_part)
-                                    relative_path = '\\'.join(fixed_parts)
-                                except:
-                                    pass  # 如果修复失败，保持原路径
-                                image_paths.append({
-                                    'path': full_path,
-                                    'source_zip': file,
-                                    'original_zip_path': original_zip_path,
-                                    'relative_path': relative_path
-                                })
-                                
-                except Exception as e:
-                    logger.error(f"处理zip文件 {zip_path} 时出错: {str(e)}")
-                    continue
+                zip_files.append((os.path.join(root, file), file))
+    return zip_files
+
+def extract_zip_files(zip_dir, mode=None, workers=None):
+    """从指定目录提取所有zip文件中的图片，见extract_archives"""
+    return extract_archives(list_zip_files(zip_dir), mode, workers)
+
+def extract_archives(zip_files, mode=None, workers=None, on_progress=None):
+    """提取若干zip文件 [(路径, 文件名)] 中的图片，多个ZIP并行处理
+    
+    mode: stream（默认，见ZIP_EXTRACT_MODE）只列出压缩包内的图片成员，读图时直接解压到内存；
+          disk 解压到临时目录。返回 (图片记录列表, 需要清理的临时目录列表)，图片顺序与zip_files一致
+    on_progress: 可选回调，每个ZIP处理完后以该ZIP的图片记录列表调用（在调用方线程中）
+    """
+    mode = mode or ZIP_EXTRACT_MODE
+    workers = ZIP_EXTRACT_WORKERS if workers is None else workers
+    
+    def extract_one(zip_file):
+        zip_path, zip_name = zip_file
+        try:
+            return _extract_archive(zip_path, zip_name, mode)
+        except Exception as e:
+            logger.error(f"处理zip文件 {zip_path} 时出错: {str(e)}")
+            return [], None
+    
+    # 解压（zlib）会释放GIL，线程池即可跨ZIP并行
+    workers = max(1, min(workers, len(zip_files)))
+    if workers > 1:
+        logger.info(f"使用 {workers} 个线程并行处理 {len(zip_files)} 个zip文件")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            image_paths, temp_dirs = _collect_archives(executor.map(extract_one, zip_files), on_progress)
+    else:
+        image_paths, temp_dirs = _collect_archives(map(extract_one, zip_files), on_progress)
     
     logger.info(f"共提取了 {len(image_paths)} 张图片")
     return image_paths, temp_dirs
 
+def _collect_archives(results, on_progress=None):
+    """按顺序合并各ZIP的 (图片记录, 临时目录)"""
+    image_paths = []
+    temp_dirs = []
+    for archive_images, temp_dir in results:
+        image_paths.extend(archive_images)
+        if temp_dir:
+            temp_dirs.append(temp_dir)
+        if on_progress:
+            on_progress(archive_images)
+    return image_paths, temp_dirs
+
+class ExactDuplicateIndex:
+    """任务级的完全相同图片索引：分块上传时ZIP分批处理，后到的图片也能和之前批次的代表对上
+
+    group_exact_duplicates / expand_exact_duplicates 传入同一个索引时原地更新
+    """
+
+    def __init__(self):
+        self.representatives = defaultdict(list)  # (CRC32, 大小) -> 代表图片
+        self.copies = defaultdict(list)           # id(代表) -> 之前批次找到的副本
+        self.class2 = {}                          # id(代表) -> 哈希值（判为class2的代表；不带哈希时为None）
+
+def group_exact_duplicates(image_infos, index=None):
+    """完全相同图片的预处理：按ZIP条目的 (CRC32, 大小) 初筛，再用SHA-256确认
+    
+    每组完全相同的图片只保留第一张作为代表去做分类和哈希
+    index: 任务级的ExactDuplicateIndex，与之前批次的代表相同的图片也算副本
+    返回: (本批次的代表图片列表, {id(代表): [本批次的副本, ...]}, 新出现的跨案件号完全相同图片集合列表)
+    """
+    if index is None:
+        index = ExactDuplicateIndex()
+    candidates = defaultdict(list)
+    for image_info in image_infos:
+        if image_info.get('crc32') is not None:
+            candidates[(image_info['crc32'], image_info['file_size'])].append(image_info)
+    
+    copies = defaultdict(list)
+    duplicate_ids = set()
+    for key, members in candidates.items():
+        earlier = index.representatives[key]
+        if len(earlier) + len(members) >= 2:
+            # CRC32可能碰撞，用真实摘要确认
+            by_digest = {}
+            for image_info in earlier + members:
+                try:
+                    digest = image_digest(image_info)
+                except OSError as e:
+                    logger.warning(f"计算图片摘要失败 {image_info['path']}: {str(e)}")
+                    continue
+                representative = by_digest.setdefault(digest, image_info)
+                if representative is not image_info:
+                    copies[id(representative)].append(image_info)
+                    duplicate_ids.add(id(image_info))
+        earlier.extend(image_info for image_info in members if id(image_info) not in duplicate_ids)
+    
+    representatives = [image_info for image_info in image_infos if id(image_info) not in duplicate_ids]
+    
+    # 只算这一批才变成跨案件号的集合，之前批次已经算过的不重复计数
+    cross_case_sets = []
+    for key in candidates:
+        for representative in index.representatives[key]:
+            if id(representative) not in copies:
+                continue
+            before = [representative] + index.copies[id(representative)]
+            identical = before + copies[id(representative)]
+            index.copies[id(representative)] = identical[1:]
+            case_ids = {extract_business_id(image_info['source_zip']) for image_info in identical} - {None}
+            case_ids_before = {extract_business_id(image_info['source_zip']) for image_info in before} - {None}
+            if len(case_ids) > 1 and len(case_ids_before) <= 1:
+                cross_case_sets.append(identical)
+                logger.info(f"发现跨案件号完全相同图片: {', '.join(sorted(case_ids))} - "
+                            f"{os.path.basename(representative['path'])} 共 {len(identical)} 份")
+    
+    logger.info(f"完全相同图片预处理: {len(image_infos)} 张图片中 {len(duplicate_ids)} 张是副本, "
+                f"跨案件号完全相同 {len(cross_case_sets)} 组")
+    return representatives, dict(copies), cross_case_sets
+
+def expand_exact_duplicates(images, copies, hash_values=None, index=None):
+    """把代表图片的分类/哈希结果扇出到它的完全相同副本
+    
+    index: 与group_exact_duplicates相同的索引；代表在之前批次判为class2时，本批次的副本沿用它的结果
+    """
+    expanded_images = []
+    expanded_hashes = []
+    for k, image_info in enumerate(images):
+        identical = [image_info] + copies.get(id(image_info), [])
+        expanded_images.extend(identical)
+        if hash_values is not None:
+            expanded_hashes.extend([hash_values[k]] * len(identical))
+    if index is not None:
+        for representative_id, representative_copies in copies.items():
+            if representative_id in index.class2:
+                expanded_images.extend(representative_copies)
+                expanded_hashes.extend([index.class2[representative_id]] * len(representative_copies))
+        for k, image_info in enumerate(images):
+            index.class2[id(image_info)] = hash_values[k] if hash_values is not None else None
+    return expanded_images, (expanded_hashes if hash_values is not None else None)
+
+def _phash_from_source(source, decode_mode):
+    """按指定解码方式计算感知哈希（source为文件路径或可seek的文件对象）"""
+    with Image.open(source) as img:
+        if decode_mode == 'draft' and img.format == 'JPEG':
+            # JPEG可按1/2、1/4、1/8缩放直接解码为灰度；pHash只需要 (HASH_SIZE*4)² 的灰度图
+            phash_size = HASH_SIZE * 4
+            img.draft('L', (phash_size, phash_size))
+            img = img.convert('L')
+        else:
+            # 转换为RGB模式（避免RGBA模式问题）
+            img = img.convert('RGB')
+        # 计算感知哈希
+        return imagehash.phash(img, hash_size=HASH_SIZE)
+
+def _read_exif_thumbnail(exif_data):
+    """从APP1 EXIF数据的IFD1中取出内嵌JPEG缩略图，没有则返回None"""
+    if exif_data.startswith(b'Exif\x00\x00'):
+        exif_data = exif_data[6:]
+    if exif_data[:2] == b'II':
+        order = '<'
+    elif exif_data[:2] == b'MM':
+        order = '>'
+    else:
+        return None
+    
+    # IFD0 -> 下一个IFD偏移 -> IFD1
+    ifd0_offset = struct.unpack(order + 'I', exif_data[4:8])[0]
+    entry_count = struct.unpack(order + 'H', exif_data[ifd0_offset:ifd0_offset + 2])[0]
+    next_pos = ifd0_offset + 2 + entry_count * 12
+    ifd1_offset = struct.unpack(order + 'I', exif_data[next_pos:next_pos + 4])[0]
+    if ifd1_offset == 0:
+        return None
+    
+    thumb_offset = thumb_length = None
+    entry_count = struct.unpack(order + 'H', exif_data[ifd1_offset:ifd1_offset + 2])[0]
+    for k in range(entry_count):
+        entry = exif_data[ifd1_offset + 2 + k * 12:ifd1_offset + 14 + k * 12]
+        tag, _, _, value = struct.unpack(order + 'HHII', entry)
+        if tag == 0x0201:  # JPEGInterchangeFormat
+            thumb_offset = value
+        elif tag == 0x0202:  # JPEGInterchangeFormatLength
+            thumb_length = value
+    
+    if not thumb_offset or not thumb_length:
+        return None
+    return exif_data[thumb_offset:thumb_offset + thumb_length]
+
+def _phash_from_exif_thumbnail(source):
+    """用EXIF内嵌缩略图计算哈希；没有缩略图或宽高比与原图不一致时返回None"""
+    try:
+        with Image.open(source) as img:
+            # 只读文件头，不解码主图
+            exif_data = img.info.get('exif')
+            main_width, main_height = img.size
+        if not exif_data:
+            return None
+        
+        thumb_data = _read_exif_thumbnail(exif_data)
+        if not thumb_data:
+            return None
+        
+        with Image.open(io.BytesIO(thumb_data)) as thumb:
+            thumb_width, thumb_height = thumb.size
+            # 加黑边或裁剪过的缩略图和原图内容不一致，不能用
+            if abs(thumb_width / thumb_height - main_width / main_height) > EXIF_THUMBNAIL_ASPECT_TOLERANCE:
+                return None
+            return imagehash.phash(thumb.convert('RGB'), hash_size=HASH_SIZE)
+    except Exception as e:
+        logger.debug(f"读取EXIF缩略图失败: {str(e)}")
+        return None
+
+def calculate_image_hash_with_source(image_info):
+    """计算哈希值并返回来源: (哈希, 'cache' / 'exif_thumbnail' / 'image')，失败时为 (None, None)"""
+    decode_mode = 'draft' if HASH_DECODE_MODE == 'draft' else 'full'
+    # 哈希参数不同算出的哈希不同，缓存键必须包含它们
+    hash_key = f"phash{HASH_SIZE}:{decode_mode}:{HASH_SOURCE}"
+    cache = get_result_cache()
+    if cache is not None:
+        try:
+            cached = cache.get_hash(image_digest(image_info), hash_key)
+            if cached:
+                return imagehash.hex_to_hash(cached), 'cache'
+        except Exception as e:
+            logger.warning(f"读取结果缓存失败 {image_info['path']}: {str(e)}")
+            cache = None
+    
+    try:
+        h, source = None, 'image'
+        with open_image_source(image_info) as f:
+            if HASH_SOURCE == 'exif_thumbnail':
+                h = _phash_from_exif_thumbnail(f)
+                if h is not None:
+                    source = 'exif_thumbnail'
+            if h is None:
+                f.seek(0)
+                h = _phash_from_source(f, decode_mode)
+    except Exception as e:
+        logger.error(f"计算图片哈希值时出错 {image_info['path']}: {str(e)}")
+        return None, None
+    
+    if cache is not None:
+        try:
+            cache.put_hash(image_digest(image_info), hash_key, str(h))
+        except Exception as e:
+            logger.warning(f"写入结果缓存失败 {image_info['path']}: {str(e)}")
+    return h, source
+
 def calculate_image_hash(image_info):
     """计算单张图片的哈希值"""
+    return calculate_image_hash_with_source(image_info)[0]
+
+def _calculate_hash_pair(image_info):
+    """校验模式：同一张图片分别用完整解码和缩放解码计算哈希"""
     try:
-        with Image.open(image_info['path']) as img:
-            # 转换为RGB模式（避免RGBA模式问题）
-            img = img.convert('RGB')
-            # 计算感知哈希
-            h = imagehash.phash(img, hash_size=HASH_SIZE)
-            return h
+        with open_image_source(image_info) as f:
+            full = _phash_from_source(f, 'full')
+            f.seek(0)
+            return full, _phash_from_source(f, 'draft')
     except Exception as e:
         logger.error(f"计算图片哈希值时出错 {image_info['path']}: {str(e)}")
-        return None
+        return None, None
+
+def summarize_decode_validation(hash_pairs):
+    """统计缩放解码与完整解码的哈希差异"""
+    distances = [int(full - draft) for full, draft in hash_pairs if full is not None and draft is not None]
+    differing = [d for d in distances if d > 0]
+    report = {
+        'compared': len(distances),
+        'differing': len(differing),
+        'over_threshold': sum(1 for d in distances if d > HASH_THRESHOLD),
+        'max_distance': max(distances) if distances else 0,
+        'mean_distance': round(sum(distances) / len(distances), 3) if distances else 0.0
+    }
+    logger.info(f"解码校验: 比较 {report['compared']} 张, 哈希不同 {report['differing']} 张, "
+                f"超过阈值 {report['over_threshold']} 张, 最大距离 {report['max_distance']}, "
+                f"平均距离 {report['mean_distance']}")
+    return report
+
+def _collect_results(results, on_progress=None):
+    """取出全部结果，每得到一张调用一次on_progress(已完成张数)"""
+    if on_progress is None:
+        return list(results)
+    collected = []
+    for result in results:
+        collected.append(result)
+        on_progress(len(collected))
+    return collected
+
+def _init_hash_worker(settings):
+    """哈希子进程的initializer：套用父进程的配置"""
+    globals().update(settings)
+
+def hash_pool(workers):
+    """计算哈希的进程池（HASH_POOL_START_METHOD启动，配置与父进程一致）"""
+    settings = {name: globals()[name] for name in HASH_WORKER_SETTINGS}
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(HASH_POOL_START_METHOD),
+                               initializer=_init_hash_worker, initargs=(settings,))
+
+def _map_images(func, image_infos, workers, on_progress=None):
+    """用进程池按输入顺序对每张图片执行func"""
+    workers = min(workers, len(image_infos))
+    if workers <= 1:
+        return _collect_results(map(func, image_infos), on_progress)
+    
+    logger.info(f"使用 {workers} 个进程并行计算 {len(image_infos)} 张图片的哈希值")
+    try:
+        with hash_pool(workers) as executor:
+            # map按提交顺序返回；单张图片的错误在func内部记录并返回None
+            return _collect_results(executor.map(func, image_infos, chunksize=HASH_CHUNK_SIZE), on_progress)
+    except Exception as e:
+        logger.error(f"进程池计算哈希值失败，改为串行计算: {str(e)}")
+        return _collect_results(map(func, image_infos), on_progress)
+
+def calculate_image_hashes(image_infos, workers=None, stats=None, on_progress=None):
+    """用进程池并行计算多张图片的哈希值，结果与输入顺序一致（失败的为None）
+    
+    stats: 可选dict，填入本次各哈希来源的图片数（exif_thumbnail / image / failed）
+    on_progress: 可选回调，每算完一张以已完成张数调用
+    """
+    workers = HASH_WORKERS if workers is None else workers
+    if HASH_DECODE_MODE == 'validate':
+        # 校验模式：结果仍使用完整解码，同时报告缩放解码会改变多少哈希
+        hash_pairs = _map_images(_calculate_hash_pair, image_infos, workers, on_progress)
+        summarize_decode_validation(hash_pairs)
+        return [full for full, _ in hash_pairs]
+    
+    results = _map_images(calculate_image_hash_with_source, image_infos, workers, on_progress)
+    source_counts = defaultdict(int)
+    for _, source in results:
+        source_counts[source or 'failed'] += 1
+    logger.info(f"哈希来源: 缓存 {source_counts['cache']} 张, EXIF缩略图 {source_counts['exif_thumbnail']} 张, "
+                f"原图 {source_counts['image']} 张, 失败 {source_counts['failed']} 张")
+    if stats is not None:
+        stats.update(source_counts)
+    return [h for h, _ in results]
 
 def extract_business_id(path_or_filename):
     """从文件路径或ZIP文件名中提取案件号 - 只取__前面的部分作为真正的案件号"""
@@ -258,8 +780,12 @@ def find_cross_case_similar_photos():
         logger.warning("没有找到任何图片文件")
         return
     
+    # 完全相同的图片只分类一次，结果扇出到副本
+    representatives, duplicate_copies, _ = group_exact_duplicates(image_infos)
+    
     # 使用YOLO模型筛选class2图片
-    class2_images = classify_images_with_yolo(yolo_model, image_infos)
+    class2_images = classify_images_with_yolo(yolo_model, representatives)
+    class2_images, _ = expand_exact_duplicates(class2_images, duplicate_copies)
     
     if not class2_images:
         logger.warning("没有找到任何class2图片")
@@ -269,45 +795,37 @@ def find_cross_case_similar_photos():
     logger.info("正在按案件号分组并计算哈希值...")
     case_groups = defaultdict(list)
     
+    # 从ZIP文件名中提取案件号（这是关键！）
+    hash_targets = []
     for image_info in class2_images:
-        # 从ZIP文件名中提取案件号（这是关键！）
         zip_filename = image_info['source_zip']
         case_id = extract_business_id(zip_filename)
         
         if case_id:  # 只处理能识别案件号的图片
-            hash_value = calculate_image_hash(image_info)
-            if hash_value is not None:
-                case_groups[case_id].append({
-                    'hash': hash_value,
-                    'info': image_info,
-                    'case_id': case_id
-                })
-            else:
-                logger.warning(f"无法计算哈希值: {image_info['path']}")
+            hash_targets.append((case_id, image_info))
         else:
             logger.warning(f"无法从ZIP文件名提取案件号: {zip_filename}")
     
+    hash_values = calculate_image_hashes([image_info for _, image_info in hash_targets])
+    for (case_id, image_info), hash_value in zip(hash_targets, hash_values):
+        if hash_value is not None:
+            case_groups[case_id].append({
+                'hash': hash_value,
+                'info': image_info,
+                'case_id': case_id
+            })
+        else:
+            logger.warning(f"无法计算哈希值: {image_info['path']}")
+    
     logger.info(f"成功分组 {len(case_groups)} 个案件号")
     for case_id, images in case_groups.items():
         logger.info(f"案件号 {case_id}: {len(images)} 张图片")
     
-    # 找出跨案件号的相似图片
+    # 找出跨案件号的相似图片（汉明距离索引，只比较阈值内的候选）
     logger.info("正在查找跨案件号相似图片...")
-    cross_case_duplicates = []
-    case_ids = list(case_groups.keys())
-    
-    for i, case1 in enumerate(case_ids):
-        for j, case2 in enumerate(case_ids):
-            if i < j:  # 避免重复比较 (A vs B 和 B vs A)
-                logger.info(f"比较案件号: {case1} vs {case2}")
-                
-                # 在case1和case2之间找相似图片
-                for img1_data in case_groups[case1]:
-                    for img2_data in case_groups[case2]:
-                        distance = img1_data['hash'] - img2_data['hash']
-                        if distance <= HASH_THRESHOLD:
-                            cross_case_duplicates.append([img1_data, img2_data])
-                            logger.info(f"发现跨案件号相似图片: {case1} <-> {case2}, 距离: {distance}")
+    cross_case_duplicates = find_cross_case_pairs(case_groups, HASH_THRESHOLD, engine=MATCHER_ENGINE)
+    for img1_data, img2_data, distance in cross_case_duplicates:
+        logger.info(f"发现跨案件号相似图片: {img1_data['case_id']} <-> {img2_data['case_id']}, 距离: {distance}")
     
     logger.info(f"共发现 {len(cross_case_duplicates)} 对跨案件号相似图片")
     
@@ -322,13 +840,18 @@ def find_cross_case_similar_photos():
     csv_data = []
     csv_headers = ['组别', '序号', '案件号', '原始文件名', '新文件名', '原始ZIP路径', '来源ZIP文件', 'ZIP内相对路径', '目标路径', 'YOLO分类结果', '汉明距离']
     
-    for group_id, (img1_data, img2_data) in enumerate(cross_case_duplicates, 1):
+    # 传递性合并为连通分量：同一张图在组内只复制一次
+    components = cluster_pairs(cross_case_duplicates)
+    logger.info(f"合并为 {len(components)} 个相似图片组")
+    
+    for group_id, component in enumerate(components, 1):
         # 创建组目录
         group_dir = os.path.join(OUTPUT_DIR, f"cross_case_group_{group_id:03d}")
         os.makedirs(group_dir, exist_ok=True)
+        min_distances = member_min_distances(component)
         
-        # 处理两张相似图片
-        for seq_id, img_data in enumerate([img1_data, img2_data], 1):
+        # 处理组内所有图片
+        for seq_id, (img_data, distance) in enumerate(zip(component['members'], min_distances), 1):
             try:
                 image_info = img_data['info']
                 case_id = img_data['case_id']
@@ -348,10 +871,7 @@ def find_cross_case_similar_photos():
                 
                 # 复制文件
                 dest_path = os.path.join(group_dir, new_name)
-                shutil.copy2(image_info['path'], dest_path)
-                
-                # 计算汉明距离
-                distance = img1_data['hash'] - img2_data['hash']
+                materialize(image_info, dest_path)
                 
                 # 添加到CSV数据
                 csv_data.append([
@@ -365,7 +885,7 @@ def find_cross_case_similar_photos():
                     image_info['relative_path'],  # ZIP内相对路径
                     dest_path,  # 目标路径
                     "class2",  # YOLO分类结果
-                    distance  # 汉明距离
+                    distance  # 汉明距离（到组内最相似图片）
                 ])
                 
             except Exception as e:
@@ -390,7 +910,7 @@ def find_cross_case_similar_photos():
         except Exception as e:
             logger.error(f"清理临时目录时出错 {temp_dir}: {str(e)}")
     
-    logger.info(f"完成！共找到 {len(cross_case_duplicates)} 对跨案件号相似图片")
+    logger.info(f"完成！共找到 {len(cross_case_duplicates)} 对跨案件号相似图片，{len(components)} 个相似图片组")
     logger.info(f"结果保存在: {OUTPUT_DIR}")
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+"""
+持久化pHash库 - 跨会话的增量哈希记录
+每次上传只算一次哈希，同时和本次上传以及全部历史记录比对
+"""
+
+import os
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class HashCorpus:
+    """SQLite哈希库：案件号 + 来源ZIP + ZIP内路径 + 哈希值，只追加不修改"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS hashes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    case_id TEXT NOT NULL,
+                    source_zip TEXT NOT NULL,
+                    relative_path TEXT NOT NULL,
+                    hash_bits INTEGER NOT NULL,
+                    hash BLOB NOT NULL,
+                    session_id TEXT,
+                    added_at TEXT,
+                    UNIQUE(source_zip, relative_path, hash)
+                )
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:  # 正常退出自动提交，异常回滚
+                yield conn
+        finally:
+            conn.close()
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def load(self, hash_bits, session_id=None, exclude=()):
+        """加载全部历史记录，格式与process_similarity的case_groups条目一致
+
+        只返回位数相同的哈希（HASH_SIZE变过之后旧哈希不可比）
+        session_id: 不返回这个任务自己写入的记录（任务重试时）
+        exclude: (来源ZIP, ZIP内路径) 集合，本次上传里的图片不返回，重复上传时不会和自己的旧记录配对
+        """
+        exclude = set(exclude)
+        entries = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT case_id, source_zip, relative_path, hash, session_id FROM hashes WHERE hash_bits = ? ORDER BY id',
+                (hash_bits,)
+            )
+            for case_id, source_zip, relative_path, hash_blob, row_session in rows:
+                if (session_id and row_session == session_id) or (source_zip, relative_path) in exclude:
+                    continue
+                entries.append({
+                    'hash': int.from_bytes(hash_blob, 'big'),
+                    'case_id': case_id,
+                    'info': {
+                        'path': None,  # 历史图片已不在磁盘上
+                        'source_zip': source_zip,
+                        'relative_path': relative_path,
+                        'historical': True,
+                        'session_id': row_session
+                    }
+                })
+        return entries
+
+    def add(self, entries, hash_bits, session_id=''):
+        """追加本次上传的哈希记录，已存在的（同ZIP同路径同哈希）自动跳过"""
+        added_at = datetime.now().isoformat()
+        rows = [
+            (img_data['case_id'],
+             img_data['info'].get('source_zip', ''),
+             img_data['info'].get('relative_path', ''),
+             hash_bits,
+             img_data['hash'].to_bytes((hash_bits + 7) // 8, 'big'),
+             session_id,
+             added_at)
+            for img_data in entries
+        ]
+        with self._lock, self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO hashes (case_id, source_zip, relative_path, hash_bits, hash, session_id, added_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            added = conn.total_changes - before
+        logger.info(f"哈希库新增 {added} 条记录（跳过 {len(rows) - added} 条重复）")
+        return added
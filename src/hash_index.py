@@ -0,0 +1,283 @@
+"""
+汉明距离索引 - 跨案件号相似图片的近邻搜索
+用度量树替代四重循环：只比较可能在阈值内的哈希，不做无用功
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUMPY_BLOCK_SIZE = 512  # 向量化比较的分块大小（512x512的uint64距离矩阵约2MB，放得进L2缓存）
+
+
+def hash_to_int(hash_value):
+    """把ImageHash转换为整数（已是整数则原样返回）"""
+    if isinstance(hash_value, int):
+        return hash_value
+    # ImageHash的十六进制表示按位从高到低排列
+    return int(str(hash_value), 16)
+
+
+def hash_bit_length(hash_value):
+    """哈希的位数（ImageHash取矩阵大小，整数取实际位长）"""
+    if isinstance(hash_value, int):
+        return hash_value.bit_length()
+    return hash_value.hash.size
+
+
+def hamming_distance(a, b):
+    """两个整数哈希之间的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """BK树 - 以汉明距离为度量的度量树
+
+    节点结构: [哈希值, [条目ID列表], {距离: 子节点}]
+    相同哈希的条目挂在同一节点上，不重复建节点
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, hash_int, item_id):
+        """插入一个哈希值及其条目ID"""
+        self._size += 1
+        if self._root is None:
+            self._root = [hash_int, [item_id], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_int, node[0])
+            if distance == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_int, [item_id], {}]
+                return
+            node = child
+
+    def query(self, hash_int, threshold):
+        """返回所有距离≤threshold的 (条目ID, 距离)"""
+        if self._root is None:
+            return []
+
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_int, node[0])
+            if distance <= threshold:
+                matches.extend((item_id, distance) for item_id in node[1])
+            # 三角不等式：只有 |d - threshold| 范围内的子树可能命中
+            low, high = distance - threshold, distance + threshold
+            for child_distance, child in node[2].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        return matches
+
+
+def _pairs_brute(hashes, cases, threshold, hash_bits, n_query):
+    """暴力比较 - 与原四重循环等价，作为正确性基准"""
+    pairs = []
+    count = len(hashes)
+    for i in range(n_query):
+        for j in range(i + 1, count):
+            if cases[i] == cases[j]:
+                continue
+            distance = hamming_distance(hashes[i], hashes[j])
+            if distance <= threshold:
+                pairs.append((i, j, distance))
+    return pairs
+
+
+def _pairs_bktree(hashes, cases, threshold, hash_bits, n_query):
+    """BK树：先插入历史条目，再逐个查询已插入的条目后插入自己，每对只命中一次"""
+    tree = BKTree()
+    for i in range(n_query, len(hashes)):
+        tree.add(hashes[i], i)
+
+    pairs = []
+    for j in range(n_query):
+        for i, distance in tree.query(hashes[j], threshold):
+            if cases[i] != cases[j]:
+                pairs.append((min(i, j), max(i, j), distance))
+        tree.add(hashes[j], j)
+    return pairs
+
+
+def split_bands(hash_bits, band_count):
+    """把hash_bits位均分为band_count段，返回每段的 (位移, 掩码)"""
+    band_count = max(1, min(band_count, hash_bits))
+    bands = []
+    start = 0
+    for b in range(band_count):
+        width = hash_bits // band_count + (1 if b < hash_bits % band_count else 0)
+        bands.append((start, (1 << width) - 1))
+        start += width
+    return bands
+
+
+def _pairs_mih(hashes, cases, threshold, hash_bits, n_query):
+    """多索引哈希：切成threshold+1段，每段一张哈希表
+
+    鸽巢原理：距离≤threshold的两个哈希至少有一段完全相同，
+    所以只需验证至少撞上一段的候选，召回率不变
+    """
+    bands = split_bands(hash_bits, threshold + 1)
+    tables = [{} for _ in bands]
+
+    def band_keys(hash_int):
+        return [(hash_int >> shift) & mask for shift, mask in bands]
+
+    for i in range(n_query, len(hashes)):
+        for table, key in zip(tables, band_keys(hashes[i])):
+            table.setdefault(key, []).append(i)
+
+    pairs = []
+    for j in range(n_query):
+        hash_int = hashes[j]
+        keys = band_keys(hash_int)
+
+        candidates = set()
+        for table, key in zip(tables, keys):
+            bucket = table.get(key)
+            if bucket:
+                candidates.update(bucket)
+
+        for i in candidates:
+            if cases[i] == cases[j]:
+                continue
+            distance = hamming_distance(hashes[i], hash_int)
+            if distance <= threshold:
+                pairs.append((min(i, j), max(i, j), distance))
+
+        for table, key in zip(tables, keys):
+            table.setdefault(key, []).append(j)
+    return pairs
+
+
+def pack_hashes(hashes, hash_bits):
+    """把整数哈希打包成 (N, 字数) 的uint64矩阵，低位字在前"""
+    words = (hash_bits + 63) // 64
+    mask = (1 << 64) - 1
+    packed = np.empty((len(hashes), words), dtype=np.uint64)
+    for w in range(words):
+        packed[:, w] = [(h >> (64 * w)) & mask for h in hashes]
+    return packed
+
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(values):
+        return np.bitwise_count(values)
+else:
+    # numpy<2.0没有bitwise_count，按字节查表
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        counts = _POPCOUNT_TABLE[values.view(np.uint8)]
+        return counts.reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def _case_ranges(cases):
+    """展开后同一案件的条目连续排列，返回每个案件的 [start, end)"""
+    ranges = []
+    start = 0
+    for i in range(1, len(cases) + 1):
+        if i == len(cases) or cases[i] != cases[start]:
+            ranges.append((start, i))
+            start = i
+    return ranges
+
+
+def _block_pairs(packed, cases, threshold, a_range, b_range, check_cases):
+    """计算 A块 x B块 的距离矩阵，只返回阈值内（且跨案件）的条目对"""
+    a_start, a_end = a_range
+    b_start, b_end = b_range
+    xor = packed[a_start:a_end, None, :] ^ packed[None, b_start:b_end, :]
+    distances = _popcount(xor).sum(axis=-1, dtype=np.int32)
+    hits = distances <= threshold
+    if check_cases:
+        hits &= cases[a_start:a_end, None] != cases[None, b_start:b_end]
+    rows, cols = np.nonzero(hits)
+    return zip((rows + a_start).tolist(), (cols + b_start).tolist(), distances[rows, cols].tolist())
+
+
+def _pairs_numpy(hashes, cases, threshold, hash_bits, n_query):
+    """向量化暴力比较：XOR+popcount，按 案件A块 x 案件B块 分块计算
+
+    仍是O(N²)，但每次比较都在numpy里完成，可作为索引引擎的正确性基准
+    """
+    if not hashes:
+        return []
+
+    packed = pack_hashes(hashes, hash_bits)
+    case_array = np.asarray(cases)
+    ranges = _case_ranges(cases[:n_query])
+    block = NUMPY_BLOCK_SIZE
+    pairs = []
+
+    for a, (a_start, a_end) in enumerate(ranges):
+        for i0 in range(a_start, a_end, block):
+            a_block = (i0, min(i0 + block, a_end))
+            # 本次上传内：不同案件的连续区间，无需逐元素判断案件号
+            for b_start, b_end in ranges[a + 1:]:
+                for j0 in range(b_start, b_end, block):
+                    pairs.extend(_block_pairs(packed, case_array, threshold, a_block,
+                                              (j0, min(j0 + block, b_end)), check_cases=False))
+            # 历史记录：案件号可能与本次上传重复，逐元素过滤
+            for j0 in range(n_query, len(hashes), block):
+                pairs.extend(_block_pairs(packed, case_array, threshold, a_block,
+                                          (j0, min(j0 + block, len(hashes))), check_cases=True))
+    return pairs
+
+
+MATCHER_ENGINES = {
+    'brute': _pairs_brute,
+    'bktree': _pairs_bktree,
+    'mih': _pairs_mih,
+    'numpy': _pairs_numpy,
+}
+
+
+def find_cross_case_pairs(case_groups, threshold, engine='bktree', history=None):
+    """找出跨案件号的相似图片对
+
+    case_groups: {案件号: [{'hash': ..., 'info': ..., 'case_id': ...}, ...]}
+    history: 历史条目列表（格式同上），只与本次上传比对，历史之间不再重复比对
+    返回: [(img1_data, img2_data, 汉明距离), ...]，涉及历史时img2_data为历史条目
+    顺序与原四重循环一致：案件对(i<j) -> case1内图片 -> case2内图片
+    """
+    if engine not in MATCHER_ENGINES:
+        raise ValueError(f"未知的匹配引擎: {engine}，可选: {', '.join(MATCHER_ENGINES)}")
+    history = history or []
+
+    # 按案件号顺序展开，同一案件的条目连续排列；历史条目排在最后
+    items, hashes, cases = [], [], []
+    case_index = {}
+    hash_bits = 64
+    for case_id in case_groups:
+        case_index[case_id] = len(case_index)
+        items.extend(case_groups[case_id])
+    n_query = len(items)
+    items.extend(history)
+
+    for img_data in items:
+        hashes.append(hash_to_int(img_data['hash']))
+        cases.append(case_index.setdefault(img_data['case_id'], len(case_index)))
+        hash_bits = max(hash_bits, hash_bit_length(img_data['hash']))
+
+    index_pairs = MATCHER_ENGINES[engine](hashes, cases, threshold, hash_bits, n_query)
+    index_pairs.sort(key=lambda p: (cases[p[0]], cases[p[1]], p[0], p[1]))
+
+    logger.info(f"匹配引擎 {engine}: {n_query} 张图片（历史 {len(history)} 张）, {len(case_groups)} 个案件号, "
+                f"发现 {len(index_pairs)} 对跨案件号相似图片")
+    return [(items[i], items[j], distance) for i, j, distance in index_pairs]
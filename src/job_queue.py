@@ -0,0 +1,296 @@
+"""
+持久化任务队列 - SQLite记录任务状态，独立的worker进程领取并执行
+Web进程只负责接收上传和入队；服务或容器重启后，排队中和执行中的任务不会丢失
+"""
+
+import os
+import time
+import queue
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+STATES = ('queued', 'running', 'done', 'failed')
+UPLOAD_ABORTED = 'aborted'  # ZIP输入队列里表示上传已放弃（None表示正常结束）
+
+
+class JobQueue:
+    """任务状态机: queued -> running -> done / failed
+
+    worker定期更新心跳；心跳超时的running任务视为worker已死，重新排队（超过max_attempts次则失败）
+    分块上传的任务边上传边处理：收齐的ZIP记在job_archives表里，worker轮询领取
+    模型预热完成的worker登记在workers表里，web进程据此判断能否接收任务（/readyz）
+    """
+
+    def __init__(self, db_path, max_attempts=3):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')  # web进程读状态时不阻塞worker写
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    chunked INTEGER NOT NULL DEFAULT 0,
+                    input_closed INTEGER NOT NULL DEFAULT 1,
+                    archives_expected INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, created_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS job_archives (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    zip_path TEXT NOT NULL,
+                    zip_name TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_job_archives_job ON job_archives(job_id, id)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    ready_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL
+                )
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:  # 正常退出自动提交，异常回滚
+                yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, job_id, chunked=False):
+        """任务入队；分块上传的任务在close_input之前还会继续收到ZIP"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (job_id, state, chunked, input_closed, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, 'queued', int(chunked), int(not chunked), time.time())
+            )
+        logger.info(f"任务入队: {job_id}")
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def counts(self):
+        """各状态的任务数"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update({state: n for state, n in rows})
+        return counts
+
+    def claim(self, worker_id):
+        """领取最早排队的任务并标记为running；没有任务时返回None"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            # IMMEDIATE先拿写锁，多个worker不会领到同一个任务
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET state = 'running', worker_id = ?, attempts = attempts + 1, "
+                "started_at = ?, heartbeat_at = ? WHERE job_id = ?",
+                (worker_id, now, now, row['job_id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        job = dict(row)
+        job.update({'state': 'running', 'worker_id': worker_id, 'attempts': job['attempts'] + 1})
+        return job
+
+    def heartbeat(self, job_id, worker_id):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND worker_id = ? AND state = 'running'",
+                         (now, job_id, worker_id))
+            conn.execute('UPDATE workers SET heartbeat_at = ? WHERE worker_id = ?', (now, worker_id))
+
+    def finish(self, job_id, worker_id, error=None):
+        """记录任务结果；任务已被别的worker接手时不覆盖"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE job_id = ? AND worker_id = ? AND state = 'running'",
+                ('failed' if error else 'done', error, time.time(), job_id, worker_id)
+            )
+
+    def requeue_stale(self, timeout):
+        """心跳超时的running任务重新排队，重试次数用完的标记失败（顺带清掉心跳超时的worker登记）；返回重新排队的任务ID"""
+        deadline = time.time() - timeout
+        with self._connect() as conn:
+            stale = conn.execute(
+                "SELECT job_id, attempts FROM jobs WHERE state = 'running' AND heartbeat_at < ?", (deadline,)
+            ).fetchall()
+            requeued = []
+            for row in stale:
+                if row['attempts'] >= self.max_attempts:
+                    conn.execute("UPDATE jobs SET state = 'failed', error = ?, finished_at = ? WHERE job_id = ?",
+                                 ('worker中断次数过多', time.time(), row['job_id']))
+                else:
+                    conn.execute("UPDATE jobs SET state = 'queued', worker_id = NULL WHERE job_id = ?", (row['job_id'],))
+                    requeued.append(row['job_id'])
+            conn.execute('DELETE FROM workers WHERE heartbeat_at < ?', (deadline,))
+        for job_id in requeued:
+            logger.warning(f"任务 {job_id} 的worker心跳超时，重新排队")
+        return requeued
+
+    # 已就绪的worker
+    def worker_ready(self, worker_id):
+        """登记worker已就绪（模型已预热），空闲时定期再调用一次作为心跳"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO workers (worker_id, ready_at, heartbeat_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at',
+                (worker_id, now, now)
+            )
+
+    def worker_gone(self, worker_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM workers WHERE worker_id = ?', (worker_id,))
+
+    def ready_workers(self, timeout):
+        """心跳未超时的已就绪worker数；执行任务期间由任务心跳顺带更新"""
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?',
+                                (time.time() - timeout,)).fetchone()[0]
+
+    # 分块上传的输入
+    def add_archives(self, job_id, zip_files):
+        with self._connect() as conn:
+            conn.executemany('INSERT INTO job_archives (job_id, zip_path, zip_name) VALUES (?, ?, ?)',
+                             [(job_id, zip_path, zip_name) for zip_path, zip_name in zip_files])
+
+    def close_input(self, job_id):
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET input_closed = 1 WHERE job_id = ?', (job_id,))
+
+    def abort_input(self, job_id, error):
+        """放弃分块上传：还没被领取的任务直接失败，执行中的由worker读到error后结束"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET input_closed = 1, error = ? WHERE job_id = ? AND state IN ('queued', 'running')",
+                         (error, job_id))
+            conn.execute("UPDATE jobs SET state = 'failed', finished_at = ? WHERE job_id = ? AND state = 'queued'",
+                         (time.time(), job_id))
+
+    def set_expected(self, job_id, archives_expected):
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET archives_expected = ? WHERE job_id = ?', (archives_expected, job_id))
+
+    def archives_after(self, job_id, last_id):
+        """last_id之后收到的ZIP: [(id, 路径, 文件名)]"""
+        with self._connect() as conn:
+            return [tuple(row) for row in conn.execute(
+                'SELECT id, zip_path, zip_name FROM job_archives WHERE job_id = ? AND id > ? ORDER BY id',
+                (job_id, last_id)
+            )]
+
+
+class DurableArchiveQueue:
+    """与queue.Queue接口相同的ZIP输入队列，内容存在JobQueue里
+
+    web进程put（收齐一个ZIP / None表示上传结束 / UPLOAD_ABORTED表示放弃），worker进程get；
+    worker重启后从头读取，任务重新执行时不会漏掉已上传的ZIP
+    """
+
+    def __init__(self, job_queue, job_id, status=None, poll_interval=1.0):
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.status = status
+        self.poll_interval = poll_interval
+        self._last_id = 0
+        self._closed = False
+
+    def put(self, zip_files):
+        if zip_files is None:
+            self.job_queue.close_input(self.job_id)
+        elif zip_files == UPLOAD_ABORTED:
+            self.job_queue.abort_input(self.job_id, '上传已取消')
+        else:
+            self.job_queue.add_archives(self.job_id, zip_files)
+
+    def _poll(self):
+        job = self.job_queue.get(self.job_id)
+        if self.status is not None and job:
+            self.status['archives_expected'] = max(self.status.get('archives_expected', 0), job['archives_expected'])
+        if job and job['input_closed'] and job['error']:
+            return UPLOAD_ABORTED, True
+        archives = self.job_queue.archives_after(self.job_id, self._last_id)
+        return archives, bool(job and job['input_closed'])
+
+    def empty(self):
+        archives, closed = self._poll()
+        return not archives and not closed
+
+    def get(self, block=True, timeout=None):
+        """一次取出所有新到的ZIP；上传结束且都取完后返回None，上传已放弃时返回UPLOAD_ABORTED"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            archives, closed = self._poll()
+            if archives == UPLOAD_ABORTED:
+                return UPLOAD_ABORTED
+            if archives:
+                self._last_id = archives[-1][0]
+                return [(zip_path, zip_name) for _, zip_path, zip_name in archives]
+            if closed and not self._closed:
+                self._closed = True
+                return None
+            if not block or (deadline is not None and time.monotonic() >= deadline):
+                raise queue.Empty
+            time.sleep(self.poll_interval)
+
+
+class Heartbeat:
+    """后台线程定期更新任务心跳，with块结束时停止"""
+
+    def __init__(self, job_queue, job_id, worker_id, interval):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(job_queue, job_id, worker_id, interval), daemon=True
+        )
+
+    def _run(self, job_queue, job_id, worker_id, interval):
+        while not self._stop.wait(interval):
+            try:
+                job_queue.heartbeat(job_id, worker_id)
+            except Exception as e:
+                logger.warning(f"更新任务心跳失败 {job_id}: {str(e)}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,255 @@
+"""
+多任务管理 - 每次上传一个任务：独立的任务ID、工作目录和状态
+任务状态持久化到 results/<任务ID>/status.json，服务重启后仍可查询结果
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STATUS_FILE = 'status.json'
+STATUS_SAVE_INTERVAL = 1.0  # 进度更新时最多每秒写一次状态文件
+
+
+def new_status(job_id):
+    """新任务的初始状态"""
+    return {
+        'job_id': job_id,
+        'state': 'queued',
+        'is_processing': True,
+        'current_step': '排队等待',
+        'progress': 0,
+        'total_images': 0,
+        'class2_images': 0,
+        'groups_found': 0,
+        'error': None,
+        'session_id': job_id,
+        'start_time': datetime.now().isoformat(),
+        'archives_expected': 0,
+        'archives_processed': 0
+    }
+
+
+class Job:
+    """一个处理任务：uploads/<任务ID> 放上传的ZIP，results/<任务ID> 放结果和状态"""
+
+    def __init__(self, job_id, upload_dir, results_dir, status=None):
+        self.job_id = job_id
+        self.upload_dir = upload_dir
+        self.results_dir = results_dir
+        self.status = status or new_status(job_id)
+        self._last_saved = 0.0
+        self._save_lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._version = 0
+
+        # 分块上传：任务本身就是上传批次
+        self.archive_queue = None
+        self.upload_store = None
+        self.upload_files = set()
+        self.upload_finished = False
+
+    @property
+    def is_active(self):
+        return self.status.get('state') in ('queued', 'running')
+
+    def save(self, force=False):
+        """写状态文件；进度回调里频繁调用时按STATUS_SAVE_INTERVAL节流（进度推送不受节流影响）"""
+        self.notify()
+        now = time.monotonic()
+        if not force and now - self._last_saved < STATUS_SAVE_INTERVAL:
+            return
+        with self._save_lock:
+            self._last_saved = now
+            os.makedirs(self.results_dir, exist_ok=True)
+            status_path = os.path.join(self.results_dir, STATUS_FILE)
+            tmp_path = status_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.status, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, status_path)
+
+    def notify(self):
+        """状态有变化，唤醒等待进度推送的连接"""
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    def wait_change(self, timeout, version=None):
+        """等到状态有变化（相对version，默认为当前）或超时，返回最新版本号"""
+        with self._changed:
+            version = self._version if version is None else version
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def reload(self):
+        """从状态文件重新读取（状态由另一个进程里的worker写入时）"""
+        try:
+            with open(os.path.join(self.results_dir, STATUS_FILE), encoding='utf-8') as f:
+                self.status = json.load(f)
+        except (OSError, ValueError):
+            pass
+        return self
+
+    def remove(self):
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+        shutil.rmtree(self.results_dir, ignore_errors=True)
+
+
+class JobManager:
+    """创建、查找和调度任务
+
+    同时运行的任务数不超过max_concurrent，多出的任务排队；
+    只保留最近keep_jobs个已结束任务的工作目录
+    external_workers: 任务由独立的worker进程执行（见job_queue），状态以磁盘上的状态文件为准
+    """
+
+    def __init__(self, upload_root, results_root, max_concurrent=1, keep_jobs=20, external_workers=False):
+        # 绝对路径：send_file会把相对路径当成相对于应用目录而不是工作目录
+        self.upload_root = os.path.abspath(upload_root)
+        self.results_root = os.path.abspath(results_root)
+        self.keep_jobs = keep_jobs
+        self.external_workers = external_workers
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        os.makedirs(self.upload_root, exist_ok=True)
+        os.makedirs(self.results_root, exist_ok=True)
+        self._load_existing()
+
+    def _read_job(self, job_id):
+        """从磁盘读取任务；没有状态文件时返回None"""
+        job = Job(job_id, os.path.join(self.upload_root, job_id), os.path.join(self.results_root, job_id))
+        if not os.path.exists(os.path.join(job.results_dir, STATUS_FILE)):
+            return None
+        return job.reload()
+
+    def _load_existing(self):
+        """加载磁盘上已有的任务；进程内执行时，重启前没跑完的任务标记为失败（worker模式下由队列负责恢复）"""
+        loaded = []
+        for job_id in os.listdir(self.results_root):
+            job = self._read_job(job_id)
+            if job is None:
+                continue
+            if job.is_active and not self.external_workers:
+                job.status.update({'state': 'failed', 'is_processing': False, 'error': '服务重启，处理中断'})
+                job.save(force=True)
+            loaded.append(job)
+        for job in sorted(loaded, key=lambda job: job.status.get('start_time', '')):
+            self._jobs[job.job_id] = job
+        if loaded:
+            logger.info(f"加载了 {len(loaded)} 个历史任务")
+
+    def create(self):
+        """新建任务及其工作目录"""
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, os.path.join(self.upload_root, job_id), os.path.join(self.results_root, job_id))
+        os.makedirs(job.upload_dir, exist_ok=True)
+        os.makedirs(job.results_dir, exist_ok=True)
+        job.save(force=True)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id):
+        """按ID取任务；external_workers时状态从磁盘重新读取，别的进程创建的任务也能查到"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if self.external_workers:
+            if job is None:
+                return self.load(job_id)
+            job.reload()
+        return job
+
+    def load(self, job_id):
+        """按ID取任务，内存里没有时从磁盘读取（worker领取web进程创建的任务）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and os.path.basename(job_id) == job_id and job_id not in ('', '.', '..'):
+            job = self._read_job(job_id)
+            if job is not None:
+                with self._lock:
+                    job = self._jobs.setdefault(job_id, job)
+        return job
+
+    def latest(self):
+        """最近创建的任务（兼容不带任务ID的旧接口）"""
+        with self._lock:
+            return next(reversed(self._jobs.values()), None)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def run(self, job, target, *args, reserved=False):
+        """在当前线程执行 target(job, *args)，没有空闲名额时等待；结束后记录最终状态
+
+        reserved: 名额已由acquire_slot占好（worker先占名额再领取任务）
+        """
+        if not reserved:
+            self._slots.acquire()
+        try:
+            job.status.update({'state': 'running', 'is_processing': True, 'current_step': '开始处理'})
+            job.save(force=True)
+            try:
+                target(job, *args)
+            finally:
+                job.status['is_processing'] = False
+                job.status['state'] = 'failed' if job.status.get('error') else 'done'
+                job.save(force=True)
+        finally:
+            self._slots.release()
+
+    def acquire_slot(self, timeout=None):
+        """预先占一个名额，成功后用 run(..., reserved=True) 执行；用不上时release_slot"""
+        return self._slots.acquire(timeout=timeout)
+
+    def release_slot(self):
+        self._slots.release()
+
+    @contextmanager
+    def waiting(self, job):
+        """run里的任务等待外部输入（分块上传的下一个ZIP）期间让出名额，等到后重新占用
+
+        没有空闲名额时状态显示为排队，和新任务一样等待
+        """
+        self._slots.release()
+        try:
+            yield
+        finally:
+            if not self._slots.acquire(blocking=False):
+                job.status['current_step'] = '排队等待'
+                job.save(force=True)
+                self._slots.acquire()
+
+    def start(self, job, target, *args):
+        """后台线程执行任务，见run"""
+        thread = threading.Thread(target=self.run, args=(job, target) + args,
+                                  name=f'job-{job.job_id[:8]}', daemon=True)
+        thread.start()
+        return thread
+
+    def _prune(self):
+        """删除超出保留数量的最早的已结束任务"""
+        if self.external_workers:
+            for job in self.jobs():
+                if job.is_active:
+                    job.reload()
+        with self._lock:
+            finished = [job for job in self._jobs.values() if not job.is_active]
+            stale = finished[:max(0, len(finished) - self.keep_jobs)]
+            for job in stale:
+                del self._jobs[job.job_id]
+        for job in stale:
+            job.remove()
+        if stale:
+            logger.info(f"清理了 {len(stale)} 个旧任务的工作目录")
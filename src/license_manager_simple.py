@@ -10,8 +10,15 @@ import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
+from contextlib import contextmanager
+import threading
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows：单进程运行，线程锁就够了
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -49,10 +56,38 @@ class LicenseManager:
         # 内存中的状态
         self._usage_records: List[UsageRecord] = []
         self._current_license: Optional[LicenseInfo] = None
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
         self._load_data()
     
+    @contextmanager
+    def _locked(self):
+        """多个进程（serve.py、worker.py）都会记录使用量，读改写整个过程加文件锁"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.data_dir, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _usage_mtime(self):
+        try:
+            return os.stat(self.usage_log_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _reload_if_changed(self):
+        """使用记录被别的进程更新过时重新加载，哈希链才能接在最新一条后面"""
+        if self._usage_mtime() != self._loaded_mtime:
+            self._load_data()
+    
     def _load_data(self):
         """加载现有数据"""
+        self._loaded_mtime = self._usage_mtime()
         # 加载使用记录
         if os.path.exists(self.usage_log_file):
             try:
@@ -135,6 +170,11 @@ class LicenseManager:
     
     def record_usage(self, images_processed: int, session_id: str, start_time: str, end_time: str) -> bool:
         """记录使用量"""
+        with self._locked():
+            self._reload_if_changed()
+            return self._append_usage(images_processed, session_id, start_time, end_time)
+    
+    def _append_usage(self, images_processed: int, session_id: str, start_time: str, end_time: str) -> bool:
         try:
             timestamp = datetime.now().isoformat()
             
@@ -167,6 +207,7 @@ class LicenseManager:
             
             # 保存使用记录
             self._save_usage_records()
+            self._loaded_mtime = self._usage_mtime()
             
             logger.info(f"已记录使用量: {images_processed} 张图片")
             return True
@@ -303,6 +344,7 @@ class LicenseManager:
     
     def get_usage_stats(self) -> Dict:
         """获取使用统计信息"""
+        self._reload_if_changed()
         stats = {
             "total_records": len(self._usage_records),
             "total_images_processed": sum(record.images_processed for record in self._usage_records),
@@ -0,0 +1,153 @@
+"""
+CPU推理后端 - 把YOLO分类权重导出为ONNX，用ONNX Runtime或OpenVINO推理，不需要torch
+导出结果放在权重文件旁边，文件名带权重校验和，只在换了权重时重新导出
+
+推理结果与ultralytics相同的形状：results[i].probs.data 为各类别概率，
+predict_class2_probabilities / classify_images_with_yolo 不用区分后端
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import logging
+
+import numpy as np
+from PIL import Image
+
+from result_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+RUNTIMES = ('onnxruntime', 'openvino')
+DEFAULT_IMGSZ = 224  # ultralytics分类模型的默认输入边长
+
+
+def export_paths(weights_path, digest=None):
+    """(ONNX路径, 元数据路径)：<权重名>.<校验和前16位>.onnx / .json"""
+    digest = digest or file_digest(weights_path)
+    base = f"{os.path.splitext(weights_path)[0]}.{digest[:16]}"
+    return base + '.onnx', base + '.json'
+
+
+def export_onnx(weights_path):
+    """导出ONNX（已导出过则直接返回路径）；导出需要ultralytics，之后推理不再需要"""
+    onnx_path, meta_path = export_paths(weights_path)
+    if os.path.exists(onnx_path) and os.path.exists(meta_path):
+        return onnx_path
+
+    from ultralytics import YOLO
+
+    logger.info(f"导出ONNX模型: {weights_path} -> {onnx_path}")
+    # 在临时目录里导出再改名，多个进程同时导出也不会读到写了一半的文件
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(weights_path))) as tmp_dir:
+        tmp_weights = os.path.join(tmp_dir, os.path.basename(weights_path))
+        shutil.copyfile(weights_path, tmp_weights)
+        model = YOLO(tmp_weights)
+        imgsz = model.overrides.get('imgsz') or DEFAULT_IMGSZ
+        if isinstance(imgsz, (list, tuple)):
+            imgsz = imgsz[0]
+        exported = model.export(format='onnx', imgsz=imgsz, dynamic=True)
+        meta = {'names': {int(k): v for k, v in model.names.items()}, 'imgsz': int(imgsz)}
+        tmp_meta = os.path.join(tmp_dir, 'meta.json')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(exported, onnx_path)
+        os.replace(tmp_meta, meta_path)
+    return onnx_path
+
+
+def load_metadata(onnx_path):
+    """导出时记录的类别名和输入边长"""
+    with open(os.path.splitext(onnx_path)[0] + '.json', 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return {int(k): v for k, v in meta['names'].items()}, int(meta['imgsz'])
+
+
+def preprocess(image, imgsz):
+    """与ultralytics分类预处理一致：短边缩放到imgsz（双线性）-> 中心裁剪 -> CHW float32，范围0~1"""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    w, h = image.size
+    if w <= h:
+        size = (imgsz, int(imgsz * h / w))
+    else:
+        size = (int(imgsz * w / h), imgsz)
+    if size != (w, h):
+        image = image.resize(size, Image.BILINEAR)
+    left = int(round((size[0] - imgsz) / 2.0))
+    top = int(round((size[1] - imgsz) / 2.0))
+    image = image.crop((left, top, left + imgsz, top + imgsz))
+    return np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+
+
+class Probs:
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def top1(self):
+        return int(self.data.argmax())
+
+    @property
+    def top1conf(self):
+        return float(self.data[self.top1])
+
+
+class ClassifyResult:
+    def __init__(self, names, probs):
+        self.names = names
+        self.probs = Probs(probs)
+
+
+class OnnxClassifier:
+    """用法同ultralytics的YOLO分类模型：model(images, verbose=False) -> [ClassifyResult]
+
+    intra_op_threads: 单次推理内部并行的线程数；inter_op_threads: 同时执行的算子数
+    （OpenVINO下为推理流数）。推理本身已经串行（group3._model_lock），inter_op保持1即可
+    """
+
+    def __init__(self, onnx_path, runtime='onnxruntime', intra_op_threads=None, inter_op_threads=1):
+        if runtime not in RUNTIMES:
+            raise ValueError(f"未知的推理后端: {runtime}")
+        self.onnx_path = onnx_path
+        self.runtime = runtime
+        self.names, self.imgsz = load_metadata(onnx_path)
+        intra_op_threads = intra_op_threads or os.cpu_count() or 1
+        if runtime == 'onnxruntime':
+            self._infer = self._onnxruntime(onnx_path, intra_op_threads, inter_op_threads)
+        else:
+            self._infer = self._openvino(onnx_path, intra_op_threads, inter_op_threads)
+        logger.info(f"{runtime} 推理会话已创建: {onnx_path}（{intra_op_threads} 线程，输入 {self.imgsz}）")
+
+    @staticmethod
+    def _onnxruntime(onnx_path, intra_op_threads, inter_op_threads):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+        return lambda batch: session.run(None, {input_name: batch})[0]
+
+    @staticmethod
+    def _openvino(onnx_path, intra_op_threads, inter_op_threads):
+        import openvino as ov
+
+        compiled = ov.Core().compile_model(onnx_path, 'CPU', {
+            'INFERENCE_NUM_THREADS': intra_op_threads,
+            'NUM_STREAMS': inter_op_threads,
+            'PERFORMANCE_HINT': 'LATENCY'
+        })
+        output = compiled.output(0)
+        return lambda batch: compiled([batch])[output]
+
+    def __call__(self, images, verbose=False):
+        if isinstance(images, Image.Image):
+            images = [images]
+        batch = np.stack([preprocess(image, self.imgsz) for image in images])
+        probs = np.asarray(self._infer(batch), dtype=np.float32)
+        return [ClassifyResult(self.names, row) for row in probs]
@@ -0,0 +1,253 @@
+"""
+流水线处理 - 读图、分类、哈希三个阶段重叠执行
+读图线程解码下一批的同时模型在推理上一批，class2图片直接流入哈希阶段
+哈希阶段与calculate_image_hashes一样用HASH_WORKERS个进程（pHash受GIL限制，线程并行不起来）
+"""
+
+import queue
+import threading
+import time
+import logging
+import functools
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import group3
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # 阶段结束标记
+
+
+class StageQueue(queue.Queue):
+    """带深度统计的有界队列
+
+    producer_wait高：下游阶段是瓶颈；consumer_wait高：上游阶段是瓶颈
+    """
+
+    def __init__(self, name, maxsize):
+        super().__init__(maxsize)
+        self.name = name
+        self.peak = 0
+        self.producer_wait = 0.0
+        self.consumer_wait = 0.0
+        self._stats_lock = threading.Lock()
+
+    def put(self, item, block=True, timeout=None):
+        start = time.monotonic()
+        super().put(item, block, timeout)
+        with self._stats_lock:
+            self.producer_wait += time.monotonic() - start
+            self.peak = max(self.peak, self.qsize())
+
+    def get(self, block=True, timeout=None):
+        start = time.monotonic()
+        item = super().get(block, timeout)
+        with self._stats_lock:
+            self.consumer_wait += time.monotonic() - start
+        return item
+
+    def snapshot(self):
+        with self._stats_lock:
+            return {
+                'depth': self.qsize(),
+                'capacity': self.maxsize,
+                'peak': self.peak,
+                'producer_wait': round(self.producer_wait, 2),
+                'consumer_wait': round(self.consumer_wait, 2)
+            }
+
+
+class ImagePipeline:
+    """读图 -> YOLO分类 -> 哈希 的三阶段流水线
+
+    - 读图线程（PIPELINE_READERS个）解码图片放入decoded队列
+    - 调用线程按YOLO_BATCH_SIZE攒批推理，class2图片放入hash队列
+    - 哈希分发线程把class2图片提交给进程池（HASH_WORKERS个进程；HASH_WORKERS=1时为PIPELINE_HASH_THREADS个线程）
+    """
+
+    def __init__(self, model, on_progress=None):
+        self.model = model
+        self.on_progress = on_progress
+        self.decoded_queue = StageQueue('decoded', group3.PIPELINE_QUEUE_DEPTH)
+        self.hash_queue = StageQueue('hash', group3.PIPELINE_QUEUE_DEPTH)
+        self.counters = {'total': 0, 'decoded': 0, 'decode_failed': 0, 'classified': 0, 'cached': 0, 'class2': 0,
+                         'hashed': 0}
+        self.hash_sources = defaultdict(int)
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._finished_readers = 0
+        self.class2_indices = []
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def metrics(self):
+        """当前进度与各队列深度，供 /status 展示"""
+        with self._lock:
+            metrics = dict(self.counters)
+            metrics['hash_sources'] = dict(self.hash_sources)
+        metrics['queues'] = {q.name: q.snapshot() for q in (self.decoded_queue, self.hash_queue)}
+        return metrics
+
+    def _report(self):
+        if self.on_progress:
+            self.on_progress(self.metrics())
+
+    def _read_loop(self, image_infos, index_queue):
+        """读图线程：解码图片，读不了的单独跳过"""
+        try:
+            while not self._abort.is_set():
+                try:
+                    i = index_queue.get_nowait()
+                except queue.Empty:
+                    break
+                # 见过的图片直接用缓存的分类结果，不解码不推理
+                cached_prob = group3.cached_class2_probability(self.model, image_infos[i])
+                if cached_prob is not None:
+                    self._accept(i, image_infos, cached_prob)
+                    self._count('classified')
+                    self._count('cached')
+                    continue
+                try:
+                    img = group3.load_classify_image(image_infos[i])
+                except Exception as e:
+                    logger.error(f"预测图片时出错 {image_infos[i]['path']}: {str(e)}")
+                    self._count('decode_failed')
+                    continue
+                self._count('decoded')
+                self.decoded_queue.put((i, img))
+        finally:
+            self.decoded_queue.put(_DONE)
+
+    @staticmethod
+    def _hash_executor():
+        """(执行器, 同时在算的图片数上限)"""
+        workers = group3.HASH_WORKERS
+        if workers > 1:
+            # 与calculate_image_hashes共用同样的进程池：不fork，读图线程已在运行时启动子进程也安全
+            return group3.hash_pool(workers), workers * 2
+        threads = max(1, group3.PIPELINE_HASH_THREADS)
+        return ThreadPoolExecutor(max_workers=threads, thread_name_prefix='pipeline-hash'), threads
+
+    def _hash_loop(self, executor, slots, hash_values):
+        """哈希分发：class2图片到达即提交；在算的超过slots张时不再取，哈希慢时积压在hash队列里（队列统计能看出瓶颈）"""
+        pending = threading.BoundedSemaphore(slots)
+        while True:
+            item = self.hash_queue.get()
+            if item is _DONE:
+                break
+            i, image_info = item
+            pending.acquire()
+            try:
+                future = executor.submit(group3.calculate_image_hash_with_source, image_info)
+            except Exception as e:
+                # 进程池坏了（子进程被杀等）：剩下的在本线程里算
+                logger.error(f"哈希进程池不可用，改为在流水线线程中计算: {str(e)}")
+                self._hashed(i, image_info, hash_values, pending, None)
+                continue
+            future.add_done_callback(functools.partial(self._hashed, i, image_info, hash_values, pending))
+
+    def _hashed(self, i, image_info, hash_values, pending, future):
+        """哈希完成回调（进程池的管理线程里执行）；future为None或子进程异常退出时就地重算"""
+        try:
+            try:
+                hash_value, source = future.result() if future is not None else (None, None)
+            except Exception:
+                future = None
+            if future is None:
+                hash_value, source = group3.calculate_image_hash_with_source(image_info)
+            hash_values[i] = hash_value
+            with self._lock:
+                self.counters['hashed'] += 1
+                self.hash_sources[source or 'failed'] += 1
+        finally:
+            pending.release()
+
+    def _accept(self, i, image_infos, class2_prob):
+        """达到阈值的图片送入哈希阶段"""
+        if group3.accept_class2(i, len(image_infos), image_infos[i], class2_prob):
+            with self._lock:
+                self.class2_indices.append(i)
+                self.counters['class2'] += 1
+            self.hash_queue.put((i, image_infos[i]))
+
+    def _classify_batch(self, batch, image_infos):
+        probabilities = group3.predict_class2_probabilities(self.model, [img for _, img in batch],
+                                                            [image_infos[i] for i, _ in batch])
+        for (i, _), class2_prob in zip(batch, probabilities):
+            self._accept(i, image_infos, class2_prob)
+        self._count('classified', len(batch))
+        self._report()
+
+    def _classify_loop(self, image_infos, reader_count):
+        """推理阶段：攒满一批就推理，读图线程全部结束后处理剩余的不满批"""
+        batch_size = max(1, group3.YOLO_BATCH_SIZE)
+        batch = []
+        while self._finished_readers < reader_count:
+            item = self.decoded_queue.get()
+            if item is _DONE:
+                self._finished_readers += 1
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self._classify_batch(batch, image_infos)
+                batch = []
+        if batch:
+            self._classify_batch(batch, image_infos)
+
+    def _drain(self, reader_count):
+        """推理阶段出错时清空队列，让阻塞在put上的读图线程退出"""
+        while self._finished_readers < reader_count:
+            if self.decoded_queue.get() is _DONE:
+                self._finished_readers += 1
+
+    def run(self, image_infos):
+        """执行流水线，返回 (class2图片列表, 对应的哈希值列表)，顺序与输入一致"""
+        total_images = len(image_infos)
+        self.counters['total'] = total_images
+        hash_values = [None] * total_images
+
+        executor, slots = self._hash_executor()
+        hasher = threading.Thread(target=self._hash_loop, args=(executor, slots, hash_values), daemon=True)
+        hasher.start()
+
+        try:
+            if self.model is None:
+                # 与classify_images_with_yolo一致：没有模型时全部图片进入下一步
+                logger.error("YOLO模型未加载，跳过分类步骤")
+                for i, image_info in enumerate(image_infos):
+                    self.class2_indices.append(i)
+                    self.hash_queue.put((i, image_info))
+            else:
+                logger.info(f"流水线开始: {total_images} 张图片, {group3.PIPELINE_READERS} 个读图线程, "
+                            f"哈希{'进程' if group3.HASH_WORKERS > 1 else '线程'} {executor._max_workers} 个, "
+                            f"批大小 {group3.YOLO_BATCH_SIZE}")
+                index_queue = queue.Queue()
+                for i in range(total_images):
+                    index_queue.put(i)
+                readers = [threading.Thread(target=self._read_loop, args=(image_infos, index_queue), daemon=True)
+                           for _ in range(max(1, group3.PIPELINE_READERS))]
+                for t in readers:
+                    t.start()
+                try:
+                    self._classify_loop(image_infos, len(readers))
+                except Exception:
+                    self._abort.set()
+                    self._drain(len(readers))
+                    raise
+                finally:
+                    for t in readers:
+                        t.join()
+        finally:
+            self.hash_queue.put(_DONE)
+            hasher.join()
+            executor.shutdown(wait=True)  # 等已提交的哈希全部算完（回调已写入hash_values）
+
+        self._report()
+        class2_indices = sorted(self.class2_indices)
+        metrics = self.metrics()
+        logger.info(f"流水线完成: 分类 {metrics['classified']} 张, class2 {metrics['class2']} 张, "
+                    f"哈希 {metrics['hashed']} 张, 队列统计 {metrics['queues']}")
+        return [image_infos[i] for i in class2_indices], [hash_values[i] for i in class2_indices]
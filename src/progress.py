@@ -0,0 +1,103 @@
+"""
+任务进度 - 解压、分类、哈希各阶段按张计数，附带吞吐量和预计剩余时间
+进度通过SSE推送给页面：状态一变就唤醒连接，但两次推送之间至少间隔min_interval
+"""
+
+import copy
+import json
+import time
+import threading
+
+RATE_SMOOTHING = 0.3      # 吞吐量指数平滑系数，越大越跟随最近的速度
+RATE_SAMPLE_INTERVAL = 0.5  # 至少隔这么久才采样一次速度，避免批处理造成的抖动
+
+
+class StageProgress:
+    """一个阶段的进度，映射到任务总进度的 [start, end] 区间
+
+    写入job.status的字段：stage / stage_done / stage_total / throughput（张/秒）/ eta_seconds
+    可以在多个线程里调用advance
+    """
+
+    def __init__(self, job, stage, total, start, end, current_step=None):
+        self.job = job
+        self.total = total
+        self.start = start
+        self.end = end
+        self.done = 0
+        self._rate = None
+        self._sample_time = time.monotonic()
+        self._sample_done = 0
+        self._lock = threading.Lock()
+        job.status.update({
+            'stage': stage,
+            'stage_done': 0,
+            'stage_total': total,
+            'throughput': None,
+            'eta_seconds': None,
+            'progress': max(job.status.get('progress', 0), start)
+        })
+        if current_step:
+            job.status['current_step'] = current_step
+        job.save()
+
+    def advance(self, n=1):
+        self.update(self.done + n)
+
+    def update(self, done):
+        """已完成done张（只增不减）"""
+        with self._lock:
+            if done <= self.done:
+                return
+            self.done = min(done, self.total) if self.total else done
+            now = time.monotonic()
+            elapsed = now - self._sample_time
+            if elapsed >= RATE_SAMPLE_INTERVAL:
+                rate = (self.done - self._sample_done) / elapsed
+                self._rate = rate if self._rate is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self._rate
+                self._sample_time, self._sample_done = now, self.done
+
+            status = self.job.status
+            status['stage_done'] = self.done
+            if self._rate:
+                status['throughput'] = round(self._rate, 1)
+                if self.total:
+                    status['eta_seconds'] = round((self.total - self.done) / self._rate)
+            if self.total:
+                progress = self.start + (self.end - self.start) * self.done / self.total
+                status['progress'] = max(status.get('progress', 0), min(int(progress), self.end))
+        self.job.save()
+
+
+def status_events(get_status, wait_change, min_interval=0.5, keepalive=15.0):
+    """SSE事件流：第一条是完整状态，之后只发变化的字段，任务结束时发done事件并结束
+
+    get_status(): 当前状态dict；wait_change(timeout): 等待状态变化（超时也返回）
+    两次推送至少间隔min_interval秒；keepalive秒内没有推送时发注释行保持连接
+    """
+    sent = {}
+    event_id = 0
+    last_sent = 0.0
+    while True:
+        status = get_status()
+        changes = {key: value for key, value in status.items() if key not in sent or sent[key] != value}
+        finished = not status.get('is_processing')
+        now = time.monotonic()
+        if changes or finished:
+            event_id += 1
+            event = 'done' if finished else 'progress'
+            data = json.dumps(status if finished else changes, ensure_ascii=False, default=str)
+            yield f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+            if finished:
+                return
+            sent.update(copy.deepcopy(changes))  # 嵌套的dict可能被原地修改，留一份副本用于比较
+            last_sent = now
+        elif now - last_sent >= keepalive:
+            yield ": keepalive\n\n"
+            last_sent = now
+
+        # 限流：距上次推送不足min_interval时先睡够，再等下一次变化
+        wait = min_interval - (time.monotonic() - last_sent)
+        if wait > 0:
+            time.sleep(wait)
+        wait_change(keepalive)
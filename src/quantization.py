@@ -0,0 +1,209 @@
+"""
+INT8量化 - 对导出的ONNX分类模型做训练后量化，并与FP32模型对比
+dynamic: 只量化权重，激活值在推理时动态量化，不需要校准数据（只支持ONNX Runtime）
+static:  权重和激活都量化为INT8（QDQ格式），激活范围用已处理过的图片校准；ONNX Runtime和OpenVINO都能用
+
+量化后的模型放在FP32 ONNX旁边: <权重名>.<校验和>.int8-<mode>.onnx，是否上线看 compare_models 的报告
+"""
+
+import os
+import json
+import time
+import random
+import logging
+
+import numpy as np
+
+import group3
+from onnx_classifier import preprocess, load_metadata
+
+logger = logging.getLogger(__name__)
+
+MODES = ('dynamic', 'static')
+RUNTIME_MODES = {'onnxruntime': MODES, 'openvino': ('static',)}  # 各推理后端支持的量化方式
+CALIBRATION_SAMPLES = 200  # 默认校准图片数
+NEAR_THRESHOLD_BAND = 0.1  # 报告中“阈值附近”的范围：|FP32概率 - 阈值| <= band
+WORST_CASES = 10  # 报告中列出的漂移最大的图片数
+
+
+def check_mode(runtime, mode):
+    """推理后端不支持该量化方式时抛出ValueError（dynamic量化的整数算子OpenVINO跑不了）"""
+    if mode not in MODES:
+        raise ValueError(f"未知的量化方式: {mode}")
+    supported = RUNTIME_MODES.get(runtime, ())
+    if mode not in supported:
+        hint = f"，可用: {', '.join(supported)}" if supported else "，只有onnxruntime/openvino后端支持量化"
+        raise ValueError(f"{runtime} 后端不支持 {mode} 量化{hint}")
+
+
+def quantized_path(onnx_path, mode):
+    if mode not in MODES:
+        raise ValueError(f"未知的量化方式: {mode}")
+    return f"{os.path.splitext(onnx_path)[0]}.int8-{mode}.onnx"
+
+
+def sample_images(sources, samples=CALIBRATION_SAMPLES, seed=0):
+    """从已处理过的数据里抽样图片记录：目录（递归，含其中的ZIP）、ZIP文件或单张图片"""
+    image_infos = []
+    zip_files = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                for file in sorted(files):
+                    path = os.path.join(root, file)
+                    if file.lower().endswith('.zip'):
+                        zip_files.append((path, file))
+                    elif file.lower().endswith(group3.SUPPORTED_FORMATS):
+                        image_infos.append({'path': path})
+        elif source.lower().endswith('.zip'):
+            zip_files.append((source, os.path.basename(source)))
+        elif source.lower().endswith(group3.SUPPORTED_FORMATS):
+            image_infos.append({'path': source})
+    if zip_files:
+        # stream方式只列出成员，读图时再解压，不产生临时目录
+        archive_images, _ = group3.extract_archives(zip_files, mode='stream')
+        image_infos.extend(archive_images)
+    if len(image_infos) > samples:
+        image_infos = random.Random(seed).sample(image_infos, samples)
+    return image_infos
+
+
+def _load_images(image_infos):
+    """按线上同样的方式解码；读不了的图片跳过，返回 (图片记录, 图片)"""
+    loaded = []
+    for image_info in image_infos:
+        try:
+            loaded.append((image_info, group3.load_classify_image(image_info)))
+        except Exception as e:
+            logger.warning(f"读取图片失败 {image_info['path']}: {str(e)}")
+    return loaded
+
+
+def quantize_model(onnx_path, mode='static', calibration_images=None):
+    """量化FP32 ONNX模型，返回量化后的路径；static需要calibration_images（图片记录列表）"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization import CalibrationDataReader
+
+    output_path = quantized_path(onnx_path, mode)
+    names, imgsz = load_metadata(onnx_path)
+    meta = {'names': names, 'imgsz': imgsz, 'quantization': {'mode': mode, 'source': os.path.basename(onnx_path)}}
+    tmp_path = output_path + '.tmp'
+
+    if mode == 'dynamic':
+        quantize_dynamic(onnx_path, tmp_path, weight_type=QuantType.QInt8)
+    else:
+        loaded = _load_images(calibration_images or [])
+        if not loaded:
+            raise ValueError("static量化需要校准图片")
+        input_name = _input_name(onnx_path)
+
+        class ImageReader(CalibrationDataReader):
+            def __init__(self):
+                self._images = iter(loaded)
+
+            def get_next(self):
+                item = next(self._images, None)
+                if item is None:
+                    return None
+                return {input_name: preprocess(item[1], imgsz)[np.newaxis]}
+
+        logger.info(f"static量化: 用 {len(loaded)} 张图片校准激活范围")
+        quantize_static(onnx_path, tmp_path, ImageReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        meta['quantization']['calibration_images'] = len(loaded)
+
+    os.replace(tmp_path, output_path)
+    with open(os.path.splitext(output_path)[0] + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    logger.info(f"量化模型已保存: {output_path}")
+    return output_path
+
+
+def _input_name(onnx_path):
+    import onnxruntime as ort
+    return ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+
+def _class2_probabilities(model, images, batch_size):
+    """逐批推理，返回 (class2概率列表, 纯推理耗时秒数)"""
+    group3.warm_up_model(model)
+    probabilities = []
+    elapsed = 0.0
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        started = time.perf_counter()
+        probabilities.extend(group3.predict_class2_probabilities(model, batch))
+        elapsed += time.perf_counter() - started
+    return probabilities, elapsed
+
+
+def _drift_stats(drifts):
+    """概率漂移（候选 - 参考）：mean为系统性偏移，其余按绝对值统计"""
+    if not drifts:
+        return {'mean': None, 'mean_abs': None, 'p95_abs': None, 'max_abs': None}
+    mean = float(np.mean(drifts))
+    drifts = np.abs(np.asarray(drifts))
+    return {
+        'mean': round(mean, 4),
+        'mean_abs': round(float(drifts.mean()), 4),
+        'p95_abs': round(float(np.percentile(drifts, 95)), 4),
+        'max_abs': round(float(drifts.max()), 4)
+    }
+
+
+def compare_models(reference, candidate, image_infos, threshold=None, band=NEAR_THRESHOLD_BAND, batch_size=None):
+    """同一批图片上对比两个模型（通常是FP32和INT8）的class2判定和概率
+
+    agreement_rate: 两边按阈值判定结果一致的比例；near_threshold: FP32概率在阈值±band内的图片，
+    量化误差最容易在这里翻转判定；images_per_second 只计推理耗时，不含读图
+    """
+    threshold = group3.CLASS2_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    batch_size = batch_size or group3.YOLO_BATCH_SIZE
+    loaded = _load_images(image_infos)
+    images = [img for _, img in loaded]
+    reference_probs, reference_seconds = _class2_probabilities(reference, images, batch_size)
+    candidate_probs, candidate_seconds = _class2_probabilities(candidate, images, batch_size)
+
+    pairs = []
+    failed = 0
+    for (image_info, _), p_ref, p_cand in zip(loaded, reference_probs, candidate_probs):
+        if p_ref is None or p_cand is None:
+            failed += 1
+        else:
+            pairs.append((image_info['path'], p_ref, p_cand))
+
+    agree = [(p_ref >= threshold) == (p_cand >= threshold) for _, p_ref, p_cand in pairs]
+    near = [(path, p_ref, p_cand) for path, p_ref, p_cand in pairs if abs(p_ref - threshold) <= band]
+    near_agree = [(p_ref >= threshold) == (p_cand >= threshold) for _, p_ref, p_cand in near]
+    worst = sorted(pairs, key=lambda pair: abs(pair[2] - pair[1]), reverse=True)[:WORST_CASES]
+
+    def rate(values):
+        return round(sum(values) / len(values), 4) if values else None
+
+    def speed(seconds):
+        return round(len(images) / seconds, 1) if seconds > 0 else None
+
+    return {
+        'images': len(pairs),
+        'failed': failed + len(image_infos) - len(loaded),
+        'threshold': threshold,
+        'agreement_rate': rate(agree),
+        'flips': {
+            'class2_to_other': sum(1 for _, p_ref, p_cand in pairs if p_ref >= threshold > p_cand),
+            'other_to_class2': sum(1 for _, p_ref, p_cand in pairs if p_cand >= threshold > p_ref)
+        },
+        'drift': _drift_stats([p_cand - p_ref for _, p_ref, p_cand in pairs]),
+        'near_threshold': {
+            'band': band,
+            'images': len(near),
+            'agreement_rate': rate(near_agree),
+            'drift': _drift_stats([p_cand - p_ref for _, p_ref, p_cand in near])
+        },
+        'images_per_second': {
+            'reference': speed(reference_seconds),
+            'candidate': speed(candidate_seconds),
+            'speedup': round(reference_seconds / candidate_seconds, 2) if candidate_seconds > 0 else None
+        },
+        'worst': [{'path': path, 'reference': round(p_ref, 4), 'candidate': round(p_cand, 4)}
+                  for path, p_ref, p_cand in worst]
+    }
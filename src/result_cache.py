@@ -0,0 +1,135 @@
+"""
+内容寻址结果缓存 - 以图片字节摘要为键缓存分类概率和pHash
+重复上传的图片只需读文件算摘要，不再解码、推理和计算哈希
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+EVICTION_CHECK_INTERVAL = 500  # 每写入多少次检查一次容量（COUNT(*)需要扫表）
+
+
+def stream_digest(f, chunk_size=1024 * 1024):
+    """二进制文件对象内容的SHA-256摘要"""
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """文件内容的SHA-256摘要"""
+    with open(path, 'rb') as f:
+        return stream_digest(f, chunk_size)
+
+
+class ResultCache:
+    """SQLite缓存：摘要 -> (模型校验和, 类别概率, 哈希参数, pHash)
+
+    分类结果只在模型校验和一致时命中，哈希只在哈希参数一致时命中；
+    按最近访问时间做LRU淘汰，条目数不超过max_entries
+    """
+
+    def __init__(self, db_path, max_entries=200000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {'class_hits': 0, 'class_misses': 0, 'hash_hits': 0, 'hash_misses': 0, 'evictions': 0}
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    digest TEXT PRIMARY KEY,
+                    model_key TEXT,
+                    class_probs TEXT,
+                    hash_key TEXT,
+                    phash TEXT,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:  # 正常退出自动提交，异常回滚
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        """本进程的命中/未命中计数"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _lookup(self, digest, key_column, key, value_column):
+        with self._connect() as conn:
+            row = conn.execute(
+                f'SELECT {value_column} FROM results WHERE digest = ? AND {key_column} = ?', (digest, key)
+            ).fetchone()
+            if row is None or row[0] is None:
+                return None
+            conn.execute('UPDATE results SET last_access = ? WHERE digest = ?', (time.time(), digest))
+            return row[0]
+
+    def _store(self, digest, key_column, key, value_column, value):
+        with self._connect() as conn:
+            conn.execute(
+                f'INSERT INTO results (digest, {key_column}, {value_column}, last_access) VALUES (?, ?, ?, ?) '
+                f'ON CONFLICT(digest) DO UPDATE SET {key_column} = excluded.{key_column}, '
+                f'{value_column} = excluded.{value_column}, last_access = excluded.last_access',
+                (digest, key, value, time.time())
+            )
+            with self._lock:
+                self._writes += 1
+                check = self._writes % EVICTION_CHECK_INTERVAL == 0
+            if check:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        """超出容量时删掉最久未访问的条目（多删10%，避免频繁触发）"""
+        count = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        conn.execute(
+            'DELETE FROM results WHERE digest IN (SELECT digest FROM results ORDER BY last_access LIMIT ?)',
+            (excess,)
+        )
+        with self._lock:
+            self._stats['evictions'] += excess
+        logger.info(f"结果缓存淘汰 {excess} 条最久未使用的记录")
+
+    def get_class_probs(self, digest, model_key):
+        value = self._lookup(digest, 'model_key', model_key, 'class_probs')
+        self._count('class_hits' if value is not None else 'class_misses')
+        return json.loads(value) if value is not None else None
+
+    def put_class_probs(self, digest, model_key, class_probs):
+        self._store(digest, 'model_key', model_key, 'class_probs', json.dumps(class_probs))
+
+    def get_hash(self, digest, hash_key):
+        value = self._lookup(digest, 'hash_key', hash_key, 'phash')
+        self._count('hash_hits' if value is not None else 'hash_misses')
+        return value
+
+    def put_hash(self, digest, hash_key, phash_hex):
+        self._store(digest, 'hash_key', hash_key, 'phash', phash_hex)
@@ -0,0 +1,210 @@
+"""
+结果图片的落地方式 - 一张图片常常出现在多个组里，不必每组都复制一份
+
+copy:     每组复制一份（原来的做法）
+link:     第一次出现时写出文件，之后在别的组里硬链接到它（不同文件系统时尝试reflink，再不行才复制）
+blobs:    按内容摘要存一份到 blobs/，组里只记录引用
+manifest: 一个文件都不写，组清单记录图片在上传ZIP中的位置，/image 和下载时再读取
+
+组清单里每张图片的引用: {'path': 结果目录内的相对路径} 或 {'zip': ZIP路径, 'member': 成员名, 'size', 'crc32'}
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import zipfile
+import logging
+from contextlib import contextmanager
+
+from zip_source import is_zip_member, materialize, open_image_source
+from zip_stream import file_entry, stream_entry
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('copy', 'link', 'blobs', 'manifest')
+BLOB_DIR = 'blobs'
+FICLONE = 0x40049409  # Linux ioctl：写时复制克隆（btrfs、xfs）
+
+
+def _reflink(src_path, dest_path):
+    import fcntl
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(dest_path)
+            raise
+
+
+def clone_file(src_path, dest_path):
+    """硬链接 -> reflink -> 复制，返回实际使用的方式"""
+    try:
+        os.link(src_path, dest_path)
+        return 'link'
+    except OSError:
+        pass
+    try:
+        _reflink(src_path, dest_path)
+        return 'reflink'
+    except (OSError, ImportError):
+        pass
+    shutil.copy2(src_path, dest_path)
+    return 'copy'
+
+
+def _source_key(image_info):
+    if is_zip_member(image_info):
+        return (image_info['original_zip_path'], image_info['zip_member'])
+    return (image_info['path'],)
+
+
+class ResultWriter:
+    """把分组图片写进结果目录，返回组清单里的引用；同一张图片在各组之间按strategy共享"""
+
+    def __init__(self, results_dir, strategy='link'):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的结果落地方式: {strategy}")
+        self.results_dir = results_dir
+        self.strategy = strategy
+        self._written = {}  # 图片来源 -> 已写出的相对路径
+        self.stats = dict.fromkeys(('written', 'link', 'reflink', 'copy', 'referenced'), 0)
+
+    def add(self, image_info, group_name, filename):
+        if self.strategy == 'manifest' and is_zip_member(image_info):
+            self.stats['referenced'] += 1
+            return {
+                'zip': image_info['original_zip_path'],
+                'member': image_info['zip_member'],
+                'size': image_info['file_size'],
+                'crc32': image_info['crc32']
+            }
+        if self.strategy == 'blobs':
+            return {'path': self._add_blob(image_info, os.path.splitext(filename)[1].lower())}
+
+        rel_path = os.path.join(group_name, filename)
+        dest_path = os.path.join(self.results_dir, rel_path)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        key = _source_key(image_info)
+        first = self._written.get(key)
+        if first is not None and self.strategy != 'copy':
+            self.stats[clone_file(os.path.join(self.results_dir, first), dest_path)] += 1
+        else:
+            # manifest模式下disk解压的图片在任务结束后会被清理，也按link处理
+            materialize(image_info, dest_path)
+            self._written.setdefault(key, rel_path)
+            self.stats['written'] += 1
+        return {'path': rel_path}
+
+    def _add_blob(self, image_info, ext):
+        key = _source_key(image_info)
+        if key in self._written:
+            self.stats['referenced'] += 1
+            return self._written[key]
+        blob_root = os.path.join(self.results_dir, BLOB_DIR)
+        os.makedirs(blob_root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=blob_root, suffix='.tmp')
+        sha = hashlib.sha256()
+        try:
+            with open_image_source(image_info) as src, os.fdopen(fd, 'wb') as dst:
+                for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                    sha.update(chunk)
+                    dst.write(chunk)
+            digest = sha.hexdigest()
+            rel_path = os.path.join(BLOB_DIR, digest[:2], digest + ext)
+            blob_path = os.path.join(self.results_dir, rel_path)
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)  # 内容相同的另一张图片已经存过
+                self.stats['referenced'] += 1
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(tmp_path, blob_path)
+                self.stats['written'] += 1
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._written[key] = rel_path
+        return rel_path
+
+
+_manifest_cache = {}
+_manifest_lock = threading.Lock()
+
+
+def load_manifest(manifest_path):
+    """读组清单（按修改时间缓存，/image 每张预览图都要查）；不存在时返回 {}"""
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return {}
+    with _manifest_lock:
+        cached = _manifest_cache.get(manifest_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    with _manifest_lock:
+        _manifest_cache[manifest_path] = (mtime, manifest)
+    return manifest
+
+
+def group_files(group_name, group):
+    """组内 {文件名: 引用}；旧版清单没有引用时，图片就在组目录里"""
+    files = group.get('files')
+    if files is None:
+        files = {filename: {'path': os.path.join(group_name, filename)} for filename in group['images']}
+    return files
+
+
+def find_ref(manifest, group_name, filename):
+    group = manifest.get(group_name)
+    if group is None:
+        return None
+    return group_files(group_name, group).get(filename)
+
+
+def resolve_path(results_dir, ref):
+    """引用对应的磁盘文件；必须在结果目录内"""
+    root = os.path.abspath(results_dir)
+    path = os.path.abspath(os.path.join(root, ref['path']))
+    if not path.startswith(root + os.sep):
+        raise ValueError(f"非法的结果路径: {ref['path']}")
+    return path
+
+
+@contextmanager
+def open_member(zip_path, member):
+    """打开上传ZIP里的成员，关闭时连同压缩包一起关闭"""
+    with zipfile.ZipFile(zip_path, 'r') as archive, archive.open(member) as f:
+        yield f
+
+
+def read_ref(results_dir, ref):
+    """引用的图片内容"""
+    if 'zip' in ref:
+        with open_member(ref['zip'], ref['member']) as f:
+            return f.read()
+    with open(resolve_path(results_dir, ref), 'rb') as f:
+        return f.read()
+
+
+def download_entries(results_dir, manifest, exclude=()):
+    """结果ZIP的条目：结果目录顶层的文件（CSV、清单）+ 每组图片（从引用处读取）"""
+    entries = []
+    for filename in sorted(os.listdir(results_dir)):
+        path = os.path.join(results_dir, filename)
+        if os.path.isfile(path) and filename not in exclude:
+            entries.append(file_entry(path, filename))
+    for group_name, group in manifest.items():
+        for filename, ref in group_files(group_name, group).items():
+            arcname = f'{group_name}/{filename}'
+            if 'zip' in ref:
+                entries.append(stream_entry(arcname, ref['size'],
+                                            lambda ref=ref: open_member(ref['zip'], ref['member']), crc=ref['crc32']))
+            else:
+                entries.append(file_entry(resolve_path(results_dir, ref), arcname))
+    return entries
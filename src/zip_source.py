@@ -0,0 +1,122 @@
+"""
+ZIP内图片读取 - 不解压到磁盘，直接从压缩包读取成员
+图片记录带 zip_member 时从 original_zip_path 里读，否则按普通文件读 path
+"""
+
+import io
+import os
+import shutil
+import zipfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()  # 每个线程各自打开的ZipFile（线程结束时随之释放）
+
+
+def _archive(zip_path):
+    """当前线程打开的压缩包；中央目录只解析一次，成员很多的ZIP不必每张图重新打开
+
+    按进程号区分：fork出的子进程（哈希进程池）继承了父进程的ZipFile和共享的文件偏移，
+    接着用会读乱，子进程里一律重新打开
+    """
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.archives = {}
+    archive = _local.archives.get(zip_path)
+    if archive is None:
+        archive = _local.archives[zip_path] = zipfile.ZipFile(zip_path, 'r')
+    return archive
+
+
+def reset_archives():
+    """丢掉继承来的压缩包缓存（进程池的initializer）；文件描述符是子进程自己的副本，关掉不影响父进程"""
+    archives = getattr(_local, 'archives', None) or {}
+    _local.pid = os.getpid()
+    _local.archives = {}
+    for archive in archives.values():
+        try:
+            archive.close()
+        except OSError:
+            pass
+
+
+def close_archives():
+    """关闭当前线程缓存的压缩包；长期存在的线程（worker主线程）每个任务结束时调用，
+    否则清理掉的上传ZIP仍占着文件描述符"""
+    if getattr(_local, 'pid', None) != os.getpid():
+        reset_archives()
+        return
+    archives, _local.archives = _local.archives, {}
+    for archive in archives.values():
+        archive.close()
+
+
+def is_zip_member(image_info):
+    return bool(image_info.get('zip_member'))
+
+
+def read_image_bytes(image_info):
+    """图片的原始字节"""
+    if is_zip_member(image_info):
+        return _archive(image_info['original_zip_path']).read(image_info['zip_member'])
+    with open(image_info['path'], 'rb') as f:
+        return f.read()
+
+
+def open_image_source(image_info):
+    """可seek的二进制文件对象，交给Image.open或摘要计算使用
+
+    ZIP成员的解压流向后seek要重新解压，所以整体读进内存
+    """
+    if is_zip_member(image_info):
+        return io.BytesIO(read_image_bytes(image_info))
+    return open(image_info['path'], 'rb')
+
+
+def materialize(image_info, dest_path):
+    """把图片写到dest_path（结果目录里只放匹配上的图片）"""
+    if not is_zip_member(image_info):
+        shutil.copy2(image_info['path'], dest_path)
+        return
+    archive = _archive(image_info['original_zip_path'])
+    with archive.open(image_info['zip_member']) as src, open(dest_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+
+
+UTF8_FLAG = 0x800  # 通用标志位第11位：文件名是UTF-8
+NAME_ENCODINGS = ('utf-8', 'gb18030', 'cp437')  # 未设标志时按顺序尝试；UTF-8最严格，放最前
+
+
+def detect_name_encoding(raw_names):
+    """整个压缩包的文件名编码只判断一次：所有名字都能严格解码的第一个编码"""
+    joined = b'\n'.join(raw_names)
+    for encoding in NAME_ENCODINGS:
+        try:
+            joined.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'cp437'
+
+
+def resolve_member_names(zip_ref):
+    """按压缩包统一的编码解码全部成员名，返回 [(ZipInfo, 文件名)]
+
+    设了UTF-8标志的成员zipfile已经正确解码；其余成员zipfile按cp437解码，
+    还原成原始字节后用检测到的编码一次性批量解码
+    """
+    infos = zip_ref.infolist()
+    legacy = [zip_info for zip_info in infos if not zip_info.flag_bits & UTF8_FLAG]
+    names = {}
+    if legacy:
+        raw_names = [zip_info.orig_filename.encode('cp437') for zip_info in legacy]
+        encoding = detect_name_encoding(raw_names)
+        decoded = b'\n'.join(raw_names).decode(encoding, errors='replace').split('\n')
+        if len(decoded) != len(legacy):
+            # 文件名里带换行符（几乎不可能），退回逐个解码
+            decoded = [raw.decode(encoding, errors='replace') for raw in raw_names]
+        for zip_info, name in zip(legacy, decoded):
+            names[id(zip_info)] = name.replace('\\', '/')
+    return [(zip_info, names.get(id(zip_info), zip_info.filename)) for zip_info in infos]
@@ -0,0 +1,212 @@
+"""
+流式ZIP - 边读文件边输出，不在磁盘上生成临时压缩包
+图片按STORED原样写入，小的非图片文件（CSV、JSON清单等）在内存里DEFLATE压缩
+CRC在输出数据时计算，写在每个条目后的数据描述符里
+所有条目的大小事先已知，整个ZIP的长度可以在发送第一个字节之前算出来（Content-Length）
+"""
+
+import os
+import time
+import zlib
+import struct
+
+STORED = 0
+DEFLATED = 8
+
+CHUNK_SIZE = 1024 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF        # 大小或偏移达到此值时改用zip64字段
+ZIP64_COUNT_LIMIT = 0xFFFF      # 条目数达到此值时写zip64结束记录
+MARKER_32 = 0xFFFFFFFF          # 普通字段中表示“见zip64字段”的值
+MARKER_16 = 0xFFFF
+# 图片一律原样存储：JPEG/PNG/WebP再压缩没有收益；BMP/TIFF要先压缩一遍才知道大小，会推迟第一个字节
+IMAGE_FORMATS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.gif')
+DEFLATE_MAX_SIZE = 16 * 1024 * 1024  # 非图片文件（CSV、清单）不超过此大小时先在内存里压缩，更大的原样存储
+DEFLATE_LEVEL = 6
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+
+def _dos_time(timestamp):
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipEntry:
+    """一个ZIP条目：arcname、未压缩大小和按需打开数据的opener
+
+    data: 已在内存中的数据（压缩过的条目），此时不调用opener
+    """
+
+    def __init__(self, arcname, size, opener=None, mtime=None, method=STORED, data=None, crc=None,
+                 compressed_size=None):
+        self.arcname = arcname.replace(os.sep, '/')
+        self.name = self.arcname.encode('utf-8')
+        self.size = size
+        self.opener = opener
+        self.mtime = time.time() if mtime is None else mtime
+        self.method = method
+        self.data = data
+        self.crc = crc
+        self.compressed_size = size if compressed_size is None else compressed_size
+        self.offset = 0
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP64_LIMIT or self.compressed_size >= ZIP64_LIMIT or self.offset >= ZIP64_LIMIT
+
+    def local_header(self):
+        """本地文件头：CRC写0，真正的值在数据后面的数据描述符里"""
+        dos_time, dos_date = _dos_time(self.mtime)
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, self.size, self.compressed_size)
+            sizes = (MARKER_32, MARKER_32)
+        else:
+            extra = b''
+            sizes = (self.compressed_size, self.size)
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if self.zip64 else 20,
+                           FLAG_DATA_DESCRIPTOR | FLAG_UTF8, self.method, dos_time, dos_date,
+                           0, sizes[0], sizes[1], len(self.name), len(extra)) + self.name + extra
+
+    def data_descriptor(self):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.compressed_size, self.size)
+        return struct.pack('<IIII', 0x08074b50, self.crc, self.compressed_size, self.size)
+
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    def central_header(self):
+        dos_time, dos_date = _dos_time(self.mtime)
+        extra_values = []
+        size = self.size
+        compressed_size = self.compressed_size
+        offset = self.offset
+        if self.size >= ZIP64_LIMIT or self.compressed_size >= ZIP64_LIMIT:
+            extra_values += [self.size, self.compressed_size]
+            size = compressed_size = MARKER_32
+        if self.offset >= ZIP64_LIMIT:
+            extra_values.append(self.offset)
+            offset = MARKER_32
+        extra = b''
+        if extra_values:
+            extra = struct.pack(f'<HH{len(extra_values)}Q', 0x0001, 8 * len(extra_values), *extra_values)
+        version = 45 if self.zip64 else 20
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version,
+                           FLAG_DATA_DESCRIPTOR | FLAG_UTF8, self.method, dos_time, dos_date,
+                           self.crc or 0, compressed_size, size, len(self.name), len(extra), 0, 0, 0,
+                           0o100644 << 16, offset) + self.name + extra
+
+    def central_size(self):
+        """中央目录条目长度（不依赖CRC，输出前即可计算）"""
+        extra = 0
+        if self.size >= ZIP64_LIMIT or self.compressed_size >= ZIP64_LIMIT:
+            extra += 16
+        if self.offset >= ZIP64_LIMIT:
+            extra += 8
+        return 46 + len(self.name) + (4 + extra if extra else 0)
+
+    def chunks(self):
+        """条目数据；边输出边计算CRC，读到的长度与登记的大小不符时报错（文件在下载期间被改了）"""
+        if self.data is not None:
+            yield self.data
+            return
+        crc = 0
+        written = 0
+        for chunk in _read_chunks(self.opener, self.size):
+            crc = zlib.crc32(chunk, crc)
+            written += len(chunk)
+            yield chunk
+        if written != self.size or (self.crc is not None and crc != self.crc):
+            raise IOError(f"文件在打包期间被修改: {self.arcname}")
+        self.crc = crc
+
+
+def _read_chunks(opener, size):
+    """按CHUNK_SIZE读取至多size字节；文件变短时提前结束"""
+    remaining = size
+    with opener() as f:
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def stream_entry(arcname, size, opener, mtime=None, crc=None):
+    """按需读取的数据对应的条目：图片和大文件原样存储，输出时才读取；小的非图片文件在内存里压缩"""
+    if arcname.lower().endswith(IMAGE_FORMATS) or size > DEFLATE_MAX_SIZE:
+        return ZipEntry(arcname, size, opener, mtime=mtime, crc=crc)
+    raw = b''.join(_read_chunks(opener, size))
+    if len(raw) != size or (crc is not None and zlib.crc32(raw) != crc):
+        raise IOError(f"文件在打包期间被修改: {arcname}")
+    compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush()
+    if len(data) < len(raw):
+        return ZipEntry(arcname, size, mtime=mtime, method=DEFLATED, data=data, crc=zlib.crc32(raw),
+                        compressed_size=len(data))
+    return ZipEntry(arcname, size, mtime=mtime, data=raw, crc=zlib.crc32(raw))
+
+
+def file_entry(path, arcname):
+    """磁盘文件对应的条目"""
+    stat = os.stat(path)
+    return stream_entry(arcname, stat.st_size, lambda: open(path, 'rb'), mtime=stat.st_mtime)
+
+
+def directory_entries(root, exclude=()):
+    """目录下的所有文件（按路径排序），exclude为要跳过的相对路径"""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            arcname = os.path.relpath(path, root)
+            if arcname not in exclude:
+                entries.append(file_entry(path, arcname))
+    return entries
+
+
+class ZipStream:
+    """把若干ZipEntry按顺序输出为一个ZIP；len()即最终的字节数"""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        offset = 0
+        for entry in self.entries:
+            entry.offset = offset
+            offset += len(entry.local_header()) + entry.compressed_size + entry.descriptor_size()
+        self.central_offset = offset
+        self.central_size = sum(entry.central_size() for entry in self.entries)
+        self.zip64 = (len(self.entries) >= ZIP64_COUNT_LIMIT or self.central_offset >= ZIP64_LIMIT
+                      or self.central_size >= ZIP64_LIMIT or any(entry.zip64 for entry in self.entries))
+        self.length = self.central_offset + self.central_size + (56 + 20 if self.zip64 else 0) + 22
+
+    def __len__(self):
+        return self.length
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if self.zip64:
+            zip64_end_offset = self.central_offset + self.central_size
+            records += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0,
+                                   count, count, self.central_size, self.central_offset)
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+            count, central_size, central_offset = MARKER_16, MARKER_32, MARKER_32
+        else:
+            central_size, central_offset = self.central_size, self.central_offset
+        records += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, central_size, central_offset, 0)
+        return records
+
+    def __iter__(self):
+        for entry in self.entries:
+            yield entry.local_header()
+            yield from entry.chunks()
+            yield entry.data_descriptor()
+        yield b''.join(entry.central_header() for entry in self.entries)
+        yield self._end_records()
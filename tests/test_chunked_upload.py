@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the chunked, resumable upload store
+"""
+
+import sys
+import os
+import hashlib
+import tempfile
+import unittest
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from chunked_upload import ChunkedUploadStore, ChunkError, UploadTooLarge
+
+
+class TestChunkedUploadStore(unittest.TestCase):
+    """Test chunk validation, resume and completion"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = ChunkedUploadStore(os.path.join(self.temp_dir.name, '.chunks'), chunk_size=4)
+        self.data = b'0123456789'
+        self.dest_path = os.path.join(self.temp_dir.name, 'a.zip')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _chunk(self, index):
+        return self.data[index * 4:(index + 1) * 4]
+
+    def test_out_of_order_chunks_complete_file(self):
+        meta = self.store.register('b1', 'a.zip', len(self.data), self.dest_path,
+                                   hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(meta['total_chunks'], 3)
+
+        for index in (2, 0):
+            _, done = self.store.write_chunk(meta['file_id'], index, self._chunk(index))
+            self.assertIsNone(done)
+        _, done = self.store.write_chunk(meta['file_id'], 1, self._chunk(1),
+                                         hashlib.sha256(self._chunk(1)).hexdigest())
+        self.assertEqual(done, self.dest_path)
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+        # 完成后重复的块不会再次触发完成
+        _, done = self.store.write_chunk(meta['file_id'], 1, self._chunk(1))
+        self.assertIsNone(done)
+
+    def test_resume_returns_received_chunks(self):
+        meta = self.store.register('b1', 'a.zip', len(self.data), self.dest_path)
+        self.store.write_chunk(meta['file_id'], 0, self._chunk(0))
+
+        resumed = self.store.register('b1', 'a.zip', len(self.data), self.dest_path)
+        self.assertEqual(resumed['file_id'], meta['file_id'])
+        self.assertEqual(resumed['received'], [0])
+
+    def test_bad_chunks_rejected(self):
+        meta = self.store.register('b1', 'a.zip', len(self.data), self.dest_path)
+        with self.assertRaises(ChunkError):
+            self.store.write_chunk(meta['file_id'], 0, self._chunk(0), checksum='00')
+        with self.assertRaises(ChunkError):
+            self.store.write_chunk(meta['file_id'], 2, b'89xx')
+        with self.assertRaises(ChunkError):
+            self.store.write_chunk(meta['file_id'], 3, b'')
+        self.assertEqual(self.store.load(meta['file_id'])['received'], [])
+
+    def test_whole_file_checksum_mismatch_resets(self):
+        meta = self.store.register('b1', 'a.zip', len(self.data), self.dest_path, sha256='0' * 64)
+        self.store.write_chunk(meta['file_id'], 0, self._chunk(0))
+        self.store.write_chunk(meta['file_id'], 1, self._chunk(1))
+        with self.assertRaises(ChunkError):
+            self.store.write_chunk(meta['file_id'], 2, self._chunk(2))
+        self.assertEqual(self.store.load(meta['file_id'])['received'], [])
+        self.assertFalse(os.path.exists(self.dest_path))
+
+    def test_size_limit_covers_whole_batch(self):
+        store = ChunkedUploadStore(os.path.join(self.temp_dir.name, '.limited'), chunk_size=4, max_size=15)
+        store.register('b1', 'a.zip', 10, self.dest_path)
+        with self.assertRaises(UploadTooLarge):
+            store.register('b1', 'b.zip', 6, os.path.join(self.temp_dir.name, 'b.zip'))
+        with self.assertRaises(UploadTooLarge):
+            store.register('b1', 'c.zip', 100, os.path.join(self.temp_dir.name, 'c.zip'))
+        self.assertEqual([meta['filename'] for meta in store.uploads()], ['a.zip'])
+        # 续传已登记的文件不受影响
+        self.assertEqual(store.register('b1', 'a.zip', 10, self.dest_path)['size'], 10)
+        store.register('b1', 'b.zip', 5, os.path.join(self.temp_dir.name, 'b.zip'))
+
+    def test_same_name_different_files_do_not_collide(self):
+        # 同名不同大小：文件ID不同，各自的目标路径按文件ID区分
+        uploads = []
+        for data in (self.data, b'abcdefg'):
+            file_id = ChunkedUploadStore.file_id('b1', 'a.zip', len(data))
+            dest_path = os.path.join(self.temp_dir.name, file_id, 'a.zip')
+            uploads.append((self.store.register('b1', 'a.zip', len(data), dest_path), data))
+        self.assertNotEqual(uploads[0][0]['file_id'], uploads[1][0]['file_id'])
+
+        for meta, data in uploads:
+            for index in range(meta['total_chunks']):
+                _, done = self.store.write_chunk(meta['file_id'], index, data[index * 4:(index + 1) * 4])
+            with open(done, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(os.path.basename(done), 'a.zip')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for batched YOLO classification
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import group3
+from group3 import classify_images_with_yolo
+from onnx_classifier import ClassifyResult
+from pipeline import ImagePipeline
+
+
+class RecordingModel:
+    """class2概率 = 左上角像素的红色分量 / 255；记录每次调用的批大小
+
+    poison: 该红色分量的图片推理报错（整批一起失败）
+    """
+
+    def __init__(self, poison=None):
+        self.poison = poison
+        self.calls = []
+
+    def __call__(self, images, verbose=False):
+        if isinstance(images, Image.Image):
+            images = [images]
+        self.calls.append(len(images))
+        results = []
+        for image in images:
+            red = image.getpixel((0, 0))[0]
+            if red == self.poison:
+                raise RuntimeError('推理失败')
+            p = red / 255
+            results.append(ClassifyResult({0: 'class1', 1: 'class2'}, np.array([1 - p, p], dtype=np.float32)))
+        return results
+
+
+class CachedRecordingModel(RecordingModel):
+    """带cache_key，分类结果会写入结果缓存"""
+
+    cache_key = 'recording-model'
+
+
+class TestBatchClassification(unittest.TestCase):
+    """Test result mapping, per-image retry and the final partial batch"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.saved = {name: getattr(group3, name) for name in
+                      ('RESULT_CACHE_ENABLED', 'RESULT_CACHE_PATH', '_result_cache', 'YOLO_BATCH_SIZE',
+                       'CLASS2_CONFIDENCE_THRESHOLD', 'HASH_WORKERS', 'PIPELINE_READERS')}
+        group3.RESULT_CACHE_ENABLED = False
+        group3.YOLO_BATCH_SIZE = 4
+        group3.CLASS2_CONFIDENCE_THRESHOLD = 0.5
+        group3.HASH_WORKERS = 1
+        group3.PIPELINE_READERS = 3
+        # 红色分量各不相同：第i张为 i*25，i>=6 的是class2；共10张，最后一批只有2张
+        self.image_infos = []
+        for i in range(10):
+            path = os.path.join(self.temp_dir.name, f'{i}.png')
+            Image.new('RGB', (16, 16), (i * 25, 0, 0)).save(path)
+            self.image_infos.append({'path': path})
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(group3, name, value)
+        self.temp_dir.cleanup()
+
+    def test_results_map_to_images(self):
+        model = RecordingModel()
+        progress = []
+        class2 = classify_images_with_yolo(model, self.image_infos, on_progress=progress.append)
+        self.assertEqual(class2, self.image_infos[6:])
+        self.assertEqual(model.calls, [4, 4, 2])
+        self.assertEqual(progress, [4, 8, 10])
+
+    def test_failed_batch_retried_per_image(self):
+        model = RecordingModel(poison=7 * 25)
+        class2 = classify_images_with_yolo(model, self.image_infos)
+        # 第二批整批失败后逐张重试，只丢掉出错的那张
+        self.assertEqual(class2, [self.image_infos[i] for i in (6, 8, 9)])
+        self.assertEqual(model.calls, [4, 4, 1, 1, 1, 1, 2])
+
+    def test_unreadable_image_does_not_shift_results(self):
+        with open(self.image_infos[2]['path'], 'wb') as f:
+            f.write(b'not an image')
+        model = RecordingModel()
+        self.assertEqual(classify_images_with_yolo(model, self.image_infos), self.image_infos[6:])
+        self.assertEqual(model.calls, [3, 4, 2])
+
+    def test_cached_hits_keep_input_order(self):
+        group3.RESULT_CACHE_ENABLED = True
+        group3.RESULT_CACHE_PATH = os.path.join(self.temp_dir.name, 'cache.db')
+        group3._result_cache = None
+        classify_images_with_yolo(CachedRecordingModel(), [dict(self.image_infos[i]) for i in (7, 9)])
+
+        # 第7、9张命中缓存，和同批推理的图片混在一起，结果仍按输入顺序
+        model = CachedRecordingModel()
+        class2 = classify_images_with_yolo(model, self.image_infos)
+        self.assertEqual(class2, self.image_infos[6:])
+        self.assertEqual(model.calls, [4, 3, 1])
+
+    def test_predict_class2_probabilities_keeps_order(self):
+        images = [Image.new('RGB', (8, 8), (red, 0, 0)) for red in (0, 255, 51)]
+        probabilities = group3.predict_class2_probabilities(RecordingModel(poison=255), images)
+        self.assertAlmostEqual(probabilities[0], 0.0, places=5)
+        self.assertIsNone(probabilities[1])
+        self.assertAlmostEqual(probabilities[2], 0.2, places=5)
+
+    def test_pipeline_batches(self):
+        model = RecordingModel()
+        class2, hashes = ImagePipeline(model).run(self.image_infos)
+        # 读图线程的完成顺序不固定，但结果按输入顺序，只有最后一批不满
+        self.assertEqual(class2, self.image_infos[6:])
+        self.assertEqual(len(hashes), 4)
+        self.assertEqual(model.calls, [4, 4, 2])
+
+        model = RecordingModel(poison=7 * 25)
+        class2, _ = ImagePipeline(model).run(self.image_infos)
+        self.assertEqual(class2, [self.image_infos[i] for i in (6, 8, 9)])
+
+
+if __name__ == '__main__':
+    unittest.main()
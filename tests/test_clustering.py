@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for clustering cross-case matches into connected groups
+"""
+
+import sys
+import os
+import unittest
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from clustering import DisjointSet, cluster_pairs, member_min_distances
+
+
+def image(name, case_id):
+    return {'info': {'path': name}, 'case_id': case_id}
+
+
+class TestDisjointSet(unittest.TestCase):
+    """Test the union-find structure"""
+
+    def test_union_and_find(self):
+        dsu = DisjointSet()
+        for key in range(6):
+            dsu.add(key)
+        dsu.union(0, 1)
+        dsu.union(2, 3)
+        dsu.union(1, 3)
+        self.assertEqual(dsu.find(0), dsu.find(2))
+        self.assertNotEqual(dsu.find(0), dsu.find(4))
+
+
+class TestClusterPairs(unittest.TestCase):
+    """Test merging transitive matches into components"""
+
+    def test_shared_photo_becomes_one_group(self):
+        hub = image('hub.jpg', 'A')
+        others = [image(f'{c}.jpg', c) for c in ('B', 'C', 'D')]
+        lone1, lone2 = image('x.jpg', 'E'), image('y.jpg', 'F')
+        pairs = [(hub, others[0], 0), (hub, others[1], 2), (hub, others[2], 4), (lone1, lone2, 5)]
+
+        groups = cluster_pairs(pairs)
+        self.assertEqual(len(groups), 2)
+
+        first = groups[0]
+        self.assertEqual([m['info']['path'] for m in first['members']], ['hub.jpg', 'B.jpg', 'C.jpg', 'D.jpg'])
+        self.assertEqual(first['case_ids'], ['A', 'B', 'C', 'D'])
+        self.assertEqual(first['edges'], [(0, 1, 0), (0, 2, 2), (0, 3, 4)])
+        self.assertEqual(member_min_distances(first), [0, 0, 2, 4])
+
+        self.assertEqual(groups[1]['edges'], [(0, 1, 5)])
+
+    def test_chain_is_merged(self):
+        a, b, c = image('a', 'A'), image('b', 'B'), image('c', 'C')
+        groups = cluster_pairs([(a, b, 3), (c, a, 1)])
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(len(groups[0]['members']), 3)
+
+    def test_empty(self):
+        self.assertEqual(cluster_pairs([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
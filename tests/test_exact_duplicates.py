@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the exact-duplicate fast path (ZIP CRC32 + size, SHA-256 confirm)
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import group3
+from group3 import ExactDuplicateIndex, extract_archives, extract_zip_files, group_exact_duplicates, expand_exact_duplicates
+
+
+class TestExactDuplicates(unittest.TestCase):
+    """Test CRC metadata extraction, grouping and fan-out"""
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.temp_dirs = []
+        self._cache_enabled = group3.RESULT_CACHE_ENABLED
+        group3.RESULT_CACHE_ENABLED = False
+
+        same = b'\xff\xd8 identical bytes \xff\xd9'
+        for case, members in (('DQIHA001', {'a/1.jpg': same, 'a/2.jpg': b'\xff\xd8 other \xff\xd9'}),
+                              ('DQIHB002', {'b/1.jpg': same})):
+            with zipfile.ZipFile(os.path.join(self.upload_dir, f'{case}__20250101.zip'), 'w') as zf:
+                for name, data in members.items():
+                    zf.writestr(name, data)
+
+    def tearDown(self):
+        group3.RESULT_CACHE_ENABLED = self._cache_enabled
+        for path in [self.upload_dir] + self.temp_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def test_crc_recorded_and_duplicates_grouped(self):
+        image_infos, self.temp_dirs = extract_zip_files(self.upload_dir)
+        self.assertEqual(len(image_infos), 3)
+        for info in image_infos:
+            self.assertIsNotNone(info['crc32'])
+            self.assertIsNotNone(info['file_size'])
+
+        representatives, copies, cross_case_sets = group_exact_duplicates(image_infos)
+        self.assertEqual(len(representatives), 2)
+        self.assertEqual(len(cross_case_sets), 1)
+        self.assertEqual({os.path.basename(i['source_zip'])[:8] for i in cross_case_sets[0]},
+                         {'DQIHA001', 'DQIHB002'})
+
+        expanded, hashes = expand_exact_duplicates(representatives, copies, ['h1', 'h2'])
+        self.assertEqual(len(expanded), 3)
+        by_name = {info['relative_path']: h for info, h in zip(expanded, hashes)}
+        self.assertEqual(by_name['a/1.jpg'], by_name['b/1.jpg'])
+        self.assertNotEqual(by_name['a/1.jpg'], by_name['a/2.jpg'])
+
+    def test_duplicates_across_batches(self):
+        # 分块上传时每个ZIP单独处理，靠任务级索引找到之前批次的代表
+        same = b'\xff\xd8 identical bytes \xff\xd9'
+        with zipfile.ZipFile(os.path.join(self.upload_dir, 'DQIHC003__20250101.zip'), 'w') as zf:
+            zf.writestr('c/1.jpg', same)
+        index = ExactDuplicateIndex()
+        batches = []
+        for name in ('DQIHA001__20250101.zip', 'DQIHB002__20250101.zip', 'DQIHC003__20250101.zip'):
+            image_infos, temp_dirs = extract_archives([(os.path.join(self.upload_dir, name), name)])
+            self.temp_dirs.extend(temp_dirs)
+            batches.append(group_exact_duplicates(image_infos, index))
+
+        first, second, third = batches
+        self.assertEqual(len(first[0]), 2)
+        self.assertEqual(first[2], [])
+        # 后两批的图片都是第一批代表的副本，没有需要分类的图片；跨案件号的集合只在第一次出现时计数
+        self.assertEqual(second[0], [])
+        self.assertEqual(len(second[2]), 1)
+        self.assertEqual(third[0], [])
+        self.assertEqual(third[2], [])
+
+        representative = next(info for info in first[0] if info['relative_path'] == 'a/1.jpg')
+        expanded, hashes = expand_exact_duplicates([representative], first[1], ['h1'], index)
+        self.assertEqual((len(expanded), hashes), (1, ['h1']))
+        expanded, hashes = expand_exact_duplicates([], second[1], [], index)
+        self.assertEqual([info['relative_path'] for info in expanded], ['b/1.jpg'])
+        self.assertEqual(hashes, ['h1'])
+
+    def test_crc_collision_is_not_a_duplicate(self):
+        infos = []
+        for k, data in enumerate((b'first', b'second')):
+            path = os.path.join(self.upload_dir, f'{k}.jpg')
+            with open(path, 'wb') as f:
+                f.write(data)
+            # 伪造相同的CRC和大小，必须靠摘要区分
+            infos.append({'path': path, 'source_zip': f'DQIHC00{k}__1.zip', 'crc32': 1, 'file_size': 6})
+
+        representatives, copies, cross_case_sets = group_exact_duplicates(infos)
+        self.assertEqual(len(representatives), 2)
+        self.assertEqual(copies, {})
+        self.assertEqual(cross_case_sets, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
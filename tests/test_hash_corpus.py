@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent pHash corpus
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from hash_corpus import HashCorpus
+from hash_index import find_cross_case_pairs
+from clustering import cluster_pairs
+
+
+class TestHashCorpus(unittest.TestCase):
+    """Test storing and reloading hashes across sessions"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'corpus', 'hashes.db')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def entry(self, hash_value, relative_path):
+        return {'hash': hash_value, 'case_id': 'DQIH001',
+                'info': {'source_zip': 'DQIH001__1.zip', 'relative_path': relative_path}}
+
+    def test_round_trip(self):
+        corpus = HashCorpus(self.db_path)
+        big = (1 << 64) - 1
+        self.assertEqual(corpus.add([self.entry(big, 'a.jpg'), self.entry(5, 'b.jpg')], 64, 'session-1'), 2)
+
+        reopened = HashCorpus(self.db_path)
+        entries = reopened.load(64)
+        self.assertEqual([e['hash'] for e in entries], [big, 5])
+        self.assertEqual(entries[0]['case_id'], 'DQIH001')
+        self.assertTrue(entries[0]['info']['historical'])
+        self.assertIsNone(entries[0]['info']['path'])
+        self.assertEqual(reopened.load(256), [])
+
+    def test_duplicates_are_skipped(self):
+        corpus = HashCorpus(self.db_path)
+        corpus.add([self.entry(5, 'a.jpg')], 64)
+        self.assertEqual(corpus.add([self.entry(5, 'a.jpg'), self.entry(6, 'a.jpg')], 64), 1)
+        self.assertEqual(len(corpus), 2)
+
+    def test_exclude_current_upload_and_session(self):
+        corpus = HashCorpus(self.db_path)
+        corpus.add([self.entry(5, 'a.jpg'), self.entry(6, 'b.jpg')], 64, 'session-1')
+        self.assertEqual([e['hash'] for e in corpus.load(64, session_id='session-1')], [])
+        entries = corpus.load(64, exclude={('DQIH001__1.zip', 'a.jpg')})
+        self.assertEqual([e['info']['relative_path'] for e in entries], ['b.jpg'])
+
+    def test_repeated_upload_does_not_match_itself(self):
+        """同一批图片处理两次（重新上传或任务重试），第二次只得到本次上传内的那一组"""
+        corpus = HashCorpus(self.db_path)
+
+        def run(session_id):
+            case_groups = {
+                'CASEA': [{'hash': 0xF0F0, 'case_id': 'CASEA',
+                           'info': {'source_zip': 'CASEA__1.zip', 'relative_path': 'x.jpg'}}],
+                'CASEB': [{'hash': 0xF0F1, 'case_id': 'CASEB',
+                           'info': {'source_zip': 'CASEB__1.zip', 'relative_path': 'y.jpg'}}]
+            }
+            current = {(d['info']['source_zip'], d['info']['relative_path'])
+                       for images in case_groups.values() for d in images}
+            history = corpus.load(64, session_id=session_id, exclude=current)
+            groups = cluster_pairs(find_cross_case_pairs(case_groups, 5, history=history))
+            corpus.add([d for images in case_groups.values() for d in images], 64, session_id)
+            return groups
+
+        for session_id in ('session-1', 'session-2', 'session-2'):
+            groups = run(session_id)
+            self.assertEqual(len(groups), 1)
+            self.assertEqual(len(groups[0]['members']), 2)
+            self.assertFalse(any(m['info'].get('historical') for m in groups[0]['members']))
+
+
+if __name__ == '__main__':
+    unittest.main()
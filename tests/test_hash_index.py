@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for the cross-case Hamming neighbor search
+"""
+
+import sys
+import os
+import random
+import unittest
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from hash_index import BKTree, find_cross_case_pairs, hamming_distance, split_bands
+
+
+def make_case_groups(seed=42, cases=6, per_case=40):
+    """Random 64-bit hashes with planted near-duplicates across cases"""
+    rng = random.Random(seed)
+    base = [rng.getrandbits(64) for _ in range(20)]
+    case_groups = {}
+    for c in range(cases):
+        images = []
+        for k in range(per_case):
+            if k % 4 == 0:
+                # flip a few bits of a shared base hash
+                value = rng.choice(base)
+                for _ in range(rng.randint(0, 7)):
+                    value ^= 1 << rng.randrange(64)
+            else:
+                value = rng.getrandbits(64)
+            images.append({'hash': value, 'info': {'id': (c, k)}, 'case_id': f'CASE{c}'})
+        case_groups[f'CASE{c}'] = images
+    return case_groups
+
+
+def pair_keys(pairs):
+    return [(a['info']['id'], b['info']['id'], d) for a, b, d in pairs]
+
+
+class TestBKTree(unittest.TestCase):
+    """Test the BK-tree metric index"""
+
+    def test_query_matches_linear_scan(self):
+        rng = random.Random(1)
+        values = [rng.getrandbits(64) for _ in range(300)]
+        values += [values[0] ^ 0b1011, values[1]]
+        tree = BKTree()
+        for i, value in enumerate(values):
+            tree.add(value, i)
+        self.assertEqual(len(tree), len(values))
+
+        for probe in values[:20]:
+            expected = sorted((i, hamming_distance(probe, v)) for i, v in enumerate(values)
+                              if hamming_distance(probe, v) <= 5)
+            self.assertEqual(sorted(tree.query(probe, 5)), expected)
+
+
+class TestCrossCasePairs(unittest.TestCase):
+    """Test that every matcher engine agrees with brute force"""
+
+    def test_bktree_matches_brute(self):
+        case_groups = make_case_groups()
+        expected = pair_keys(find_cross_case_pairs(case_groups, 5, engine='brute'))
+        self.assertTrue(expected)
+        self.assertEqual(pair_keys(find_cross_case_pairs(case_groups, 5, engine='bktree')), expected)
+
+    def test_mih_matches_brute(self):
+        case_groups = make_case_groups(seed=7)
+        for threshold in (0, 3, 5, 8):
+            expected = pair_keys(find_cross_case_pairs(case_groups, threshold, engine='brute'))
+            self.assertEqual(pair_keys(find_cross_case_pairs(case_groups, threshold, engine='mih')), expected)
+
+    def test_numpy_matches_brute(self):
+        import hash_index
+        case_groups = make_case_groups(seed=3, cases=5, per_case=70)
+        expected = pair_keys(find_cross_case_pairs(case_groups, 5, engine='brute'))
+        original_block = hash_index.NUMPY_BLOCK_SIZE
+        try:
+            # small blocks exercise the block boundaries
+            hash_index.NUMPY_BLOCK_SIZE = 16
+            self.assertEqual(pair_keys(find_cross_case_pairs(case_groups, 5, engine='numpy')), expected)
+        finally:
+            hash_index.NUMPY_BLOCK_SIZE = original_block
+
+    def test_numpy_wide_hashes(self):
+        rng = random.Random(11)
+        shared = rng.getrandbits(256)
+        case_groups = {
+            'A': [{'hash': shared, 'info': {'id': 1}, 'case_id': 'A'}],
+            'B': [{'hash': shared ^ (1 << 200) ^ 1, 'info': {'id': 2}, 'case_id': 'B'},
+                  {'hash': rng.getrandbits(256), 'info': {'id': 3}, 'case_id': 'B'}],
+        }
+        self.assertEqual(pair_keys(find_cross_case_pairs(case_groups, 5, engine='numpy')), [(1, 2, 2)])
+
+    def test_history_matches_brute(self):
+        case_groups = make_case_groups(seed=5, cases=4, per_case=30)
+        old_groups = make_case_groups(seed=6, cases=6, per_case=30)
+        # history shares some case ids with the upload and is only matched against it
+        history = [dict(img, case_id=f'OLD{img["case_id"]}' if n % 2 else img['case_id'])
+                   for n, img in enumerate(sum(old_groups.values(), []))]
+        expected = pair_keys(find_cross_case_pairs(case_groups, 5, engine='brute', history=history))
+        self.assertTrue(any(b['info']['id'] in [h['info']['id'] for h in history]
+                            for _, b, _ in find_cross_case_pairs(case_groups, 5, engine='brute', history=history)))
+        for engine in ('bktree', 'mih', 'numpy'):
+            self.assertEqual(pair_keys(find_cross_case_pairs(case_groups, 5, engine=engine, history=history)),
+                             expected, engine)
+
+    def test_history_pairs_are_not_repeated(self):
+        history = [{'hash': 1, 'info': {'id': 'h1'}, 'case_id': 'X'},
+                   {'hash': 1, 'info': {'id': 'h2'}, 'case_id': 'Y'},
+                   {'hash': 1, 'info': {'id': 'h3'}, 'case_id': 'A'}]
+        case_groups = {'A': [{'hash': 0, 'info': {'id': 'n1'}, 'case_id': 'A'}]}
+        for engine in ('brute', 'bktree', 'mih', 'numpy'):
+            self.assertEqual(pair_keys(find_cross_case_pairs(case_groups, 5, engine=engine, history=history)),
+                             [('n1', 'h1', 1), ('n1', 'h2', 1)], engine)
+
+    def test_split_bands_covers_all_bits(self):
+        bands = split_bands(64, 6)
+        self.assertEqual(len(bands), 6)
+        covered = 0
+        for shift, mask in bands:
+            self.assertEqual(covered & (mask << shift), 0)
+            covered |= mask << shift
+        self.assertEqual(covered, (1 << 64) - 1)
+
+    def test_same_case_hits_are_filtered(self):
+        case_groups = {'A': [{'hash': 7, 'info': {'id': 1}, 'case_id': 'A'},
+                             {'hash': 7, 'info': {'id': 2}, 'case_id': 'A'}],
+                       'B': [{'hash': 6, 'info': {'id': 3}, 'case_id': 'B'}]}
+        pairs = pair_keys(find_cross_case_pairs(case_groups, 5))
+        self.assertEqual(pairs, [(1, 3, 1), (2, 3, 1)])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            find_cross_case_pairs({}, 5, engine='nope')
+
+
+if __name__ == '__main__':
+    unittest.main()
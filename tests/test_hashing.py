@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Tests for perceptual hashing: the hash process pool, draft decoding and EXIF thumbnails
+"""
+
+import sys
+import os
+import io
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+# Add src and tools directories to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tools'))
+
+import group3
+from group3 import calculate_image_hashes, summarize_decode_validation
+from validate_hash_decode import validate_directory
+
+
+def build_exif(order, thumbnail=None, thumb_length=None):
+    """APP1 EXIF数据：IFD0一个条目；有thumbnail时IFD1指向它（thumb_length可故意写错）"""
+    fmt = '<' if order == 'II' else '>'
+    ifd1_offset = 8 + 18 if thumbnail is not None else 0
+    tiff = order.encode() + struct.pack(fmt + 'HI', 42, 8)
+    tiff += struct.pack(fmt + 'H', 1) + struct.pack(fmt + 'HHIHH', 0x0112, 3, 1, 1, 0) + struct.pack(fmt + 'I', ifd1_offset)
+    if thumbnail is not None:
+        thumb_offset = ifd1_offset + 2 + 2 * 12 + 4
+        length = len(thumbnail) if thumb_length is None else thumb_length
+        tiff += struct.pack(fmt + 'H', 2)
+        tiff += struct.pack(fmt + 'HHII', 0x0201, 4, 1, thumb_offset) + struct.pack(fmt + 'HHII', 0x0202, 4, 1, length)
+        tiff += struct.pack(fmt + 'I', 0) + thumbnail
+    return b'Exif\x00\x00' + tiff
+
+
+class HashTestCase(unittest.TestCase):
+    """临时目录 + 关闭结果缓存，测试结束后还原改过的配置"""
+
+    overrides = {}
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        overrides = dict(self.overrides, RESULT_CACHE_ENABLED=False)
+        self.saved = {name: getattr(group3, name) for name in overrides}
+        for name, value in overrides.items():
+            setattr(group3, name, value)
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(group3, name, value)
+        self.temp_dir.cleanup()
+
+    def make_image(self, name, seed, size=(64, 48), **save_args):
+        pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        path = os.path.join(self.temp_dir.name, name)
+        Image.fromarray(pixels).save(path, **save_args)
+        return {'path': path}
+
+    def make_photo(self, name, seed, size=(800, 600)):
+        """平滑的“照片”：随机色块放大，JPEG保存"""
+        pixels = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+        path = os.path.join(self.temp_dir.name, name)
+        Image.fromarray(pixels).resize(size, Image.BICUBIC).save(path, 'JPEG', quality=90)
+        return {'path': path}
+
+
+class TestHashPool(HashTestCase):
+    """Test input order, per-image failures and the serial path"""
+
+    overrides = {'HASH_CHUNK_SIZE': 2, 'HASH_DECODE_MODE': 'full', 'HASH_SOURCE': 'image'}
+
+    def setUp(self):
+        super().setUp()
+        self.image_infos = [self.make_image(f'{i:02d}.png', i) for i in range(13)]
+
+    def test_pool_keeps_input_order(self):
+        serial = [group3.calculate_image_hash(info) for info in self.image_infos]
+        self.assertEqual(len(set(map(str, serial))), len(serial))
+        progress = []
+        self.assertEqual(calculate_image_hashes(self.image_infos, workers=4, on_progress=progress.append), serial)
+        self.assertEqual(progress, list(range(1, 14)))
+
+    def test_failed_image_maps_to_none(self):
+        broken = os.path.join(self.temp_dir.name, 'broken.png')
+        with open(broken, 'wb') as f:
+            f.write(b'not an image')
+        image_infos = self.image_infos[:5] + [{'path': broken}] + self.image_infos[5:]
+        stats = {}
+        hashes = calculate_image_hashes(image_infos, workers=3, stats=stats)
+        self.assertEqual(len(hashes), 14)
+        self.assertIsNone(hashes[5])
+        self.assertTrue(all(h is not None for k, h in enumerate(hashes) if k != 5))
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['image'], 13)
+
+    def test_pool_uses_parent_settings(self):
+        # 子进程不是fork出来的，重新导入group3；运行时改过的配置要传过去
+        with mock.patch.object(group3, 'HASH_SIZE', 16), \
+                mock.patch.object(group3, 'ProcessPoolExecutor', wraps=group3.ProcessPoolExecutor) as pool:
+            hashes = calculate_image_hashes(self.image_infos, workers=2)
+        self.assertNotEqual(pool.call_args.kwargs['mp_context'].get_start_method(), 'fork')
+        self.assertTrue(all(h.hash.shape == (16, 16) for h in hashes))
+
+    def test_single_worker_runs_serially(self):
+        # 进程池创建失败时也会退回串行，所以直接检查有没有创建
+        with mock.patch.object(group3, 'HASH_WORKERS', 1), mock.patch.object(group3, 'ProcessPoolExecutor') as pool:
+            hashes = calculate_image_hashes(self.image_infos)
+        pool.assert_not_called()
+        self.assertEqual(hashes, [group3.calculate_image_hash(info) for info in self.image_infos])
+
+
+
+class TestDraftDecode(HashTestCase):
+    """Test draft decoding against full decoding and the validation report"""
+
+    overrides = {'HASH_SOURCE': 'image', 'HASH_WORKERS': 1}
+
+    def hash_with_mode(self, image_info, mode):
+        with mock.patch.object(group3, 'HASH_DECODE_MODE', mode):
+            return group3.calculate_image_hash(image_info)
+
+    def test_draft_close_to_full_for_jpeg(self):
+        for seed in range(5):
+            image_info = self.make_photo(f'{seed}.jpg', seed)
+            full, draft = group3._calculate_hash_pair(image_info)
+            self.assertLessEqual(full - draft, group3.HASH_THRESHOLD)
+            self.assertEqual(self.hash_with_mode(image_info, 'draft'), draft)
+            self.assertEqual(self.hash_with_mode(image_info, 'full'), full)
+
+    def test_draft_decodes_jpeg_at_reduced_size(self):
+        image_info = self.make_photo('a.jpg', 0)
+        with mock.patch.object(group3.imagehash, 'phash', wraps=group3.imagehash.phash) as phash:
+            self.hash_with_mode(image_info, 'draft')
+        decoded = phash.call_args[0][0]
+        self.assertEqual(decoded.mode, 'L')
+        self.assertLess(decoded.size[0], 800)
+
+    def test_non_jpeg_falls_back_to_full_decode(self):
+        image_info = self.make_image('a.png', 0)
+        full, draft = group3._calculate_hash_pair(image_info)
+        self.assertEqual(full, draft)
+        self.assertEqual(self.hash_with_mode(image_info, 'draft'), full)
+
+    def test_validate_mode_returns_full_hashes(self):
+        image_infos = [self.make_photo(f'{seed}.jpg', seed) for seed in range(3)]
+        full = [self.hash_with_mode(info, 'full') for info in image_infos]
+        with mock.patch.object(group3, 'HASH_DECODE_MODE', 'validate'):
+            self.assertEqual(calculate_image_hashes(image_infos), full)
+
+    def test_summary_report_fields(self):
+        h = group3.imagehash.hex_to_hash
+        pairs = [
+            (h('0000000000000000'), h('0000000000000000')),  # 0
+            (h('0000000000000000'), h('0000000000000003')),  # 2
+            (h('0000000000000000'), h('00000000000000ff')),  # 8，超过阈值
+            (None, h('0000000000000000')),                    # 解码失败，不计入
+        ]
+        self.assertEqual(summarize_decode_validation(pairs), {
+            'compared': 3, 'differing': 2, 'over_threshold': 1, 'max_distance': 8, 'mean_distance': 3.333
+        })
+        self.assertEqual(summarize_decode_validation([]), {
+            'compared': 0, 'differing': 0, 'over_threshold': 0, 'max_distance': 0, 'mean_distance': 0.0
+        })
+
+    def test_validate_tool_report(self):
+        self.make_photo('a.jpg', 0)
+        self.make_image('b.png', 1)
+        with open(os.path.join(self.temp_dir.name, 'broken.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        with mock.patch('sys.stdout'):
+            report = validate_directory(self.temp_dir.name)
+        self.assertEqual(report['total'], 3)
+        self.assertEqual(report['compared'], 2)
+        self.assertLessEqual(report['max_distance'], group3.HASH_THRESHOLD)
+
+
+
+class TestExifThumbnail(HashTestCase):
+    """Test thumbnail extraction and the fallback to full decoding"""
+
+    overrides = {'HASH_SOURCE': 'exif_thumbnail', 'HASH_DECODE_MODE': 'full', 'HASH_WORKERS': 1}
+
+    def setUp(self):
+        super().setUp()
+        pixels = np.random.default_rng(0).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+        self.photo = Image.fromarray(pixels).resize((800, 600), Image.BICUBIC)
+        buf = io.BytesIO()
+        self.photo.resize((160, 120)).save(buf, 'JPEG', quality=90)
+        self.thumbnail = buf.getvalue()
+
+    def save_photo(self, name, exif=None):
+        path = os.path.join(self.temp_dir.name, name)
+        self.photo.save(path, 'JPEG', quality=90, **({'exif': exif} if exif is not None else {}))
+        return {'path': path}
+
+    def full_hash(self, image_info):
+        with mock.patch.object(group3, 'HASH_SOURCE', 'image'):
+            return group3.calculate_image_hash(image_info)
+
+    def test_read_thumbnail_both_byte_orders(self):
+        for order in ('II', 'MM'):
+            self.assertEqual(group3._read_exif_thumbnail(build_exif(order, self.thumbnail)), self.thumbnail)
+            image_info = self.save_photo(f'{order}.jpg', build_exif(order, self.thumbnail))
+            h, source = group3.calculate_image_hash_with_source(image_info)
+            self.assertEqual(source, 'exif_thumbnail')
+            self.assertLessEqual(h - self.full_hash(image_info), group3.HASH_THRESHOLD)
+
+    def test_missing_ifd1(self):
+        for order in ('II', 'MM'):
+            self.assertIsNone(group3._read_exif_thumbnail(build_exif(order)))
+        self.assertIsNone(group3._read_exif_thumbnail(b'Exif\x00\x00XX'))
+        image_info = self.save_photo('no_ifd1.jpg', build_exif('II'))
+        self.assertEqual(group3.calculate_image_hash_with_source(image_info),
+                         (self.full_hash(image_info), 'image'))
+
+    def test_corrupt_thumbnail_falls_back_to_full_decode(self):
+        exifs = {
+            'truncated.jpg': build_exif('II', self.thumbnail, thumb_length=len(self.thumbnail) * 2)[:200],
+            'garbage.jpg': build_exif('MM', b'\xff\xd8 not a jpeg'),
+            'short_ifd.jpg': build_exif('II', self.thumbnail)[:24],
+            'cropped.jpg': build_exif('II', self._cropped_thumbnail()),
+        }
+        for name, exif in exifs.items():
+            image_info = self.save_photo(name, exif)
+            self.assertEqual(group3.calculate_image_hash_with_source(image_info),
+                             (self.full_hash(image_info), 'image'), name)
+
+    def _cropped_thumbnail(self):
+        """宽高比与原图不一致的缩略图"""
+        buf = io.BytesIO()
+        self.photo.resize((160, 160)).save(buf, 'JPEG')
+        return buf.getvalue()
+
+    def test_source_counters(self):
+        image_infos = [
+            self.save_photo('a.jpg', build_exif('II', self.thumbnail)),
+            self.save_photo('b.jpg', build_exif('MM', self.thumbnail)),
+            self.save_photo('c.jpg'),
+            self.save_photo('d.jpg', build_exif('II', b'\xff\xd8 not a jpeg')),
+            {'path': os.path.join(self.temp_dir.name, 'missing.jpg')},
+        ]
+        stats = {}
+        hashes = calculate_image_hashes(image_infos, stats=stats)
+        self.assertEqual(dict(stats), {'exif_thumbnail': 2, 'image': 2, 'failed': 1, 'cache': 0})
+        self.assertIsNone(hashes[4])
+
+
+if __name__ == '__main__':
+    unittest.main()
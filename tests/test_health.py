@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for the liveness and readiness endpoints
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# app导入时在当前目录下创建上传、结果和授权目录，放到临时目录里
+_import_dir = tempfile.TemporaryDirectory()
+_cwd = os.getcwd()
+os.chdir(_import_dir.name)
+try:
+    with mock.patch.dict(os.environ, {'JOB_BACKEND': 'thread'}):
+        import app
+finally:
+    os.chdir(_cwd)
+
+from job_queue import JobQueue
+
+
+class TestHealthEndpoints(unittest.TestCase):
+    """Test /livez and /readyz while loading, after warm-up, after a failed load and in queue mode"""
+
+    def setUp(self):
+        self.client = app.app.test_client()
+        patches = [
+            mock.patch.dict(app.processing_status, {'authorization_status': 'authorized', 'model_status': 'loading',
+                                                    'error': None}),
+            mock.patch.object(app, 'yolo_model', None),
+            mock.patch.object(app.group3, 'warm_up_model'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        app.processing_status.pop('model_warmup_seconds', None)
+
+    def test_livez_while_loading(self):
+        response = self.client.get('/livez')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'alive')
+
+    def test_readyz_after_warm_up(self):
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['model'], 'loading')
+
+        model = object()
+        with mock.patch.object(app, 'load_yolo_model', return_value=model):
+            app._load_model()
+        app.group3.warm_up_model.assert_called_once_with(model)
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        checks = response.get_json()
+        self.assertEqual((checks['status'], checks['model']), ('ready', 'ready'))
+        self.assertIn('model_warmup_seconds', checks)
+
+    def test_readyz_after_failed_load(self):
+        with mock.patch.object(app, 'load_yolo_model', side_effect=RuntimeError('权重文件损坏')):
+            app._load_model()
+        self.assertTrue(app.model_loaded.is_set())
+        self.assertIn('权重文件损坏', app.processing_status['error'])
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['model'], 'failed')
+        # 进程本身还活着，不该被重启
+        self.assertEqual(self.client.get('/livez').status_code, 200)
+
+    def test_readyz_unauthorized(self):
+        app.processing_status.update(authorization_status='unauthorized', model_status='ready')
+        self.assertEqual(self.client.get('/readyz').status_code, 503)
+
+    def test_readyz_queue_mode_counts_ready_workers(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            job_queue = JobQueue(os.path.join(temp_dir, 'jobs.db'))
+            app.processing_status['model_status'] = 'external'
+            with mock.patch.object(app, 'job_queue', job_queue):
+                response = self.client.get('/readyz')
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.get_json()['ready_workers'], 0)
+
+                job_queue.worker_ready('w1')
+                response = self.client.get('/readyz')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get_json()['ready_workers'], 1)
+
+                # worker心跳超时就不算
+                with mock.patch.object(app, 'JOB_HEARTBEAT_TIMEOUT', -1):
+                    self.assertEqual(self.client.get('/readyz').status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the durable job queue used by separate worker processes
+"""
+
+import sys
+import os
+import queue
+import tempfile
+import unittest
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from job_queue import JobQueue, DurableArchiveQueue, UPLOAD_ABORTED
+
+
+class TestJobQueue(unittest.TestCase):
+    """Test claiming, finishing and recovering jobs"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(os.path.join(self.temp_dir.name, 'jobs.db'), max_attempts=2)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_claim_in_order_and_exclusive(self):
+        self.queue.enqueue('a')
+        self.queue.enqueue('b')
+        self.assertEqual(self.queue.claim('w1')['job_id'], 'a')
+        self.assertEqual(self.queue.claim('w2')['job_id'], 'b')
+        self.assertIsNone(self.queue.claim('w3'))
+
+        self.queue.finish('a', 'w1')
+        self.queue.finish('b', 'w2', error='boom')
+        self.assertEqual(self.queue.get('a')['state'], 'done')
+        self.assertEqual(self.queue.get('b')['error'], 'boom')
+        self.assertEqual(self.queue.counts()['failed'], 1)
+
+    def test_stale_jobs_requeued_then_failed(self):
+        self.queue.enqueue('a')
+        self.queue.claim('w1')
+        self.assertEqual(self.queue.requeue_stale(timeout=-1), ['a'])
+
+        # 旧worker回来后不能覆盖已被重新领取的任务
+        self.assertEqual(self.queue.claim('w2')['attempts'], 2)
+        self.queue.finish('a', 'w1')
+        self.assertEqual(self.queue.get('a')['state'], 'running')
+
+        self.assertEqual(self.queue.requeue_stale(timeout=-1), [])
+        self.assertEqual(self.queue.get('a')['state'], 'failed')
+
+    def test_durable_archive_queue(self):
+        self.queue.enqueue('a', chunked=True)
+        producer = DurableArchiveQueue(self.queue, 'a')
+        consumer = DurableArchiveQueue(self.queue, 'a', poll_interval=0.01)
+        self.assertTrue(consumer.empty())
+        with self.assertRaises(queue.Empty):
+            consumer.get(timeout=0.05)
+
+        producer.put([('/x/1.zip', '1.zip')])
+        producer.put([('/x/2.zip', '2.zip')])
+        producer.put(None)
+        self.assertEqual(consumer.get(), [('/x/1.zip', '1.zip'), ('/x/2.zip', '2.zip')])
+        self.assertIsNone(consumer.get())
+
+        # worker重启后从头读取
+        restarted = DurableArchiveQueue(self.queue, 'a')
+        self.assertEqual(len(restarted.get()), 2)
+
+    def test_abort_upload(self):
+        # 还没被领取的任务直接失败
+        self.queue.enqueue('a', chunked=True)
+        DurableArchiveQueue(self.queue, 'a').put(UPLOAD_ABORTED)
+        self.assertEqual(self.queue.get('a')['state'], 'failed')
+        self.assertIsNone(self.queue.claim('w1'))
+
+        # 执行中的任务：已收到但还没取走的ZIP不再处理
+        self.queue.enqueue('b', chunked=True)
+        self.queue.claim('w1')
+        producer = DurableArchiveQueue(self.queue, 'b')
+        consumer = DurableArchiveQueue(self.queue, 'b', poll_interval=0.01)
+        producer.put([('/x/1.zip', '1.zip')])
+        producer.put(UPLOAD_ABORTED)
+        self.assertFalse(consumer.empty())
+        self.assertEqual(consumer.get(timeout=1), UPLOAD_ABORTED)
+        self.assertEqual(self.queue.get('b')['state'], 'running')
+
+    def test_ready_workers(self):
+        self.assertEqual(self.queue.ready_workers(timeout=60), 0)
+        self.queue.worker_ready('w1')
+        self.queue.worker_ready('w2')
+        self.queue.worker_ready('w1')
+        self.assertEqual(self.queue.ready_workers(timeout=60), 2)
+
+        self.queue.worker_gone('w2')
+        self.assertEqual(self.queue.ready_workers(timeout=60), 1)
+
+        # 心跳超时的登记不算，并在requeue_stale时清掉
+        self.assertEqual(self.queue.ready_workers(timeout=-1), 0)
+        self.queue.requeue_stale(timeout=-1)
+        self.assertEqual(self.queue.ready_workers(timeout=60), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
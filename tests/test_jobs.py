@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for per-job workspaces and scheduling
+"""
+
+import sys
+import os
+import threading
+import tempfile
+import unittest
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from jobs import JobManager
+
+
+class TestJobManager(unittest.TestCase):
+    """Test workspaces, persisted status and the concurrency limit"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.uploads = os.path.join(self.temp_dir.name, 'uploads')
+        self.results = os.path.join(self.temp_dir.name, 'results')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_jobs_have_separate_workspaces(self):
+        manager = JobManager(self.uploads, self.results)
+        job1, job2 = manager.create(), manager.create()
+        self.assertNotEqual(job1.upload_dir, job2.upload_dir)
+        self.assertNotEqual(job1.results_dir, job2.results_dir)
+        self.assertIs(manager.latest(), job2)
+        self.assertIs(manager.get(job1.job_id), job1)
+
+    def test_status_survives_restart(self):
+        manager = JobManager(self.uploads, self.results)
+        done = manager.create()
+        manager.start(done, lambda job: job.status.update(groups_found=3)).join()
+        running = manager.create()
+        running.status['state'] = 'running'
+        running.save(force=True)
+
+        reloaded = JobManager(self.uploads, self.results)
+        self.assertEqual(reloaded.get(done.job_id).status['state'], 'done')
+        self.assertEqual(reloaded.get(done.job_id).status['groups_found'], 3)
+        self.assertEqual(reloaded.get(running.job_id).status['state'], 'failed')
+        self.assertFalse(reloaded.get(running.job_id).status['is_processing'])
+
+    def test_concurrency_limit(self):
+        manager = JobManager(self.uploads, self.results, max_concurrent=1)
+        release = threading.Event()
+        first, second = manager.create(), manager.create()
+        t1 = manager.start(first, lambda job: release.wait(5))
+        t2 = manager.start(second, lambda job: None)
+        t2.join(0.2)
+        self.assertEqual(second.status['state'], 'queued')
+        release.set()
+        t1.join()
+        t2.join()
+        self.assertEqual(second.status['state'], 'done')
+
+    def test_waiting_job_releases_slot(self):
+        manager = JobManager(self.uploads, self.results, max_concurrent=1)
+        upload_arrived, release = threading.Event(), threading.Event()
+        waiting, other = manager.create(), manager.create()
+
+        def wait_for_upload(job):
+            with manager.waiting(job):
+                upload_arrived.wait(5)
+            release.wait(5)
+
+        t1 = manager.start(waiting, wait_for_upload)
+        t1.join(0.1)
+        # 等待上传的任务不占名额，后来的任务不用排队
+        manager.start(other, lambda job: None).join(1)
+        self.assertEqual(other.status['state'], 'done')
+
+        # 等到ZIP后重新占用名额
+        upload_arrived.set()
+        t1.join(0.1)
+        self.assertFalse(manager.acquire_slot(timeout=0.05))
+        release.set()
+        t1.join()
+        self.assertEqual(waiting.status['state'], 'done')
+        self.assertTrue(manager.acquire_slot(timeout=0))
+
+    def test_failed_job_state(self):
+        manager = JobManager(self.uploads, self.results)
+        job = manager.create()
+        manager.start(job, lambda job: job.status.update(error='boom')).join()
+        self.assertEqual(job.status['state'], 'failed')
+
+    def test_prune_keeps_recent_finished_jobs(self):
+        manager = JobManager(self.uploads, self.results, keep_jobs=1)
+        old = manager.create()
+        manager.start(old, lambda job: None).join()
+        newer = manager.create()
+        manager.start(newer, lambda job: None).join()
+        manager.create()
+        self.assertIsNone(manager.get(old.job_id))
+        self.assertFalse(os.path.exists(old.results_dir))
+        self.assertIsNotNone(manager.get(newer.job_id))
+
+    def test_external_workers_see_jobs_from_other_processes(self):
+        web = JobManager(self.uploads, self.results, external_workers=True)
+        other = JobManager(self.uploads, self.results, external_workers=True)
+        job = other.create()
+        job.status['progress'] = 42
+        job.save(force=True)
+        self.assertEqual(web.get(job.job_id).status['progress'], 42)
+        self.assertIsNone(web.get('..'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the ONNX export cache and preprocessing of the CPU inference backend
+"""
+
+import sys
+import os
+import json
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import group3
+from onnx_classifier import ClassifyResult, export_onnx, export_paths, load_metadata, preprocess
+
+
+class TestOnnxClassifier(unittest.TestCase):
+    """Test export naming, preprocessing and the result interface"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.weights = os.path.join(self.temp_dir.name, 'best.pt')
+        with open(self.weights, 'wb') as f:
+            f.write(b'weights v1')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_export_cached_by_weights_checksum(self):
+        onnx_path, meta_path = export_paths(self.weights)
+        self.assertTrue(onnx_path.startswith(os.path.join(self.temp_dir.name, 'best.')))
+        open(onnx_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump({'names': {'0': 'class1', '1': 'class2'}, 'imgsz': 224}, f)
+
+        # 已导出：不需要ultralytics
+        self.assertEqual(export_onnx(self.weights), onnx_path)
+        self.assertEqual(load_metadata(onnx_path), ({0: 'class1', 1: 'class2'}, 224))
+
+        # 换了权重，导出文件名跟着变
+        with open(self.weights, 'wb') as f:
+            f.write(b'weights v2')
+        self.assertNotEqual(export_paths(self.weights)[0], onnx_path)
+
+    def test_preprocess_short_side_resize_and_center_crop(self):
+        image = Image.new('RGB', (300, 100), (255, 0, 0))
+        image.paste((0, 0, 255), (0, 0, 100, 100))  # 左边三分之一被裁掉
+        tensor = preprocess(image, 32)
+        self.assertEqual(tensor.shape, (3, 32, 32))
+        self.assertEqual(tensor.dtype, np.float32)
+        self.assertAlmostEqual(float(tensor[0, :, 4:].min()), 1.0, places=2)
+        self.assertAlmostEqual(float(tensor[2, :, 4:].max()), 0.0, places=2)
+
+    def test_results_feed_predict_class2_probabilities(self):
+        class Model:
+            def __call__(self, images, verbose=False):
+                return [ClassifyResult({0: 'class1', 1: 'class2'}, np.array([0.3, 0.7], dtype=np.float32))
+                        for _ in images]
+
+        probabilities = group3.predict_class2_probabilities(Model(), [Image.new('RGB', (8, 8))] * 2)
+        self.assertEqual(len(probabilities), 2)
+        self.assertAlmostEqual(probabilities[0], 0.7, places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
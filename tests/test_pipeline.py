@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the read -> classify -> hash pipeline
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import group3
+from onnx_classifier import ClassifyResult
+from pipeline import ImagePipeline
+
+
+class RedModel:
+    """class2概率 = 左上角像素的红色分量 / 255"""
+
+    def __call__(self, images, verbose=False):
+        if isinstance(images, Image.Image):
+            images = [images]
+        results = []
+        for image in images:
+            p = image.getpixel((0, 0))[0] / 255
+            results.append(ClassifyResult({0: 'class1', 1: 'class2'}, np.array([1 - p, p], dtype=np.float32)))
+        return results
+
+
+class TestImagePipeline(unittest.TestCase):
+    """Test output order, metrics and abort propagation"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.saved = {name: getattr(group3, name) for name in
+                      ('RESULT_CACHE_ENABLED', 'HASH_WORKERS', 'YOLO_BATCH_SIZE', 'PIPELINE_READERS')}
+        group3.RESULT_CACHE_ENABLED = False
+        group3.YOLO_BATCH_SIZE = 4
+        group3.PIPELINE_READERS = 3
+
+        # 偶数张是class2（红色分量255），奇数张不是；每张的噪点不同，哈希各不相同
+        rng = np.random.default_rng(0)
+        self.image_infos = []
+        for i in range(21):
+            pixels = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+            pixels[0, 0, 0] = 255 if i % 2 == 0 else 0
+            path = os.path.join(self.temp_dir.name, f'{i:02d}.png')
+            Image.fromarray(pixels).save(path)
+            self.image_infos.append({'path': path})
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(group3, name, value)
+        self.temp_dir.cleanup()
+
+    def _check_run(self):
+        pipeline = ImagePipeline(RedModel())
+        class2_images, hash_values = pipeline.run(self.image_infos)
+        expected = self.image_infos[::2]
+        self.assertEqual(class2_images, expected)
+        self.assertEqual(hash_values, [group3.calculate_image_hash(info) for info in expected])
+
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics['total'], 21)
+        self.assertEqual(metrics['decoded'], 21)
+        self.assertEqual(metrics['classified'], 21)
+        self.assertEqual(metrics['class2'], 11)
+        self.assertEqual(metrics['hashed'], 11)
+        self.assertEqual(metrics['hash_sources'], {'image': 11})
+        self.assertEqual(metrics['queues']['hash']['depth'], 0)
+
+    def test_order_and_metrics_with_process_pool(self):
+        group3.HASH_WORKERS = 3
+        self._check_run()
+
+    def test_order_and_metrics_with_threads(self):
+        group3.HASH_WORKERS = 1
+        self._check_run()
+
+    def test_abort_propagates(self):
+        group3.HASH_WORKERS = 2
+        threads_before = threading.active_count()
+
+        def on_progress(metrics):
+            raise RuntimeError('任务已取消')
+
+        pipeline = ImagePipeline(RedModel(), on_progress=on_progress)
+        with self.assertRaises(RuntimeError):
+            pipeline.run(self.image_infos)
+        # 读图线程和哈希分发线程都已退出，不会卡在满队列上
+        self.assertEqual(threading.active_count(), threads_before)
+        self.assertLess(pipeline.metrics()['classified'], 21)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for stage progress tracking and the SSE status stream
+"""
+
+import sys
+import os
+import json
+import unittest
+from unittest import mock
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from progress import StageProgress, status_events
+
+
+class FakeJob:
+    def __init__(self):
+        self.status = {'progress': 0, 'is_processing': True}
+        self.saves = 0
+
+    def save(self, force=False):
+        self.saves += 1
+
+
+class TestStageProgress(unittest.TestCase):
+    """Test progress mapping, throughput and ETA"""
+
+    def test_progress_mapped_into_band(self):
+        job = FakeJob()
+        meter = StageProgress(job, 'classify', 10, 20, 60)
+        self.assertEqual(job.status['progress'], 20)
+        meter.update(5)
+        self.assertEqual(job.status['progress'], 40)
+        self.assertEqual(job.status['stage_done'], 5)
+        meter.update(3)  # 进度不回退
+        self.assertEqual(job.status['stage_done'], 5)
+        meter.update(99)
+        self.assertEqual(job.status['progress'], 60)
+
+    def test_throughput_and_eta(self):
+        job = FakeJob()
+        with mock.patch('progress.time.monotonic', side_effect=[0.0, 2.0]):
+            meter = StageProgress(job, 'hash', 100, 60, 90)
+            meter.update(20)
+        self.assertEqual(job.status['throughput'], 10.0)
+        self.assertEqual(job.status['eta_seconds'], 8)
+
+
+class TestStatusEvents(unittest.TestCase):
+    """Test that the stream sends a full snapshot, then changes, then done"""
+
+    def test_events(self):
+        snapshots = iter([
+            {'progress': 10, 'current_step': 'a', 'is_processing': True},
+            {'progress': 10, 'current_step': 'a', 'is_processing': True},
+            {'progress': 30, 'current_step': 'a', 'is_processing': True},
+            {'progress': 100, 'current_step': 'done', 'is_processing': False},
+        ])
+        events = list(status_events(lambda: next(snapshots), lambda timeout: None,
+                                    min_interval=0, keepalive=60))
+
+        def parse(event):
+            lines = dict(line.split(': ', 1) for line in event.strip().split('\n'))
+            return lines['event'], json.loads(lines['data'])
+
+        self.assertEqual([parse(e)[0] for e in events], ['progress', 'progress', 'done'])
+        self.assertEqual(parse(events[0])[1]['current_step'], 'a')
+        self.assertEqual(parse(events[1])[1], {'progress': 30})
+        self.assertEqual(parse(events[2])[1]['progress'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for calibration sampling and the FP32/INT8 comparison report
+"""
+
+import sys
+import os
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import group3
+from onnx_classifier import ClassifyResult
+from quantization import check_mode, compare_models, quantized_path, sample_images
+
+
+class GrayModel:
+    """class2概率 = 图片灰度 / 255 + offset"""
+
+    def __init__(self, offset=0.0):
+        self.offset = offset
+
+    def __call__(self, images, verbose=False):
+        if isinstance(images, Image.Image):
+            images = [images]
+        results = []
+        for image in images:
+            p = min(1.0, image.getpixel((0, 0))[0] / 255 + self.offset)
+            results.append(ClassifyResult({0: 'class1', 1: 'class2'}, np.array([1 - p, p], dtype=np.float32)))
+        return results
+
+
+class TestQuantization(unittest.TestCase):
+    """Test sampling sources and the agreement/drift report"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_dir = os.path.join(self.temp_dir.name, 'images')
+        os.makedirs(self.image_dir)
+        for gray in (10, 100, 125, 135, 250):
+            Image.new('RGB', (16, 16), (gray, gray, gray)).save(os.path.join(self.image_dir, f'{gray}.png'))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_sample_images_from_directories_and_zips(self):
+        zip_path = os.path.join(self.image_dir, 'case.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            zf.write(os.path.join(self.image_dir, '10.png'), 'CASE1/a.png')
+            zf.writestr('CASE1/notes.txt', 'x')
+        image_infos = sample_images([self.image_dir])
+        self.assertEqual(len(image_infos), 6)
+        self.assertEqual(sum(1 for info in image_infos if 'zip_member' in info), 1)
+
+        sampled = sample_images([self.image_dir], samples=3, seed=0)
+        self.assertEqual(len(sampled), 3)
+        self.assertEqual(sampled, sample_images([self.image_dir], samples=3, seed=0))
+
+    def test_compare_report(self):
+        image_infos = sample_images([self.image_dir])
+        report = compare_models(GrayModel(), GrayModel(offset=0.03), image_infos, threshold=0.5, band=0.1)
+        self.assertEqual(report['images'], 5)
+        # 只有灰度125（0.49 -> 0.52）跨过阈值
+        self.assertEqual(report['agreement_rate'], 0.8)
+        self.assertEqual(report['flips'], {'class2_to_other': 0, 'other_to_class2': 1})
+        self.assertEqual(report['near_threshold']['images'], 2)
+        self.assertEqual(report['near_threshold']['agreement_rate'], 0.5)
+        self.assertAlmostEqual(report['drift']['mean'], 0.03 - (0.03 - (1 - 250 / 255)) / 5, places=3)  # 250封顶在1.0
+        self.assertEqual(len(report['worst']), 5)
+
+    def test_quantized_path(self):
+        self.assertEqual(quantized_path('/m/best.abc.onnx', 'static'), '/m/best.abc.int8-static.onnx')
+        with self.assertRaises(ValueError):
+            quantized_path('/m/best.abc.onnx', 'int4')
+
+    def test_backend_mode_combinations(self):
+        check_mode('onnxruntime', 'dynamic')
+        check_mode('onnxruntime', 'static')
+        check_mode('openvino', 'static')
+        for runtime, mode in (('openvino', 'dynamic'), ('torch', 'static'), ('onnxruntime', 'int4')):
+            with self.assertRaises(ValueError):
+                check_mode(runtime, mode)
+
+    def test_unsupported_combination_fails_model_load(self):
+        with mock.patch.object(group3, 'YOLO_BACKEND', 'openvino'), \
+                mock.patch.object(group3, 'YOLO_QUANTIZATION', 'dynamic'), \
+                mock.patch.object(group3, '_load_onnx_model') as load_onnx:
+            with self.assertRaisesRegex(ValueError, 'openvino.*dynamic'):
+                group3.load_yolo_model()
+            group3.prepare_model()  # serve.py主进程只记录错误
+            load_onnx.assert_not_called()
+
+        with mock.patch.object(group3, 'YOLO_BACKEND', 'openvino'), \
+                mock.patch.object(group3, 'YOLO_QUANTIZATION', ''):
+            group3.check_model_config()
+
+
+if __name__ == '__main__':
+    unittest.main()
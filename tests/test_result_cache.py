@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed classification/hash cache
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import group3
+import result_cache
+from result_cache import ResultCache, file_digest
+from onnx_classifier import ClassifyResult
+from pipeline import ImagePipeline
+
+
+class TestResultCache(unittest.TestCase):
+    """Test cache hits, keys and LRU eviction"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'cache.db')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_file_digest_is_content_based(self):
+        paths = []
+        for name in ('a.jpg', 'b.jpg'):
+            path = os.path.join(self.temp_dir.name, name)
+            with open(path, 'wb') as f:
+                f.write(b'same bytes')
+            paths.append(path)
+        self.assertEqual(file_digest(paths[0]), file_digest(paths[1]))
+
+    def test_model_and_hash_keys(self):
+        cache = ResultCache(self.db_path)
+        cache.put_class_probs('d1', 'model-a', [0.2, 0.8])
+        cache.put_hash('d1', 'phash8:full:image', 'ff00ff00ff00ff00')
+
+        self.assertEqual(cache.get_class_probs('d1', 'model-a'), [0.2, 0.8])
+        self.assertIsNone(cache.get_class_probs('d1', 'model-b'))
+        self.assertEqual(cache.get_hash('d1', 'phash8:full:image'), 'ff00ff00ff00ff00')
+        self.assertIsNone(cache.get_hash('d1', 'phash8:draft:image'))
+        self.assertIsNone(cache.get_hash('d2', 'phash8:full:image'))
+
+        stats = cache.stats()
+        self.assertEqual((stats['class_hits'], stats['class_misses']), (1, 1))
+        self.assertEqual((stats['hash_hits'], stats['hash_misses']), (1, 2))
+
+    def test_lru_eviction(self):
+        original_interval = result_cache.EVICTION_CHECK_INTERVAL
+        result_cache.EVICTION_CHECK_INTERVAL = 1
+        try:
+            cache = ResultCache(self.db_path, max_entries=10)
+            for k in range(10):
+                cache.put_hash(f'd{k}', 'key', f'{k:016x}')
+            # touch d0 so it is the most recently used
+            self.assertIsNotNone(cache.get_hash('d0', 'key'))
+            cache.put_hash('d10', 'key', 'a' * 16)
+
+            self.assertIsNotNone(cache.get_hash('d0', 'key'))
+            self.assertIsNone(cache.get_hash('d1', 'key'))
+            self.assertIsNotNone(cache.get_hash('d10', 'key'))
+            self.assertGreater(cache.stats()['evictions'], 0)
+        finally:
+            result_cache.EVICTION_CHECK_INTERVAL = original_interval
+
+
+
+class CachedModel:
+    """class2概率恒为0.9，带cache_key时分类结果会写入缓存"""
+
+    cache_key = 'model-test'
+
+    def __call__(self, images, verbose=False):
+        if isinstance(images, Image.Image):
+            images = [images]
+        return [ClassifyResult({0: 'class1', 1: 'class2'}, np.array([0.1, 0.9], dtype=np.float32)) for _ in images]
+
+
+class TestJobCacheCounts(unittest.TestCase):
+    """Per-job hit counts include hits inside hash pool worker processes"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.saved = {name: getattr(group3, name) for name in
+                      ('RESULT_CACHE_ENABLED', 'RESULT_CACHE_PATH', '_result_cache', 'HASH_WORKERS')}
+        group3.RESULT_CACHE_ENABLED = True
+        group3.RESULT_CACHE_PATH = os.path.join(self.temp_dir.name, 'cache.db')
+        group3._result_cache = None
+        group3.HASH_WORKERS = 2
+        self.image_infos = []
+        for k in range(6):
+            path = os.path.join(self.temp_dir.name, f'{k}.png')
+            Image.fromarray(np.random.default_rng(k).integers(0, 256, (16, 16, 3), dtype=np.uint8)).save(path)
+            self.image_infos.append({'path': path})
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(group3, name, value)
+        self.temp_dir.cleanup()
+
+    def test_hash_pool_hits_reported_by_source(self):
+        first, second = {}, {}
+        group3.calculate_image_hashes([dict(info) for info in self.image_infos], stats=first)
+        group3.calculate_image_hashes([dict(info) for info in self.image_infos], stats=second)
+        self.assertEqual(first.get('cache', 0), 0)
+        self.assertEqual(second['cache'], 6)
+        # 命中发生在子进程里，本进程的计数看不到
+        self.assertEqual(group3.get_result_cache().stats()['hash_hits'], 0)
+
+    def test_pipeline_counts(self):
+        ImagePipeline(CachedModel()).run([dict(info) for info in self.image_infos])
+        pipeline = ImagePipeline(CachedModel())
+        pipeline.run([dict(info) for info in self.image_infos])
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics['cached'], 6)
+        self.assertEqual(metrics['hash_sources'], {'cache': 6})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for result image materialization strategies
+"""
+
+import sys
+import os
+import io
+import zipfile
+import tempfile
+import unittest
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from result_store import ResultWriter, read_ref, download_entries
+from zip_stream import ZipStream
+
+
+class TestResultWriter(unittest.TestCase):
+    """Test that shared images are written once and resolve back to the same bytes"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.results_dir = os.path.join(self.temp_dir.name, 'results')
+        os.makedirs(self.results_dir)
+        zip_path = os.path.join(self.temp_dir.name, 'DQIHA__1.zip')
+        self.data = {'a.jpg': os.urandom(500), 'b.jpg': os.urandom(700)}
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            for name, data in self.data.items():
+                zf.writestr(name, data)
+        with zipfile.ZipFile(zip_path) as zf:
+            self.images = [{
+                'path': os.path.join(zip_path, info.filename),
+                'original_zip_path': zip_path,
+                'zip_member': info.filename,
+                'file_size': info.file_size,
+                'crc32': info.CRC
+            } for info in zf.infolist()]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, strategy):
+        writer = ResultWriter(self.results_dir, strategy)
+        # a.jpg在两个组里都出现
+        manifest = {'group_1': {'files': {}}, 'group_2': {'files': {}}}
+        for group_name, images in (('group_1', self.images), ('group_2', self.images[:1])):
+            for image_info in images:
+                filename = f"{group_name}_{image_info['zip_member']}"
+                manifest[group_name]['files'][filename] = writer.add(image_info, group_name, filename)
+        for group in manifest.values():
+            for filename, ref in group['files'].items():
+                self.assertEqual(read_ref(self.results_dir, ref), self.data[filename.split('_', 2)[2]])
+        return writer, manifest
+
+    def test_link_writes_shared_image_once(self):
+        writer, manifest = self._write('link')
+        self.assertEqual(writer.stats['written'], 2)
+        first = os.path.join(self.results_dir, manifest['group_1']['files']['group_1_a.jpg']['path'])
+        second = os.path.join(self.results_dir, manifest['group_2']['files']['group_2_a.jpg']['path'])
+        self.assertEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+
+    def test_blobs_are_content_addressed(self):
+        writer, manifest = self._write('blobs')
+        self.assertEqual(writer.stats['written'], 2)
+        self.assertEqual(manifest['group_1']['files']['group_1_a.jpg'], manifest['group_2']['files']['group_2_a.jpg'])
+
+    def test_manifest_only_download(self):
+        writer, manifest = self._write('manifest')
+        self.assertEqual(writer.stats['referenced'], 3)
+        self.assertEqual(os.listdir(self.results_dir), [])
+
+        stream = ZipStream(download_entries(self.results_dir, manifest))
+        data = b''.join(stream)
+        self.assertEqual(len(data), len(stream))
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read('group_2/group_2_a.jpg'), self.data['a.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
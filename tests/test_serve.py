@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for the prefork server: HUP generation swap and graceful drain of web processes
+"""
+
+import sys
+import os
+import time
+import signal
+import socket
+import threading
+import unittest
+import urllib.request
+from types import SimpleNamespace
+from unittest import mock
+
+# Add project root (serve.py) and src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# serve.py导入时会设置JOB_BACKEND等环境变量，不能影响其他测试
+with mock.patch.dict(os.environ):
+    import serve
+
+
+def wait_for_signal(*args):
+    """代替web/worker子进程的主循环：收到TERM后退出"""
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    stopped.wait(10)
+
+
+def slow_app(environ, start_response):
+    time.sleep(1)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'done']
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), '需要fork')
+class TestServe(unittest.TestCase):
+    """Test that HUP replaces the old generation and TERM lets in-flight requests finish"""
+
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.sock.set_inheritable(True)
+        self.port = self.sock.getsockname()[1]
+
+    def tearDown(self):
+        self.sock.close()
+
+    def test_hup_reload_replaces_old_generation(self):
+        app_module = SimpleNamespace(
+            group3=SimpleNamespace(YOLO_BACKEND='onnxruntime', prepare_model=mock.Mock()),
+            init_system=mock.Mock(), LicenseManager=mock.Mock()
+        )
+        with mock.patch.object(serve, 'run_web', wait_for_signal), \
+                mock.patch.object(serve, 'run_job_worker', wait_for_signal), \
+                mock.patch.object(serve, 'WEB_WORKERS', 2), mock.patch.object(serve, 'JOB_WORKERS', 1), \
+                mock.patch.object(serve, 'GRACEFUL_TIMEOUT', 5):
+            master = serve.Master(app_module, self.sock)
+            try:
+                master.load_model()
+                master.spawn_missing()
+                old = set(master.children)
+                self.assertEqual(sorted(kind for kind, _ in master.children.values()), ['job', 'web', 'web'])
+
+                master.reload()
+                self.assertEqual(app_module.LicenseManager.call_count, 1)
+                self.assertEqual(app_module.group3.prepare_model.call_count, 2)
+                new = {pid for pid, (_, generation) in master.children.items() if generation == 1}
+                self.assertEqual(len(new), 3)
+                self.assertTrue(new.isdisjoint(old))
+
+                # 旧的一批收到TERM后退出，不会被当成异常退出补上
+                deadline = time.monotonic() + 5
+                while set(master.children) != new and time.monotonic() < deadline:
+                    master.reap()
+                    master.spawn_missing()
+                    time.sleep(0.05)
+                self.assertEqual(set(master.children), new)
+            finally:
+                master.stop()
+            self.assertEqual(master.children, {})
+
+    def test_term_drains_in_flight_request(self):
+        with mock.patch.object(serve, 'GRACEFUL_TIMEOUT', 5):
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    serve.run_web(SimpleNamespace(app=slow_app), self.sock.fileno())
+                except Exception:
+                    code = 1
+                finally:
+                    os._exit(code)
+
+        responses = []
+
+        def request():
+            with urllib.request.urlopen(f'http://127.0.0.1:{self.port}/slow', timeout=10) as response:
+                responses.append(response.read())
+
+        client = threading.Thread(target=request)
+        client.start()
+        time.sleep(0.5)  # 请求已在处理中
+        os.kill(pid, signal.SIGTERM)
+        client.join(10)
+        _, status = os.waitpid(pid, 0)
+        # 请求处理完才退出，退出码正常
+        self.assertEqual(responses, [b'done'])
+        self.assertTrue(os.WIFEXITED(status))
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for reading images straight from ZIP members
+"""
+
+import sys
+import os
+import io
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from PIL import Image
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import group3
+from group3 import extract_zip_files, calculate_image_hash, image_digest
+import zip_source
+from zip_source import materialize, read_image_bytes, detect_name_encoding
+
+
+class TestZipSource(unittest.TestCase):
+    """Stream mode must see the same images as disk mode"""
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.out_dir = tempfile.mkdtemp()
+        self.temp_dirs = []
+        self._cache_enabled = group3.RESULT_CACHE_ENABLED
+        group3.RESULT_CACHE_ENABLED = False
+
+        buf = io.BytesIO()
+        Image.new('RGB', (64, 48), (200, 30, 30)).save(buf, 'JPEG')
+        self.jpeg = buf.getvalue()
+        with zipfile.ZipFile(os.path.join(self.upload_dir, 'DQIHA001__20250101.zip'), 'w') as zf:
+            zf.writestr('photos/car.jpg', self.jpeg)
+            zf.writestr('photos/report.pdf', b'%PDF-1.4')
+            zf.writestr('empty/', b'')
+
+    def tearDown(self):
+        group3.RESULT_CACHE_ENABLED = self._cache_enabled
+        for path in [self.upload_dir, self.out_dir] + self.temp_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def test_stream_matches_disk(self):
+        streamed, temp_dirs = extract_zip_files(self.upload_dir, mode='stream')
+        self.assertEqual(temp_dirs, [])
+        extracted, self.temp_dirs = extract_zip_files(self.upload_dir, mode='disk')
+
+        self.assertEqual([i['relative_path'] for i in streamed], [i['relative_path'] for i in extracted])
+        self.assertEqual(streamed[0]['crc32'], extracted[0]['crc32'])
+        self.assertEqual(image_digest(streamed[0]), image_digest(extracted[0]))
+        self.assertEqual(calculate_image_hash(streamed[0]), calculate_image_hash(extracted[0]))
+        self.assertEqual(read_image_bytes(streamed[0]), self.jpeg)
+
+    def test_disk_mode_writes_only_images(self):
+        extracted, self.temp_dirs = extract_zip_files(self.upload_dir, mode='disk')
+        written = [name for temp_dir in self.temp_dirs for _, _, files in os.walk(temp_dir) for name in files]
+        self.assertEqual(written, ['car.jpg'])
+        self.assertEqual(len(extracted), 1)
+
+    def test_parallel_archives_keep_order(self):
+        for k in range(4):
+            with zipfile.ZipFile(os.path.join(self.upload_dir, f'DQIHB00{k}__20250101.zip'), 'w') as zf:
+                zf.writestr(f'{k}.jpg', self.jpeg)
+        serial, _ = extract_zip_files(self.upload_dir, mode='stream', workers=1)
+        parallel, _ = extract_zip_files(self.upload_dir, mode='stream', workers=4)
+        self.assertEqual(len(serial), 5)
+        self.assertEqual([i['path'] for i in serial], [i['path'] for i in parallel])
+
+    def test_materialize_member(self):
+        streamed, _ = extract_zip_files(self.upload_dir, mode='stream')
+        dest_path = os.path.join(self.out_dir, 'car.jpg')
+        materialize(streamed[0], dest_path)
+        with open(dest_path, 'rb') as f:
+            self.assertEqual(f.read(), self.jpeg)
+
+    def test_hash_pool_after_reads_in_parent(self):
+        # 父进程先读过这个ZIP（摘要），fork出的哈希进程不能沿用父进程的ZipFile
+        with zipfile.ZipFile(os.path.join(self.upload_dir, 'DQIHC001__20250101.zip'), 'w', zipfile.ZIP_DEFLATED) as zf:
+            for k in range(60):
+                buf = io.BytesIO()
+                Image.effect_noise((64, 64), 20 + k).convert('RGB').save(buf, 'PNG')
+                zf.writestr(f'{k}.png', buf.getvalue())
+        streamed, _ = extract_zip_files(self.upload_dir, mode='stream')
+        for image_info in streamed:
+            image_digest(image_info)
+        serial = group3.calculate_image_hashes(streamed, workers=1)
+        parallel = group3.calculate_image_hashes(streamed, workers=4)
+        self.assertNotIn(None, parallel)
+        self.assertEqual([str(h) for h in serial], [str(h) for h in parallel])
+
+    def test_close_archives(self):
+        streamed, _ = extract_zip_files(self.upload_dir, mode='stream')
+        archive = zip_source._archive(streamed[0]['original_zip_path'])
+        zip_source.close_archives()
+        self.assertIsNone(archive.fp)
+        # 之后再读会重新打开
+        self.assertEqual(read_image_bytes(streamed[0]), self.jpeg)
+        zip_source.close_archives()
+
+
+class LegacyZipInfo(zipfile.ZipInfo):
+    """Write the name as raw cp437-mapped bytes without the UTF-8 flag, like old Windows archivers"""
+
+    def _encodeFilenameFlags(self):
+        return self.filename.encode('cp437'), self.flag_bits
+
+
+class TestNameEncoding(unittest.TestCase):
+    """Test per-archive filename encoding detection"""
+
+    def test_detect_name_encoding(self):
+        self.assertEqual(detect_name_encoding([b'a/1.jpg', b'b.png']), 'utf-8')
+        self.assertEqual(detect_name_encoding(['照片/车辆.jpg'.encode('utf-8')]), 'utf-8')
+        self.assertEqual(detect_name_encoding(['照片/车辆.jpg'.encode('gbk'), b'x.jpg']), 'gb18030')
+        self.assertEqual(detect_name_encoding([b'\x81\x30']), 'cp437')
+
+    def test_gbk_names_without_utf8_flag(self):
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, True)
+        with zipfile.ZipFile(os.path.join(upload_dir, 'DQIHA001__20250101.zip'), 'w') as zf:
+            for name in ('现场照片/车辆正面.jpg', '现场照片/说明.txt'):
+                zf.writestr(LegacyZipInfo(name.encode('gbk').decode('cp437')), b'data')
+            zf.writestr('utf8名.jpg', b'data2')  # 带UTF-8标志
+
+        for mode in ('stream', 'disk'):
+            image_infos, temp_dirs = extract_zip_files(upload_dir, mode=mode)
+            for temp_dir in temp_dirs:
+                self.addCleanup(shutil.rmtree, temp_dir, True)
+            self.assertEqual(sorted(i['relative_path'] for i in image_infos),
+                             sorted([os.path.join('现场照片', '车辆正面.jpg'), 'utf8名.jpg']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming ZIP writer used by result downloads
+"""
+
+import sys
+import os
+import io
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import zip_stream
+from zip_stream import ZipStream, directory_entries
+
+
+class TestZipStream(unittest.TestCase):
+    """Test that the streamed archive is valid and its length is known up front"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        os.makedirs(os.path.join(self.root, 'group_1'))
+        self.files = {
+            'group_1/案件A_g1_1_0.jpg': os.urandom(3000),
+            'group_1/b.png': os.urandom(10),
+            'group_1/c.bmp': b'BM' + bytes(range(256)) * 40,
+            'group_1/d.TIF': b'II*\x00' + b'\x00' * 5000,
+            'groups.json': b'{"1": []}' * 50,
+            'status.json': b'{}',
+        }
+        for arcname, data in self.files.items():
+            with open(os.path.join(self.root, arcname), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _check(self, stream):
+        data = b''.join(stream)
+        self.assertEqual(len(data), len(stream))
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            names = zf.namelist()
+            for name in names:
+                self.assertEqual(zf.read(name), self.files[name])
+            return {info.filename: info.compress_type for info in zf.infolist()}
+
+    def test_stream_matches_files(self):
+        stream = ZipStream(directory_entries(self.root, exclude={'status.json'}))
+        methods = self._check(stream)
+        self.assertNotIn('status.json', methods)
+        self.assertEqual(methods['group_1/案件A_g1_1_0.jpg'], zipfile.ZIP_STORED)
+        self.assertEqual(methods['groups.json'], zipfile.ZIP_DEFLATED)
+        # 图片都原样存储，输出时才读取，第一个字节不用等压缩
+        for name in ('group_1/b.png', 'group_1/c.bmp', 'group_1/d.TIF'):
+            self.assertEqual(methods[name], zipfile.ZIP_STORED)
+
+    def test_large_files_stored(self):
+        with mock.patch.object(zip_stream, 'DEFLATE_MAX_SIZE', 100):
+            entries = directory_entries(self.root)
+            self.assertTrue(all(entry.data is None for entry in entries if entry.size > 100))
+            methods = self._check(ZipStream(entries))
+            self.assertEqual(methods['groups.json'], zipfile.ZIP_STORED)
+
+    def test_zip64_records(self):
+        with mock.patch.object(zip_stream, 'ZIP64_LIMIT', 2000), \
+                mock.patch.object(zip_stream, 'ZIP64_COUNT_LIMIT', 2):
+            stream = ZipStream(directory_entries(self.root))
+            self.assertTrue(stream.zip64)
+            self._check(stream)
+
+    def test_modified_file_aborts(self):
+        stream = ZipStream(directory_entries(self.root))
+        with open(os.path.join(self.root, 'group_1', 'b.png'), 'wb') as f:
+            f.write(b'x')
+        with self.assertRaises(IOError):
+            b''.join(stream)
+
+
+if __name__ == '__main__':
+    unittest.main()
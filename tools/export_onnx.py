@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+把YOLO分类权重导出为ONNX（YOLO_BACKEND=onnxruntime/openvino 时使用）
+导出文件放在权重旁边，文件名带权重校验和；在装有ultralytics的机器上导出一次，
+连同权重一起拷到只装了 requirements-cpu.txt 的服务器上即可
+用法: python tools/export_onnx.py [权重路径，默认 YOLO_MODEL_PATH]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import group3
+from onnx_classifier import export_onnx, export_paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    weights_path = sys.argv[1] if len(sys.argv) == 2 else group3.YOLO_MODEL_PATH
+    if not os.path.exists(weights_path):
+        print(f"❌ 权重文件不存在: {weights_path}")
+        sys.exit(1)
+    onnx_path = export_onnx(weights_path)
+    print(f"✅ ONNX模型: {onnx_path}")
+    print(f"   元数据: {export_paths(weights_path)[1]}")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+INT8量化分类模型，并与FP32模型对比（YOLO_BACKEND=onnxruntime/openvino + YOLO_QUANTIZATION 时使用）
+用法:
+  python tools/quantize_model.py quantize [--mode static|dynamic] [--samples N] [图片来源 ...]
+  python tools/quantize_model.py compare  [--mode static|dynamic] [--samples N] [--json 报告路径] [图片来源 ...]
+
+图片来源可以是目录（递归，含其中的ZIP）、ZIP或图片，默认为上传目录（INPUT_DIR，保留着最近任务的ZIP）
+compare默认用另一个随机种子抽样，尽量不拿校准用过的图片评估；报告里的agreement_rate、near_threshold
+（阈值附近的判定一致率和概率漂移）和 images_per_second 是决定能否切换到INT8的依据
+"""
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import group3
+from onnx_classifier import OnnxClassifier, export_onnx
+from quantization import (MODES, CALIBRATION_SAMPLES, check_mode, compare_models, quantize_model, quantized_path,
+                          sample_images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8量化分类模型并与FP32对比')
+    parser.add_argument('command', choices=('quantize', 'compare'))
+    parser.add_argument('sources', nargs='*', help='图片来源，默认为上传目录')
+    parser.add_argument('--mode', choices=MODES, default=group3.YOLO_QUANTIZATION or 'static')
+    parser.add_argument('--samples', type=int, default=CALIBRATION_SAMPLES, help='抽样图片数')
+    parser.add_argument('--seed', type=int, help='抽样随机种子（quantize默认0，compare默认1）')
+    parser.add_argument('--runtime', default=group3.YOLO_BACKEND if group3.YOLO_BACKEND != 'torch' else 'onnxruntime')
+    parser.add_argument('--json', help='对比报告另存为JSON')
+    args = parser.parse_args()
+
+    if not os.path.exists(group3.YOLO_MODEL_PATH):
+        print(f"❌ 权重文件不存在: {group3.YOLO_MODEL_PATH}")
+        sys.exit(1)
+    onnx_path = export_onnx(group3.YOLO_MODEL_PATH)
+    sources = args.sources or [group3.INPUT_DIR]
+    seed = args.seed if args.seed is not None else (0 if args.command == 'quantize' else 1)
+
+    if args.command == 'quantize':
+        image_infos = sample_images(sources, args.samples, seed) if args.mode == 'static' else None
+        if args.mode == 'static' and not image_infos:
+            print(f"❌ 没有找到校准图片: {', '.join(sources)}")
+            sys.exit(1)
+        print(f"✅ 量化模型: {quantize_model(onnx_path, args.mode, image_infos)}")
+        return
+
+    try:
+        check_mode(args.runtime, args.mode)
+    except ValueError as e:
+        print(f"❌ {str(e)}")
+        sys.exit(1)
+    int8_path = quantized_path(onnx_path, args.mode)
+    if not os.path.exists(int8_path):
+        print(f"❌ 量化模型不存在: {int8_path}，先运行 quantize")
+        sys.exit(1)
+    image_infos = sample_images(sources, args.samples, seed)
+    if not image_infos:
+        print(f"❌ 没有找到图片: {', '.join(sources)}")
+        sys.exit(1)
+    threads = (group3.YOLO_INTRA_OP_THREADS, group3.YOLO_INTER_OP_THREADS)
+    report = compare_models(OnnxClassifier(onnx_path, args.runtime, *threads),
+                            OnnxClassifier(int8_path, args.runtime, *threads), image_infos)
+    report.update({'reference': os.path.basename(onnx_path), 'candidate': os.path.basename(int8_path),
+                   'runtime': args.runtime})
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
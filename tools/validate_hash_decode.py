@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+校验JPEG缩放解码（draft）与完整解码计算的pHash差异
+用法: python tools/validate_hash_decode.py <图片目录>
+"""
+
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import group3
+
+
+def validate_directory(image_dir):
+    """对目录下所有图片比较两种解码方式的哈希"""
+    image_infos = []
+    for root, _, files in os.walk(image_dir):
+        for file in files:
+            if file.lower().endswith(group3.SUPPORTED_FORMATS):
+                image_infos.append({'path': os.path.join(root, file)})
+
+    if not image_infos:
+        print(f"❌ 目录中没有图片: {image_dir}")
+        return None
+
+    hash_pairs = group3._map_images(group3._calculate_hash_pair, image_infos, group3.HASH_WORKERS)
+    report = group3.summarize_decode_validation(hash_pairs)
+    report['total'] = len(image_infos)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    validate_directory(sys.argv[1])
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Yak Similarity Analyzer - 任务worker
+JOB_BACKEND=queue 时web进程只负责接收上传和入队，由本进程领取并执行任务
+可以启动多个worker；worker崩溃或被杀后，任务在心跳超时后由其他worker重新执行
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+import logging
+
+# 添加src目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.insert(0, src_dir)
+
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))  # 没有任务时的轮询间隔（秒）
+
+logger = logging.getLogger('worker')
+
+
+def run_job(app, row, worker_id, reserved=False):
+    """执行领取到的任务；任务重新执行时从头开始统计进度
+
+    reserved: 名额已由work占好
+    """
+    from jobs import new_status
+    from job_queue import DurableArchiveQueue, Heartbeat
+
+    job_id = row['job_id']
+    job = app.job_manager.load(job_id)
+    if job is None:
+        if reserved:
+            app.job_manager.release_slot()
+        app.job_queue.finish(job_id, worker_id, '任务目录不存在')
+        return
+
+    job.status = dict(new_status(job_id), start_time=job.status.get('start_time'))
+    archive_queue = DurableArchiveQueue(app.job_queue, job_id, status=job.status) if row['chunked'] else None
+    logger.info(f"开始执行任务 {job_id}（第 {row['attempts']} 次）")
+    with Heartbeat(app.job_queue, job_id, worker_id, app.JOB_HEARTBEAT_INTERVAL):
+        try:
+            app.job_manager.run(job, app.process_images, archive_queue, reserved=reserved)
+        except Exception as e:
+            job.status['error'] = str(e)
+            logger.error(f"任务 {job_id} 执行失败: {str(e)}")
+    app.job_queue.finish(job_id, worker_id, job.status.get('error'))
+
+
+def work(app, worker_id, stop=None):
+    """领取并执行任务，直到stop被设置（执行中的任务都结束才退出）
+
+    有空闲名额（MAX_CONCURRENT_JOBS）才领取；分块上传的任务等待下一个ZIP时让出名额，
+    不会占着worker让排在后面的任务干等
+    模型已预热时登记为就绪worker，web进程的 /readyz 据此判断
+    """
+    logger.info(f"worker {worker_id} 已启动，队列: {app.JOB_QUEUE_PATH}")
+    ready = app.model_ready()
+    if not ready:
+        logger.warning(f"worker {worker_id} 模型未就绪（{app.processing_status.get('error')}），不登记为就绪worker")
+    last_ready = 0
+    running = []
+    try:
+        while stop is None or not stop.is_set():
+            if ready and time.monotonic() - last_ready >= app.JOB_HEARTBEAT_INTERVAL:
+                app.job_queue.worker_ready(worker_id)
+                last_ready = time.monotonic()
+            app.job_queue.requeue_stale(app.JOB_HEARTBEAT_TIMEOUT)
+            running = [thread for thread in running if thread.is_alive()]
+            if not app.job_manager.acquire_slot(timeout=POLL_INTERVAL):
+                continue  # 名额都在用（已经等了一个轮询间隔）
+            row = app.job_queue.claim(worker_id)
+            if row is None:
+                app.job_manager.release_slot()
+                if stop is None:
+                    time.sleep(POLL_INTERVAL)
+                else:
+                    stop.wait(POLL_INTERVAL)
+                continue
+            thread = threading.Thread(target=run_job, args=(app, row, worker_id, True),
+                                      name=f"job-{row['job_id'][:8]}", daemon=True)
+            thread.start()
+            running.append(thread)
+    finally:
+        for thread in running:
+            thread.join()
+        app.job_queue.worker_gone(worker_id)
+    logger.info(f"worker {worker_id} 已停止")
+
+
+def main():
+    import app
+
+    if app.job_queue is None:
+        print("JOB_BACKEND 不是 queue，任务在web进程内执行，不需要启动worker")
+        sys.exit(1)
+
+    app.init_system(load_model=True, wait=True)
+    try:
+        work(app, f"{socket.gethostname()}:{os.getpid()}")
+    except KeyboardInterrupt:
+        logger.info("worker已停止")
+
+
+if __name__ == "__main__":
+    main()